@@ -0,0 +1,42 @@
+from datetime import date
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.services import correlation
+
+router = APIRouter()
+
+
+# --------------------------------------------------------------------------- #
+# GET /analytics/correlation  — связь пунктов анкеты с результатом заказа
+# --------------------------------------------------------------------------- #
+@router.get("/correlation")
+async def score_outcome_correlation(
+    metric: Literal["approved", "redeemed", "avg_check"] = "approved",
+    group_by: Literal["overall", "operator", "team"] = "overall",
+    date_from: date | None = None,
+    date_to: date | None = None,
+    min_calls: int = Query(30, ge=0, description="Не показывать группы с меньшим числом звонков"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    По каждому вопросу анкеты: значение метрики у звонков, где пункт выполнен
+    и где не выполнен, 95% интервалы, lift и diff — в целом, по операторам или командам.
+    Учитываются звонки с анкетой и outcome. Кэшируется до прихода новых outcomes.
+    """
+    key = f"correlation:{metric}:{group_by}:{date_from}:{date_to}:{min_calls}"
+    version, result = await correlation.cached(key)
+    if result is not None:
+        return result
+
+    matrix = await correlation.load_matrix(db, date_from, date_to)
+    # NumPy считает в пуле потоков — event loop API не блокируется
+    result = await run_in_threadpool(correlation.compute_correlation, matrix, metric, group_by, min_calls)
+    result.update({"date_from": date_from, "date_to": date_to, "outcomes_version": version})
+    await correlation.store(version, key, jsonable_encoder(result))
+    return result
@@ -1,15 +1,32 @@
+import base64
+import hashlib
+import json
 import shutil
 import tempfile
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from pathlib import Path
+from typing import Literal
 
-from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, UploadFile
-from pydantic import BaseModel
-from sqlalchemy import select
+from celery import group
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, ValidationError, create_model
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
-from app.core.database import get_db
-from app.models.models import Call, QuestionnaireResponse
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db
+from app.core.redis import get_redis
+from app.models.models import QUESTION_FIELDS, SECTIONS, Call, Outcome, QuestionnaireResponse
+from app.services import results_cache
+from app.services.notifications import CALL_EVENTS_CHANNEL, call_event
+from app.services.operator_stats import answers_of, apply_questionnaire_changes
 
 router = APIRouter()
 
@@ -21,6 +38,8 @@ class CallCreate(BaseModel):
     duration_sec: int | None = None
     audio_url: str
     language: str = "ka"   # ISO-639-1, default грузинский
+    priority: Literal["normal", "batch"] = "normal"   # batch — анализ через OpenAI Batch API
+    callback_url: str | None = None   # POST события done/error (см. app/services/notifications.py)
 
 
 # --------------------------------------------------------------------------- #
@@ -28,15 +47,357 @@ class CallCreate(BaseModel):
 # --------------------------------------------------------------------------- #
 @router.post("/", status_code=202)
 async def create_call(data: CallCreate, db: AsyncSession = Depends(get_db)):
-    call = Call(**data.model_dump())
-    db.add(call)
+    """
+    Всегда создаёт звонок и ставит его в обработку: повтор того же
+    (order_id, audio_url) — переобработка записи. Дедупликацию по этой паре
+    делает только POST /calls/bulk; повтору здесь audio_url_md5 не
+    присваивается (уникальный индекс, см. миграцию 013).
+    """
+    row = _call_row(data)
+    call_id = await db.scalar(_insert_calls_stmt().returning(Call.id), row)
+    if call_id is None:
+        call_id = await db.scalar(insert(Call).returning(Call.id), {**row, "audio_url_md5": None})
     await db.commit()
-    await db.refresh(call)
 
     from app.tasks import process_call
-    process_call.delay(call.id, data.audio_url, data.language)
+    process_call.delay(call_id, data.audio_url, data.language)
+
+    return {"call_id": call_id, "status": "queued", "language": data.language}
+
+
+def _url_md5(url: str) -> str:
+    """Совпадает с md5(audio_url) в Postgres (UTF-8)."""
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+def _call_row(data: CallCreate) -> dict:
+    return {**data.model_dump(), "audio_url_md5": _url_md5(data.audio_url)}
+
+
+def _insert_calls_stmt():
+    """INSERT звонков; дубликат по (order_id, audio_url) пропускается (ux_calls_order_id_audio_url_md5)."""
+    return insert(Call).on_conflict_do_nothing(index_elements=[Call.order_id, Call.audio_url_md5])
+
+
+# --------------------------------------------------------------------------- #
+# POST /calls/bulk  — пачка звонков (ночная синхронизация из CRM)
+# --------------------------------------------------------------------------- #
+async def _read_bulk_items(request: Request) -> list:
+    """JSON-массив или NDJSON (по строке на звонок). Битая строка NDJSON → ошибка этого элемента."""
+    if "ndjson" not in request.headers.get("content-type", ""):
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        return items
+
+    items, buffer = [], b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        items.extend(_parse_ndjson_line(line) for line in lines if line.strip())
+        if len(items) > settings.calls_bulk_max_items:
+            break
+    if buffer.strip():
+        items.append(_parse_ndjson_line(buffer))
+    return items
+
+
+async def _existing_calls(db: AsyncSession, keys: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+    """(order_id, audio_url) → id для уже принятых звонков (поиск по md5 URL, индекс ux_calls_order_id_audio_url_md5)."""
+    existing = {}
+    for start in range(0, len(keys), settings.calls_bulk_insert_chunk):
+        hashed = [(order_id, _url_md5(url)) for order_id, url in keys[start:start + settings.calls_bulk_insert_chunk]]
+        rows = await db.execute(
+            select(Call.order_id, Call.audio_url, Call.id)
+            .where(tuple_(Call.order_id, Call.audio_url_md5).in_(hashed))
+        )
+        existing.update({(r.order_id, r.audio_url): r.id for r in rows})
+    return existing
+
+
+def _parse_ndjson_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+
+@router.post("/bulk", status_code=202)
+async def create_calls_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Принимает до settings.calls_bulk_max_items звонков (JSON-массив или
+    application/x-ndjson) в формате POST /calls/.
+
+    Вставка multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING пачками по
+    calls_bulk_insert_chunk, задачи ставятся в очередь Celery group. Дубликаты по
+    (order_id, audio_url) — в запросе и в БД — не создаются повторно: возвращается
+    id существующего звонка. Уникальный индекс по (order_id, md5(audio_url)) держит
+    это и для параллельных запросов с одинаковыми строками — звонок получает в
+    очередь только один из них. В отличие от POST /calls/, который повтор
+    принимает как переобработку.
+    В results по элементу на каждый входной объект, в том же порядке.
+    """
+    items = await _read_bulk_items(request)
+    if len(items) > settings.calls_bulk_max_items:
+        raise HTTPException(status_code=413, detail=f"Too many calls, max {settings.calls_bulk_max_items}")
+
+    results: list[dict] = [{} for _ in items]
+    valid: dict[tuple[str, str], tuple[int, CallCreate]] = {}
+    for index, item in enumerate(items):
+        if isinstance(item, Exception):
+            results[index] = {"index": index, "status": "error", "error": str(item)}
+            continue
+        try:
+            data = CallCreate.model_validate(item)
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "error", "error": e.errors(include_url=False, include_context=False)}
+            continue
+        key = (data.order_id, data.audio_url)
+        if key in valid:
+            results[index] = {"index": index, "status": "duplicate", "duplicate_of_index": valid[key][0]}
+            continue
+        valid[key] = (index, data)
+
+    # Уже существующие звонки — без попытки INSERT
+    existing = await _existing_calls(db, list(valid))
+    pending = [(index, data) for key, (index, data) in valid.items() if key not in existing]
+
+    # insertmanyvalues: multi-row INSERT ... RETURNING. Строки, которые параллельный
+    # запрос успел вставить между проверкой и INSERT, пропускаются ON CONFLICT
+    # и не возвращаются — сопоставляем по ключу.
+    inserted: dict[tuple[str, str], int] = {}
+    for start in range(0, len(pending), settings.calls_bulk_insert_chunk):
+        chunk = pending[start:start + settings.calls_bulk_insert_chunk]
+        rows = await db.execute(
+            _insert_calls_stmt().returning(Call.id, Call.order_id, Call.audio_url),
+            [_call_row(data) for _, data in chunk],
+        )
+        inserted.update({(r.order_id, r.audio_url): r.id for r in rows})
+    await db.commit()
+    existing.update(await _existing_calls(db, [(d.order_id, d.audio_url) for _, d in pending
+                                               if (d.order_id, d.audio_url) not in inserted]))
+
+    new = []
+    for key, (index, data) in valid.items():
+        if key in inserted:
+            results[index] = {"index": index, "call_id": inserted[key], "status": "queued"}
+            new.append((index, data))
+        else:
+            results[index] = {"index": index, "call_id": existing[key], "status": "duplicate"}
+
+    # Ставим в очередь только после commit — иначе воркер может не увидеть строку
+    from app.tasks import process_call
+    for start in range(0, len(new), settings.calls_bulk_insert_chunk):
+        signatures = group(
+            process_call.s(results[index]["call_id"], data.audio_url, data.language)
+            for index, data in new[start:start + settings.calls_bulk_insert_chunk]
+        )
+        await run_in_threadpool(signatures.apply_async)
+
+    statuses = Counter(r["status"] for r in results)
+    return {
+        "total": len(results),
+        "queued": statuses["queued"],
+        "duplicates": statuses["duplicate"],
+        "errors": statuses["error"],
+        "results": results,
+    }
+
+
+# --------------------------------------------------------------------------- #
+# GET /calls/  — список звонков с фильтрами (keyset-пагинация)
+# --------------------------------------------------------------------------- #
+# Поля, доступные в ?fields=, → колонка. Транскрипты только по явному запросу.
+LIST_FIELDS = {
+    "call_id": Call.id,
+    "order_id": Call.order_id,
+    "operator_id": Call.operator_id,
+    "call_date": Call.call_date,
+    "duration_sec": Call.duration_sec,
+    "language": Call.language,
+    "priority": Call.priority,
+    "status": Call.processing_status,
+    "stage": Call.processing_stage,
+    "error": Call.processing_error,
+    "audio_url": Call.audio_url,
+    "created_at": Call.created_at,
+    "transcript": Call.transcript_text,
+    "translated_text": Call.translated_text,
+    "total_score": QuestionnaireResponse.total_score,
+    **{f"s{n}_score": getattr(QuestionnaireResponse, f"s{n}_score") for n in SECTIONS},
+    **{q: getattr(QuestionnaireResponse, q) for q in QUESTION_FIELDS},
+    "filled_by_ai": QuestionnaireResponse.filled_by_ai,
+    "corrected_by_human": QuestionnaireResponse.corrected_by_human,
+    "approved": Outcome.approved,
+    "redeemed": Outcome.redeemed,
+    "avg_check": Outcome.avg_check,
+}
+DEFAULT_LIST_FIELDS = (
+    "call_id", "order_id", "operator_id", "call_date", "duration_sec", "language", "status", "total_score",
+)
+MAX_LIST_LIMIT = 1000
+
+
+def _encode_cursor(call_date: datetime, call_id: int) -> str:
+    raw = json.dumps([call_date.isoformat(), call_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        call_date, call_id = json.loads(raw)
+        return datetime.fromisoformat(call_date), int(call_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/")
+async def list_calls(
+    operator_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    status: str | None = None,
+    language: str | None = None,
+    min_score: int | None = None,
+    max_score: int | None = None,
+    approved: bool | None = None,
+    redeemed: bool | None = None,
+    fields: str | None = Query(None, description="Через запятую; по умолчанию без транскриптов"),
+    limit: int = Query(100, ge=1, le=MAX_LIST_LIMIT),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Звонки от новых к старым по (call_date, id). Следующая страница —
+    ?cursor=<next_cursor> с теми же фильтрами; next_cursor=null — страниц больше нет.
+    date_from включительно, date_to — не включительно.
+    """
+    selected = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(DEFAULT_LIST_FIELDS)
+    unknown = [f for f in selected if f not in LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    columns = [LIST_FIELDS[f].label(f) for f in selected]
+    tables = {LIST_FIELDS[f].class_ for f in selected}
+    stmt = select(*columns, Call.call_date.label("_cursor_date"), Call.id.label("_cursor_id"))
+
+    if operator_id is not None:
+        stmt = stmt.where(Call.operator_id == operator_id)
+    if date_from is not None:
+        stmt = stmt.where(Call.call_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Call.call_date < date_to)
+    if status is not None:
+        stmt = stmt.where(Call.processing_status == status)
+    if language is not None:
+        stmt = stmt.where(Call.language == language)
+    if min_score is not None:
+        stmt = stmt.where(QuestionnaireResponse.total_score >= min_score)
+        tables.add(QuestionnaireResponse)
+    if max_score is not None:
+        stmt = stmt.where(QuestionnaireResponse.total_score <= max_score)
+        tables.add(QuestionnaireResponse)
+    if approved is not None:
+        stmt = stmt.where(Outcome.approved.is_(approved))
+        tables.add(Outcome)
+    if redeemed is not None:
+        stmt = stmt.where(Outcome.redeemed.is_(redeemed))
+        tables.add(Outcome)
+    if cursor is not None:
+        stmt = stmt.where(tuple_(Call.call_date, Call.id) < _decode_cursor(cursor))
+
+    # JOIN только с теми таблицами, что нужны для полей и фильтров
+    stmt = stmt.select_from(Call)
+    if QuestionnaireResponse in tables:
+        stmt = stmt.outerjoin(QuestionnaireResponse, QuestionnaireResponse.call_id == Call.id)
+    if Outcome in tables:
+        stmt = stmt.outerjoin(Outcome, Outcome.order_id == Call.order_id)
+
+    rows = (await db.execute(
+        stmt.order_by(Call.call_date.desc(), Call.id.desc()).limit(limit + 1)
+    )).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]._cursor_date, rows[-1]._cursor_id)
 
-    return {"call_id": call.id, "status": "queued", "language": data.language}
+    return {
+        "items": [{f: getattr(row, f) for f in selected} for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+# --------------------------------------------------------------------------- #
+# GET /calls/events  — Server-Sent Events о завершении обработки
+# --------------------------------------------------------------------------- #
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.get("/events")
+async def call_events(
+    request: Request,
+    call_id: list[int] | None = Query(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Поток событий call.done / call.error (Redis pub/sub, см. app/services/notifications.py).
+
+    ?call_id=1&call_id=2 — только эти звонки: уже завершённые отдаются сразу,
+    поток закрывается, когда по каждому пришло событие.
+    Без call_id — все события, поток бесконечный. Раз в SSE_HEARTBEAT_SECONDS — комментарий-пинг.
+    """
+    pubsub = get_redis().pubsub()
+    # Подписка до чтения БД — событие между SELECT и подпиской не потеряется
+    await pubsub.subscribe(CALL_EVENTS_CHANNEL)
+
+    pending = set(call_id or ())
+    initial = []
+    if pending:
+        rows = await db.execute(
+            select(Call, QuestionnaireResponse.total_score)
+            .outerjoin(QuestionnaireResponse, QuestionnaireResponse.call_id == Call.id)
+            .where(Call.id.in_(pending), Call.processing_status.in_(("done", "error")))
+            .options(load_only(Call.id, Call.order_id, Call.processing_status, Call.processing_error))
+        )
+        for call, total_score in rows:
+            initial.append(call_event(call, total_score))
+            pending.discard(call.id)
+
+    async def stream():
+        try:
+            for event in initial:
+                yield _sse(event)
+            while not (call_id and not pending):
+                if await request.is_disconnected():
+                    break
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ": ping\n\n"
+                    continue
+                event = json.loads(message["data"])
+                if call_id:
+                    if event["call_id"] not in pending:
+                        continue
+                    pending.discard(event["call_id"])
+                yield _sse(event)
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # --------------------------------------------------------------------------- #
@@ -60,6 +421,8 @@ async def upload_call(
     call_date: datetime = Form(...),
     duration_sec: int | None = Form(None),
     language: str = Form("ka"),
+    priority: Literal["normal", "batch"] = Form("normal"),
+    callback_url: str | None = Form(None),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -82,6 +445,8 @@ async def upload_call(
         duration_sec=duration_sec,
         audio_url=f"local:{tmp_path}",
         language=language,
+        priority=priority,
+        callback_url=callback_url,
     )
     db.add(call)
     await db.commit()
@@ -97,40 +462,81 @@ async def upload_call(
 # --------------------------------------------------------------------------- #
 @router.get("/{call_id}")
 async def get_call(call_id: int, db: AsyncSession = Depends(get_db)):
-    call = await db.get(Call, call_id)
-    if not call:
+    row = (await db.execute(
+        select(
+            Call.id, Call.order_id, Call.operator_id, Call.call_date, Call.duration_sec,
+            Call.audio_url, Call.created_at, Call.transcript_text.is_not(None).label("has_transcript"),
+        ).where(Call.id == call_id)
+    )).one_or_none()
+    if not row:
         raise HTTPException(status_code=404, detail="Call not found")
     return {
-        "call_id": call.id,
-        "order_id": call.order_id,
-        "operator_id": call.operator_id,
-        "call_date": call.call_date,
-        "duration_sec": call.duration_sec,
-        "audio_url": call.audio_url,
-        "has_transcript": bool(call.transcript_text),
-        "created_at": call.created_at,
+        "call_id": row.id,
+        "order_id": row.order_id,
+        "operator_id": row.operator_id,
+        "call_date": row.call_date,
+        "duration_sec": row.duration_sec,
+        "audio_url": row.audio_url,
+        "has_transcript": row.has_transcript,
+        "created_at": row.created_at,
     }
 
 
 # --------------------------------------------------------------------------- #
 # GET /calls/{call_id}/results  — результаты анализа (анкета + score)
 # --------------------------------------------------------------------------- #
+def _not_modified(request: Request, headers: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return headers["ETag"] in (t.strip() for t in if_none_match.split(",")) or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 @router.get("/{call_id}/results")
-async def get_call_results(call_id: int, db: AsyncSession = Depends(get_db)):
+async def get_call_results(
+    call_id: int,
+    request: Request,
+    response: Response,
+    include_transcript: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
     """
-    Возвращает результаты AI-анализа звонка: статус обработки, итоговый балл,
-    ответы по каждому критерию анкеты и транскрипт.
+    Возвращает результаты AI-анализа звонка: статус обработки, итоговый балл
+    и ответы по каждому критерию анкеты. Транскрипт — только с include_transcript=true
+    (или потоком через GET /calls/{id}/transcript).
+
+    Звонок и анкета читаются одним запросом. Для done-звонков отдаются ETag и
+    Last-Modified (по questionnaire_responses.updated_at): повторный опрос с
+    If-None-Match / If-Modified-Since получает 304 без тела.
+    Ответ done-звонка без транскрипта кэшируется в Redis (app/services/results_cache.py).
     """
-    call = await db.get(Call, call_id)
-    if not call:
-        raise HTTPException(status_code=404, detail="Call not found")
+    cache_version = None
+    if not include_transcript:
+        cache_version, cached = await results_cache.get(call_id)
+        if cached is not None:
+            if _not_modified(request, cached["headers"]):
+                return Response(status_code=304, headers=cached["headers"])
+            return JSONResponse(cached["body"], headers=cached["headers"])
 
-    qr_result = await db.execute(
-        select(QuestionnaireResponse).where(QuestionnaireResponse.call_id == call_id)
-    )
-    qr = qr_result.scalar_one_or_none()
+    columns = [Call.id, Call.order_id, Call.call_date, Call.duration_sec, Call.processing_status, Call.processing_error]
+    if include_transcript:
+        columns.append(Call.transcript_text)
+    row = (await db.execute(
+        select(*columns, QuestionnaireResponse)
+        .outerjoin(QuestionnaireResponse, QuestionnaireResponse.call_id == Call.id)
+        .where(Call.id == call_id)
+    )).one_or_none()
+    if not row:
+        raise HTTPException(status_code=404, detail="Call not found")
 
-    status = call.processing_status or "pending"
+    qr = row.QuestionnaireResponse
+    status = row.processing_status or "pending"
 
     if status in ("pending", "processing"):
         return {"call_id": call_id, "status": status}
@@ -139,38 +545,118 @@ async def get_call_results(call_id: int, db: AsyncSession = Depends(get_db)):
         return {
             "call_id": call_id,
             "status": "error",
-            "error": call.processing_error,
+            "error": row.processing_error,
         }
 
     if qr is None:
         # processing_status=done но анкеты нет — что-то пошло не так
         return {"call_id": call_id, "status": "error", "error": "Questionnaire missing after processing"}
 
-    q_fields = [
-        "q1_1", "q1_2", "q1_3",
-        "q2_1", "q2_2", "q2_3",
-        "q3_1", "q3_2",
-        "q4_1", "q4_2", "q4_3", "q4_4",
-        "q5_1", "q5_2", "q5_3",
-        "q6_1", "q6_2", "q6_3",
-        "q7_1", "q7_2", "q7_3",
-        "q8_1", "q8_2", "q8_3",
-        "q9_1", "q9_2",
-        "q10_1", "q10_2",
-        "q11_1", "q11_2", "q11_3",
-        "q12_1", "q13_1", "q14_1",
-    ]
-
-    return {
+    etag = f'W/"{call_id}-{qr.updated_at.timestamp():.6f}{"-t" if include_transcript else ""}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(qr.updated_at.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    result = {
         "call_id": call_id,
         "status": "done",
-        "order_id": call.order_id,
-        "call_date": call.call_date,
-        "duration_sec": call.duration_sec,
+        "order_id": row.order_id,
+        "call_date": row.call_date,
+        "duration_sec": row.duration_sec,
         "total_score": qr.total_score,
-        "max_score": 34,
+        "max_score": len(QUESTION_FIELDS),
+        "section_scores": {n: getattr(qr, f"s{n}_score") for n in SECTIONS},
         "filled_by_ai": qr.filled_by_ai,
         "corrected_by_human": qr.corrected_by_human,
-        "questionnaire": {f: getattr(qr, f) for f in q_fields},
-        "transcript": call.transcript_text,
+        "questionnaire": {f: getattr(qr, f) for f in QUESTION_FIELDS},
+        "updated_at": qr.updated_at,
     }
+    if include_transcript:
+        result["transcript"] = row.transcript_text
+    else:
+        await results_cache.put(cache_version, call_id, {"body": jsonable_encoder(result), "headers": headers})
+
+    if _not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return result
+
+
+# --------------------------------------------------------------------------- #
+# PATCH /calls/{call_id}/questionnaire  — ручная правка анкеты
+# --------------------------------------------------------------------------- #
+QuestionnaireCorrection = create_model(
+    "QuestionnaireCorrection",
+    __config__=ConfigDict(extra="forbid"),
+    **{q: (bool | None, None) for q in QUESTION_FIELDS},
+)
+
+
+@router.patch("/{call_id}/questionnaire")
+async def correct_questionnaire(
+    call_id: int,
+    data: QuestionnaireCorrection,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Исправление ответов анкеты человеком: передаются только меняемые вопросы
+    (null — «не применимо»). Ставит corrected_by_human, пересчитывает rollup
+    оператора и сбрасывает кэш результатов.
+    """
+    changes = data.model_dump(exclude_unset=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No questionnaire fields to update")
+
+    row = (await db.execute(
+        select(Call.operator_id, Call.call_date, QuestionnaireResponse)
+        .join(QuestionnaireResponse, QuestionnaireResponse.call_id == Call.id)
+        .where(Call.id == call_id)
+        .with_for_update(of=QuestionnaireResponse)
+    )).one_or_none()
+    if not row:
+        raise HTTPException(status_code=404, detail="Questionnaire not found")
+
+    qr = row.QuestionnaireResponse
+    old = answers_of(qr)
+    await apply_questionnaire_changes(db, [(row.operator_id, row.call_date, old, {**old, **changes})])
+    for field, value in changes.items():
+        setattr(qr, field, value)
+    qr.corrected_by_human = True
+    await db.commit()
+    await results_cache.invalidate(call_id)
+
+    return {"call_id": call_id, "status": "ok", "total_score": qr.total_score, "updated": sorted(changes)}
+
+
+# --------------------------------------------------------------------------- #
+# GET /calls/{call_id}/transcript  — транскрипт потоком (text/plain)
+# --------------------------------------------------------------------------- #
+TRANSCRIPT_CHUNK_CHARS = 64 * 1024
+
+
+@router.get("/{call_id}/transcript")
+async def get_call_transcript(call_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Транскрипт звонка кусками по TRANSCRIPT_CHUNK_CHARS символов (substr в Postgres),
+    целиком в памяти API он не держится.
+    """
+    length = (await db.execute(
+        select(func.length(Call.transcript_text)).where(Call.id == call_id)
+    )).one_or_none()
+    if length is None:
+        raise HTTPException(status_code=404, detail="Call not found")
+    if length[0] is None:
+        raise HTTPException(status_code=404, detail="Transcript not ready")
+    total = length[0]
+
+    async def chunks():
+        # Сессия зависимости закрывается до отправки тела — стримим из своей
+        async with AsyncSessionLocal() as stream_db:
+            for start in range(1, total + 1, TRANSCRIPT_CHUNK_CHARS):
+                yield await stream_db.scalar(
+                    select(func.substr(Call.transcript_text, start, TRANSCRIPT_CHUNK_CHARS))
+                    .where(Call.id == call_id)
+                )
+
+    return StreamingResponse(chunks(), media_type="text/plain; charset=utf-8")
@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.services.export import FORMATS, export_chunks, export_query, pyarrow_available
+
+router = APIRouter()
+
+
+# --------------------------------------------------------------------------- #
+# GET /exports/calls  — выгрузка анкет + outcomes для BI (CSV / Parquet)
+# --------------------------------------------------------------------------- #
+@router.get("/calls")
+async def export_calls(
+    format: Literal["csv", "parquet"] = "csv",
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    operator_id: int | None = None,
+):
+    """
+    Потоковая выгрузка всех оценённых звонков за период: строка на звонок,
+    34 ответа анкеты, баллы по разделам и результат заказа.
+    Память API не растёт с числом строк (server-side курсор).
+    """
+    if format == "parquet" and not pyarrow_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server")
+
+    stmt = export_query(date_from, date_to, operator_id)
+    filename = f"calls_export_{datetime.now():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        export_chunks(format, stmt),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
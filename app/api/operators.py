@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
-from app.models.models import Operator
+from app.models.models import QUESTION_FIELDS, Operator, OperatorDailyStats
+from app.services.operator_stats import COUNTER_COLUMNS
 
 router = APIRouter()
 
+DEFAULT_STATS_DAYS = 30
+
 
 class OperatorCreate(BaseModel):
     name: str
@@ -31,3 +36,127 @@ async def list_operators(db: AsyncSession = Depends(get_db)):
         {"id": o.id, "name": o.name, "team": o.team, "created_at": o.created_at}
         for o in operators
     ]
+
+
+def _date_range(date_from: date | None, date_to: date | None) -> tuple[date, date]:
+    """По умолчанию — последние 30 дней (UTC), включая сегодня."""
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=DEFAULT_STATS_DAYS - 1)
+    return date_from, date_to
+
+
+def _summary(counters: dict) -> dict:
+    calls = counters["calls_count"]
+    return {
+        "calls": calls,
+        "avg_score": round(counters["score_sum"] / calls, 2) if calls else None,
+        "pass_rates": {
+            q: round(counters[f"{q}_yes"] / counters[f"{q}_total"], 3) if counters[f"{q}_total"] else None
+            for q in QUESTION_FIELDS
+        },
+    }
+
+
+# --------------------------------------------------------------------------- #
+# GET /operators/leaderboard  — рейтинг операторов за период (из rollup)
+# --------------------------------------------------------------------------- #
+@router.get("/leaderboard")
+async def leaderboard(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    team: str | None = None,
+    min_calls: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Операторы по среднему баллу за период. Читает только operator_daily_stats
+    (+ справочник operators для имён), без сканирования звонков и анкет.
+    """
+    date_from, date_to = _date_range(date_from, date_to)
+    calls = func.sum(OperatorDailyStats.calls_count)
+    avg_score = func.sum(OperatorDailyStats.score_sum) * 1.0 / calls
+
+    stmt = (
+        select(
+            OperatorDailyStats.operator_id,
+            Operator.name,
+            Operator.team,
+            calls.label("calls"),
+            avg_score.label("avg_score"),
+        )
+        .join(Operator, Operator.id == OperatorDailyStats.operator_id)
+        .where(OperatorDailyStats.day.between(date_from, date_to))
+        .group_by(OperatorDailyStats.operator_id, Operator.name, Operator.team)
+        .having(calls >= min_calls)
+        .order_by(avg_score.desc(), calls.desc())
+        .limit(limit)
+    )
+    if team is not None:
+        stmt = stmt.where(Operator.team == team)
+
+    rows = (await db.execute(stmt)).all()
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "max_score": len(QUESTION_FIELDS),
+        "operators": [
+            {
+                "rank": i,
+                "operator_id": r.operator_id,
+                "name": r.name,
+                "team": r.team,
+                "calls": r.calls,
+                "avg_score": round(float(r.avg_score), 2),
+            }
+            for i, r in enumerate(rows, start=1)
+        ],
+    }
+
+
+# --------------------------------------------------------------------------- #
+# GET /operators/{operator_id}/stats  — скоркарта оператора по дням (из rollup)
+# --------------------------------------------------------------------------- #
+@router.get("/{operator_id}/stats")
+async def operator_stats(
+    operator_id: int,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Число звонков, средний балл и доля выполнения каждого критерия
+    за период и по дням. Читает только operator_daily_stats.
+    """
+    operator = await db.get(Operator, operator_id)
+    if not operator:
+        raise HTTPException(status_code=404, detail="Operator not found")
+
+    date_from, date_to = _date_range(date_from, date_to)
+    days = (await db.scalars(
+        select(OperatorDailyStats)
+        .where(
+            OperatorDailyStats.operator_id == operator_id,
+            OperatorDailyStats.day.between(date_from, date_to),
+        )
+        .order_by(OperatorDailyStats.day)
+    )).all()
+
+    totals = dict.fromkeys(COUNTER_COLUMNS, 0)
+    daily = []
+    for day in days:
+        counters = {col: getattr(day, col) for col in COUNTER_COLUMNS}
+        for col, value in counters.items():
+            totals[col] += value
+        daily.append({"day": day.day, **_summary(counters)})
+
+    return {
+        "operator_id": operator.id,
+        "name": operator.name,
+        "team": operator.team,
+        "date_from": date_from,
+        "date_to": date_to,
+        "max_score": len(QUESTION_FIELDS),
+        **_summary(totals),
+        "daily": daily,
+    }
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
+import csv
+import json
+from collections import deque
 from decimal import Decimal
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import func, literal_column
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import insert
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.models.models import Outcome
+from app.services.correlation import bump_outcomes_version
 
 router = APIRouter()
 
+MAX_ERROR_DETAILS = 100
+
 
 class OutcomeUpsert(BaseModel):
     order_id: str
@@ -17,20 +26,170 @@ class OutcomeUpsert(BaseModel):
     avg_check: Decimal | None = None
 
 
+def _upsert_statement(rows: list[dict]):
+    """
+    Один INSERT ... ON CONFLICT DO UPDATE на пачку строк.
+    RETURNING (xmax = 0) — true для вставленной строки, false для обновлённой.
+    """
+    stmt = insert(Outcome).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["order_id"],
+        set_={
+            "approved": stmt.excluded.approved,
+            "redeemed": stmt.excluded.redeemed,
+            "avg_check": stmt.excluded.avg_check,
+            "updated_at": func.now(),
+        },
+    ).returning(literal_column("xmax = 0").label("inserted"))
+
+
 @router.post("/", status_code=200)
 async def upsert_outcome(data: OutcomeUpsert, db: AsyncSession = Depends(get_db)):
     """
     Upsert результатов заказа (апрув, выкуп, чек).
     Вызывается из CRM или вручную при обновлении статуса заказа.
     """
-    stmt = (
-        insert(Outcome)
-        .values(**data.model_dump())
-        .on_conflict_do_update(
-            index_elements=["order_id"],
-            set_={k: v for k, v in data.model_dump().items() if k != "order_id"},
-        )
-    )
-    await db.execute(stmt)
+    await db.execute(_upsert_statement([data.model_dump()]))
     await db.commit()
+    await bump_outcomes_version()
     return {"status": "ok", "order_id": data.order_id}
+
+
+# --------------------------------------------------------------------------- #
+# POST /outcomes/bulk  — пачка результатов заказов (синхронизация из CRM)
+# --------------------------------------------------------------------------- #
+async def _iter_items(request: Request):
+    """
+    (номер, объект) из тела запроса по Content-Type:
+      application/json     — массив объектов,
+      application/x-ndjson — объект на строку (читается потоком),
+      text/csv             — заголовок order_id,approved,redeemed,avg_check (потоком).
+    Нераспарсенная строка отдаётся как ValueError — ошибка только этого элемента.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "csv" not in content_type:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array, NDJSON or CSV")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array, NDJSON or CSV")
+        for index, item in enumerate(items):
+            yield index, item
+        return
+
+    if "csv" in content_type:
+        async for index, item in _iter_csv(request):
+            yield index, item
+        return
+
+    index = 0
+    async for line in _iter_lines(request):
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError as e:
+            yield index, ValueError(f"Invalid JSON: {e}")
+        index += 1
+
+
+class _CsvFeed:
+    """Источник строк для csv.DictReader: строки докладываются в очередь по мере чтения тела."""
+
+    def __init__(self):
+        self.queue = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.queue.popleft()
+
+
+async def _iter_csv(request: Request):
+    """
+    Один csv.DictReader на всё тело, которое по-прежнему читается потоком.
+    В reader подаются только целые записи (чётное число кавычек), так что
+    перевод строки внутри "..." не разрывает запись.
+    """
+    feed = _CsvFeed()
+    reader = csv.DictReader(feed)
+    header = None
+    quotes = 0   # кавычек в незаконченной записи
+    index = 0
+    async for line in _iter_lines(request):
+        if not quotes and not line.strip():
+            continue
+        feed.queue.append(line + "\n")
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        quotes = 0
+        try:
+            if header is None:
+                header = reader.fieldnames = [h.strip() for h in reader.fieldnames]
+                continue
+            row = next(reader)
+        except csv.Error as e:
+            feed.queue.clear()
+            yield index, ValueError(f"Invalid CSV: {e}")
+        else:
+            # Пустая ячейка CSV — «нет значения», а не пустая строка; лишние ячейки — под ключом None
+            yield index, {k: (v.strip() or None) for k, v in row.items() if k is not None and v is not None}
+        index += 1
+    if quotes:
+        yield index, ValueError("Invalid CSV: unterminated quoted field")
+
+
+async def _iter_lines(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+@router.post("/bulk", status_code=200)
+async def upsert_outcomes_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Пакетный upsert результатов заказов: JSON-массив, NDJSON или CSV.
+    Строки пишутся пачками по settings.outcomes_bulk_batch_size одним
+    INSERT ... ON CONFLICT DO UPDATE, всё в одной транзакции.
+    Повтор order_id внутри пачки — побеждает последняя строка.
+    """
+    counts = {"inserted": 0, "updated": 0, "errors": 0}
+    errors = []
+    batch: dict[str, dict] = {}
+
+    async def flush():
+        result = await db.execute(_upsert_statement(list(batch.values())))
+        for inserted in result.scalars():
+            counts["inserted" if inserted else "updated"] += 1
+        batch.clear()
+
+    async for index, item in _iter_items(request):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            data = OutcomeUpsert.model_validate(item)
+        except (ValueError, ValidationError) as e:
+            counts["errors"] += 1
+            if len(errors) < MAX_ERROR_DETAILS:
+                detail = e.errors(include_url=False, include_context=False) if isinstance(e, ValidationError) else str(e)
+                errors.append({"index": index, "error": detail})
+            continue
+
+        batch[data.order_id] = data.model_dump()
+        if len(batch) >= settings.outcomes_bulk_batch_size:
+            await flush()
+
+    if batch:
+        await flush()
+    await db.commit()
+    if counts["inserted"] or counts["updated"]:
+        await bump_outcomes_version()
+    return {"status": "ok", **counts, "error_details": errors}
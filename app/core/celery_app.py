@@ -1,5 +1,13 @@
+import asyncio
+import logging
+import threading
+
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
 from app.core.config import settings
+from app.core import database, metrics
+
+log = logging.getLogger(__name__)
 
 celery_app = Celery(
     "vladtrans",
@@ -13,4 +21,98 @@ celery_app.conf.update(
     result_serializer="json",
     accept_content=["json"],
     timezone="UTC",
+    # Стадии пайплайна — в отдельных очередях, чтобы ffmpeg (CPU) и запросы к Groq/OpenAI (I/O)
+    # масштабировались отдельными воркерами: -Q audio (prefork), -Q asr и -Q llm,celery (threads).
+    # Остальное (webhook'и) — в очереди по умолчанию "celery".
+    task_routes={
+        "app.tasks.process_call": {"queue": settings.celery_audio_queue},
+        "app.tasks.transcribe_call": {"queue": settings.celery_asr_queue},
+        "app.tasks.analyze_call": {"queue": settings.celery_llm_queue},
+        "app.tasks.submit_analysis_batch": {"queue": settings.celery_llm_queue},
+        "app.tasks.poll_analysis_batches": {"queue": settings.celery_llm_queue},
+        "app.tasks.requeue_stalled_calls": {"queue": settings.celery_llm_queue},
+    },
+    # Нужен процесс `celery -A app.core.celery_app beat`
+    beat_schedule={
+        "submit-analysis-batch": {
+            "task": "app.tasks.submit_analysis_batch",
+            "schedule": settings.analysis_batch_submit_interval,
+        },
+        "poll-analysis-batches": {
+            "task": "app.tasks.poll_analysis_batches",
+            "schedule": settings.analysis_batch_poll_interval,
+        },
+        "requeue-stalled-calls": {
+            "task": "app.tasks.requeue_stalled_calls",
+            "schedule": settings.stalled_calls_check_interval,
+        },
+    },
 )
+
+
+# --------------------------------------------------------------------------- #
+# Один долгоживущий event loop на процесс воркера.
+# Loop крутится в отдельном потоке, задачи Celery (pool=threads) отправляют в него
+# корутины через run_coroutine_threadsafe — так один процесс держит десятки
+# звонков в работе одновременно, а asyncpg-пул и HTTP-клиенты не пересоздаются.
+# --------------------------------------------------------------------------- #
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="worker-loop", daemon=True).start()
+    return _loop
+
+
+def run_in_worker_loop(coro):
+    """Выполняет корутину в loop'е воркера и блокирует текущий поток до результата."""
+    return asyncio.run_coroutine_threadsafe(coro, get_worker_loop()).result()
+
+
+async def _log_pool_status():
+    while True:
+        await asyncio.sleep(settings.db_pool_log_interval)
+        log.info(f"DB pool: {database.pool_status()}")
+
+
+def _start_worker_process():
+    global _loop
+    _loop = None
+    database.init_worker_engine()
+    loop = get_worker_loop()
+    if settings.db_pool_log_interval > 0:
+        asyncio.run_coroutine_threadsafe(_log_pool_status(), loop)
+
+
+def _stop_worker_process():
+    if _loop is not None and not _loop.is_closed():
+        run_in_worker_loop(database.engine.dispose())
+
+
+# threads/solo pool: всё в главном процессе воркера
+@worker_init.connect
+def _on_worker_init(**_):
+    # Экспортёр — один на воркер; при prefork дети пишут метрики в PROMETHEUS_MULTIPROC_DIR
+    metrics.start_worker_exporter(settings.worker_metrics_port)
+    _start_worker_process()
+
+
+@worker_shutdown.connect
+def _on_worker_shutdown(**_):
+    _stop_worker_process()
+
+
+# prefork pool: после fork loop и пул соединений родителя непригодны — создаём свои
+@worker_process_init.connect
+def _on_worker_process_init(**_):
+    _start_worker_process()
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**_):
+    _stop_worker_process()
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -6,16 +8,110 @@ class Settings(BaseSettings):
 
     # OpenAI (анализ анкеты через GPT)
     openai_api_key: str
+    # Альтернативный endpoint (локальный stub-сервер для тестов); None — api.openai.com
+    openai_base_url: str | None = None
+    # Анализ не ru/en звонков:
+    #   two_step    — перевод gpt-4o → оценка gpt-4o-mini (два запроса)
+    #   single_pass — оценка оригинального транскрипта одним запросом
+    analysis_mode: str = "two_step"
+    analysis_single_pass_model: str = "gpt-4o"
 
     # Groq (транскрипция Whisper large-v3, поддерживает Georgian)
     groq_api_key: str
+    # Альтернативный endpoint Groq (stub-сервер scripts/benchmark.py); None — api.groq.com
+    groq_base_url: str | None = None
 
     # Database — Railway даёт postgresql://, нам нужен asyncpg драйвер
     database_url: str = "postgresql+asyncpg://vladtrans:vladtrans@db:5432/vladtrans"
 
+    # Пул соединений к Postgres. API и воркеры сайзятся отдельно:
+    # всего соединений ≈ (db_pool_size + db_max_overflow) × процессов API
+    #                  + (worker_db_pool_size + worker_db_max_overflow) × процессов воркеров
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    worker_db_pool_size: int = 5
+    worker_db_max_overflow: int = 5
+    db_pool_timeout: int = 30          # сек ожидания свободного соединения
+    db_pool_recycle: int = 1800        # сек, переоткрывать старые соединения
+    db_pool_pre_ping: bool = True      # проверять соединение перед выдачей (рестарты Postgres/прокси)
+    db_pool_log_interval: int = 60     # сек, воркер пишет статистику пула в лог (0 — выкл)
+
     # Redis / Celery
     redis_url: str = "redis://redis:6379/0"
 
+    # Транскрипция чанков Groq.
+    # concurrency=1 — последовательно, как раньше; >1 — параллельно
+    # (корутины в loop'е воркера, не больше concurrency запросов на звонок — asyncio.Semaphore).
+    groq_chunk_concurrency: int = 1
+    # Контекст между чанками (prompt для Whisper); другое значение — ошибка при старте:
+    #   chain    — хвост предыдущего чанка в prompt, строго последовательно
+    #   none     — только базовый prompt, полностью параллельно
+    #   two_pass — параллельный проход без контекста, затем параллельный
+    #              повторный проход чанков 2..N с хвостом текста из первого прохода
+    groq_chunk_context: Literal["chain", "none", "two_pass"] = "chain"
+
+    # Клиентский rate limiting (token bucket в Redis + адаптивная конкурентность).
+    # 0 — без ограничения по этой метрике.
+    rate_limit_enabled: bool = True
+    rate_limit_retries: int = 5                     # повторов на 429 внутри одного вызова
+    groq_rpm: int = 300
+    groq_audio_seconds_per_minute: int = 0          # аналог tpm для Whisper: секунды аудио
+    groq_max_concurrency: int = 16                  # на процесс
+    openai_rpm: int = 500
+    openai_tpm: int = 200_000
+    openai_max_concurrency: int = 32                # на процесс
+
+    # Content-addressed кэш нормализованного аудио и транскриптов (LRU на диске)
+    audio_cache_enabled: bool = True
+    audio_cache_dir: str = "/tmp/vladtrans-cache"
+    audio_cache_max_mb: int = 2048
+
+    # Рабочая папка пайплайна: скачанное и нормализованное аудио живёт здесь
+    # между стадиями и retry задачи (подпапка на каждый call_id)
+    pipeline_work_dir: str = "/tmp/vladtrans-work"
+
+    # Скачивание audio_url: лимит размера и число докачек (HTTP Range) при обрыве
+    download_max_mb: int = 200
+    download_retries: int = 3
+
+    # Batch-режим анализа (OpenAI Batch API) для звонков с priority="batch"
+    analysis_batch_max_size: int = 5000          # звонков в одном JSONL-батче
+    analysis_batch_submit_interval: int = 600    # сек, как часто отправлять накопленное
+    analysis_batch_poll_interval: int = 300      # сек, как часто проверять статус батчей
+
+    # POST /calls/bulk: лимит звонков в одном запросе и строк в одном INSERT
+    calls_bulk_max_items: int = 50_000
+    calls_bulk_insert_chunk: int = 1000
+    # POST /outcomes/bulk: строк в одном INSERT ... ON CONFLICT DO UPDATE
+    outcomes_bulk_batch_size: int = 1000
+
+    # Webhook о завершении обработки (calls.callback_url).
+    # Секрет — ключ HMAC-SHA256 подписи; без него запросы уходят неподписанными.
+    webhook_secret: str | None = None
+    webhook_timeout: int = 10          # сек на один POST
+    webhook_max_retries: int = 8       # повторов с backoff 30 с → … → 1 ч
+
+    # Read-through кэш результатов done-звонков в Redis (GET /calls/{id}/results)
+    results_cache_enabled: bool = True
+    results_cache_ttl: int = 3600      # сек; инвалидация явная, TTL — страховка
+    # Кэш /analytics/correlation: ключ включает версию outcomes, TTL — чтобы
+    # учитывались и новые анкеты, если outcomes давно не приходили
+    analytics_cache_ttl: int = 6 * 3600
+
+    # Очереди Celery по стадиям пайплайна (см. task_routes в celery_app).
+    # Одно имя у всех трёх — прежняя схема с одним воркером на всё
+    celery_audio_queue: str = "audio"    # download + ffmpeg, CPU
+    celery_asr_queue: str = "asr"        # Groq Whisper, I/O
+    celery_llm_queue: str = "llm"        # перевод + анкета + batch-задачи, I/O
+
+    # Звонок pending/processing без движения дольше stalled_call_timeout сек
+    # ставится в очередь заново (задача потерялась). Больше самой долгой стадии + ожидания в очереди
+    stalled_call_timeout: int = 6 * 3600
+    stalled_calls_check_interval: int = 900
+
+    # Порт HTTP-экспортёра Prometheus-метрик воркера (0 — выключен); API отдаёт /metrics сам
+    worker_metrics_port: int = 9100
+
     @property
     def async_database_url(self) -> str:
         """Для SQLAlchemy async engine."""
@@ -1,7 +1,67 @@
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import logging
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
 from app.core.config import settings
 
-engine = create_async_engine(settings.async_database_url, echo=False)
+log = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Счётчики ожидания соединения из пула (для сайзинга Postgres по API и воркерам)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """QueuePool, замеряющий время получения соединения (ожидание в очереди + connect)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - started)
+        return conn
+
+
+def _create_engine(pool_size: int, max_overflow: int) -> AsyncEngine:
+    return create_async_engine(
+        settings.async_database_url,
+        echo=False,
+        poolclass=InstrumentedPool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+
+
+engine = _create_engine(settings.db_pool_size, settings.db_max_overflow)
 
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -10,6 +70,35 @@ AsyncSessionLocal = async_sessionmaker(
 )
 
 
+def init_worker_engine():
+    """
+    Отдельный engine для процесса воркера Celery (вызывается из сигналов воркера).
+    После fork пул родителя использовать нельзя, а размеры пула у воркеров свои.
+    Сессии AsyncSessionLocal после этого идут через новый engine.
+    """
+    global engine
+    engine = _create_engine(settings.worker_db_pool_size, settings.worker_db_max_overflow)
+    AsyncSessionLocal.configure(bind=engine)
+    log.info(
+        f"Worker DB engine: pool_size={settings.worker_db_pool_size}, "
+        f"max_overflow={settings.worker_db_max_overflow}"
+    )
+
+
+def pool_status() -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts_total": pool_stats.checkouts,
+        "timeouts_total": pool_stats.timeouts,
+        "wait_seconds_total": round(pool_stats.wait_seconds_total, 3),
+        "wait_seconds_max": round(pool_stats.wait_seconds_max, 3),
+    }
+
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
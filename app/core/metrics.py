@@ -0,0 +1,128 @@
+"""
+Prometheus-метрики пайплайна и API.
+
+  vladtrans_stage_duration_seconds{stage}          — стадии звонка: download, normalize
+                                                      (ffmpeg: нормализация + нарезка), transcribe,
+                                                      translate, analyze, save
+  vladtrans_stage_in_flight{stage}                 — звонков в стадии сейчас
+  vladtrans_queue_wait_seconds                     — от calls.created_at до начала обработки
+  vladtrans_calls_finished_total{status}           — done / error
+  vladtrans_provider_request_duration_seconds{provider,operation} — один запрос к Groq/OpenAI
+                                                      (каждый чанк Groq — отдельный запрос)
+  vladtrans_provider_wait_seconds{provider}        — ожидание rate limiter'а перед запросом
+  vladtrans_provider_in_flight{provider}           — запросов к провайдеру сейчас
+  vladtrans_provider_rate_limited_total{provider}  — ответов 429
+  vladtrans_provider_tokens_total{provider,model,kind}  — prompt / completion токены
+  vladtrans_provider_audio_seconds_total{provider,model} — секунды отправленного аудио
+  vladtrans_http_request_duration_seconds{method,route,status} — запросы к API
+
+API отдаёт метрики своего процесса на GET /metrics, воркер — на
+settings.worker_metrics_port (start_worker_exporter). Для prefork-воркера задай
+PROMETHEUS_MULTIPROC_DIR — метрики процессов-детей суммируются через файлы.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+
+log = logging.getLogger(__name__)
+
+# Стадии — от сотен мс (save) до десятков минут (transcribe длинного звонка)
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+QUEUE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+
+STAGE_DURATION = Histogram(
+    "vladtrans_stage_duration_seconds", "Длительность стадии обработки звонка", ["stage"], buckets=STAGE_BUCKETS
+)
+STAGE_IN_FLIGHT = Gauge(
+    "vladtrans_stage_in_flight", "Звонков в стадии сейчас", ["stage"], multiprocess_mode="livesum"
+)
+QUEUE_WAIT = Histogram(
+    "vladtrans_queue_wait_seconds", "От создания звонка до начала обработки", buckets=QUEUE_BUCKETS
+)
+CALLS_FINISHED = Counter("vladtrans_calls_finished_total", "Звонков завершено", ["status"])
+
+PROVIDER_REQUEST_DURATION = Histogram(
+    "vladtrans_provider_request_duration_seconds", "Запрос к провайдеру (без ожидания лимитера)",
+    ["provider", "operation"], buckets=REQUEST_BUCKETS,
+)
+PROVIDER_WAIT = Histogram(
+    "vladtrans_provider_wait_seconds", "Ожидание rate limiter'а перед запросом", ["provider"], buckets=REQUEST_BUCKETS
+)
+PROVIDER_IN_FLIGHT = Gauge(
+    "vladtrans_provider_in_flight", "Запросов к провайдеру сейчас", ["provider"], multiprocess_mode="livesum"
+)
+PROVIDER_RATE_LIMITED = Counter("vladtrans_provider_rate_limited_total", "Ответов 429", ["provider"])
+PROVIDER_TOKENS = Counter("vladtrans_provider_tokens_total", "Токены LLM", ["provider", "model", "kind"])
+PROVIDER_AUDIO_SECONDS = Counter(
+    "vladtrans_provider_audio_seconds_total", "Секунды аудио, отправленные в ASR", ["provider", "model"]
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "vladtrans_http_request_duration_seconds", "Запросы к API", ["method", "route", "status"], buckets=REQUEST_BUCKETS
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Время стадии (в т.ч. упавшей) + gauge звонков в стадии."""
+    in_flight = STAGE_IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - started)
+        in_flight.dec()
+
+
+def record_usage(provider: str, model: str, usage) -> None:
+    """usage — объект/словарь usage из ответа chat.completions (None — пропуск)."""
+    if usage is None:
+        return
+    if isinstance(usage, dict):
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+    else:
+        prompt, completion = getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+    if prompt:
+        PROVIDER_TOKENS.labels(provider, model, "prompt").inc(prompt)
+    if completion:
+        PROVIDER_TOKENS.labels(provider, model, "completion").inc(completion)
+
+
+def _registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    from prometheus_client import multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render() -> tuple[bytes, str]:
+    """Тело и Content-Type ответа /metrics."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_worker_exporter(port: int) -> None:
+    """HTTP-экспортёр метрик воркера (вызывать один раз в главном процессе)."""
+    if port <= 0:
+        return
+    try:
+        start_http_server(port, registry=_registry())
+    except OSError as e:
+        log.warning(f"Worker metrics exporter not started on :{port}: {e}")
+        return
+    log.info(f"Worker metrics exporter listening on :{port}")
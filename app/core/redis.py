@@ -0,0 +1,32 @@
+import asyncio
+import weakref
+
+import redis.asyncio as aioredis
+from redis.commands.core import AsyncScript
+
+from app.core.config import settings
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Async Redis клиент (settings.redis_url) на текущий event loop.
+    Пул соединений asyncio-клиента привязан к loop, поэтому кэшируем по loop:
+    в API это loop uvicorn, в воркере — долгоживущий loop процесса.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = aioredis.from_url(settings.redis_url, decode_responses=True)
+        _clients[loop] = client
+    return client
+
+
+def lua_script(source: str) -> AsyncScript:
+    """
+    Lua-скрипт, создаваемый один раз на уровне модуля (sha считается сразу).
+    Клиент передаётся при вызове: script(keys=..., args=..., client=get_redis()) —
+    EVALSHA, а при NOSCRIPT (рестарт Redis) скрипт загружается заново.
+    """
+    return AsyncScript(None, source.encode())
@@ -1,13 +1,59 @@
-from fastapi import FastAPI
-from app.api import calls, operators, outcomes
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from app.api import analytics, calls, exports, operators, outcomes
+from app.core import database, metrics
+from app.services import results_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await database.engine.dispose()
+
+
+app = FastAPI(title="Vladtrans Call Analytics", version="0.1.0", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Шаблон пути (/calls/{call_id}), а не сам путь — иначе метка на каждый id
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_DURATION.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(time.perf_counter() - started)
+    return response
 
-app = FastAPI(title="Vladtrans Call Analytics", version="0.1.0")
 
 app.include_router(calls.router,     prefix="/calls",     tags=["calls"])
 app.include_router(operators.router, prefix="/operators", tags=["operators"])
 app.include_router(outcomes.router,  prefix="/outcomes",  tags=["outcomes"])
+app.include_router(exports.router,   prefix="/exports",   tags=["exports"])
+app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/health/db-pool")
+async def health_db_pool():
+    """Состояние пула соединений к Postgres в этом процессе API."""
+    return database.pool_status()
+
+
+@app.get("/health/results-cache")
+async def health_results_cache():
+    """Попадания/промахи кэша результатов (общие для всех процессов API)."""
+    return await results_cache.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Метрики Prometheus этого процесса API (пайплайн воркера — на его экспортёре)."""
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
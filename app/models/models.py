@@ -1,8 +1,9 @@
 from datetime import datetime
 from sqlalchemy import (
-    Boolean, Column, ForeignKey, Integer, Numeric,
-    SmallInteger, String, Text, TIMESTAMP
+    Boolean, Column, Computed, Date, ForeignKey, Integer, Numeric,
+    SmallInteger, String, Text, TIMESTAMP, func
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, relationship
 
 
@@ -10,6 +11,32 @@ class Base(DeclarativeBase):
     pass
 
 
+# Разделы анкеты → вопросы (q<раздел>_<пункт>), всего 34 вопроса
+SECTIONS = {
+    1:  ("q1_1", "q1_2", "q1_3"),            # Приветствие
+    2:  ("q2_1", "q2_2", "q2_3"),            # Уточнение региона
+    3:  ("q3_1", "q3_2"),                    # Выявление потребности
+    4:  ("q4_1", "q4_2", "q4_3", "q4_4"),    # Презентация продукта
+    5:  ("q5_1", "q5_2", "q5_3"),            # Вилка цен 3+2 и 2+2
+    6:  ("q6_1", "q6_2", "q6_3"),            # Скидка на курс 2+2
+    7:  ("q7_1", "q7_2", "q7_3"),            # Базовый курс 2+1
+    8:  ("q8_1", "q8_2", "q8_3"),            # Проработка возражения
+    9:  ("q9_1", "q9_2"),                    # Данные в CRM
+    10: ("q10_1", "q10_2"),                  # Доставка
+    11: ("q11_1", "q11_2", "q11_3"),         # Устный договор
+    12: ("q12_1",),                          # Бонус
+    13: ("q13_1",),                          # Прощание
+    14: ("q14_1",),                          # Перезвон
+}
+
+QUESTION_FIELDS = tuple(q for fields in SECTIONS.values() for q in fields)
+
+
+def _score_sql(fields) -> str:
+    """SQL-выражение балла: COALESCE — чтобы NULL считался как 0, а не обнулял сумму."""
+    return " + ".join(f"COALESCE({f}::int, 0)" for f in fields)
+
+
 class Operator(Base):
     __tablename__ = "operators"
 
@@ -30,10 +57,22 @@ class Call(Base):
     call_date       = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
     duration_sec    = Column(Integer)
     audio_url           = Column(Text)
+    audio_url_md5       = Column(String(32))                      # md5(audio_url): дедупликация (order_id, audio_url), миграция 013
     language            = Column(String(10), default="ka")        # ISO-639-1 язык звонка
     transcript_text     = Column(Text)
     processing_status   = Column(String(20), default="pending")   # pending/processing/done/error
     processing_error    = Column(Text)
+    # Чекпоинты стадий пайплайна (см. app.tasks.STAGES)
+    processing_stage    = Column(String(20))                      # последняя завершённая стадия
+    audio_local_path    = Column(Text)
+    audio_sha256        = Column(String(64))
+    normalized_path     = Column(Text)                            # папка нормализованных чанков
+    translated_text     = Column(Text)
+    analysis_result     = Column(JSONB)
+    priority            = Column(String(10), default="normal")    # normal / batch (OpenAI Batch API)
+    analysis_batch_id   = Column(String(64))                      # id батча OpenAI, пока он в работе
+    callback_url        = Column(Text)                            # webhook о завершении (done/error)
+    stage_updated_at    = Column(TIMESTAMP(timezone=True), default=func.now())  # старт стадии / чекпоинт (см. requeue_stalled_calls)
     created_at          = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
 
     operator             = relationship("Operator", back_populates="calls")
@@ -111,26 +150,32 @@ class QuestionnaireResponse(Base):
     filled_by_ai       = Column(Boolean, default=True)
     corrected_by_human = Column(Boolean, default=False)
     created_at         = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
+    # Время БД, а не процесса: из него строятся ETag/Last-Modified результатов
+    updated_at         = Column(TIMESTAMP(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
+
+    # STORED generated колонки (migrations 002, 008): считаются в Postgres,
+    # по ним можно фильтровать/сортировать в SQL, есть индексы
+    total_score = Column(SmallInteger, Computed(_score_sql(QUESTION_FIELDS), persisted=True), index=True)
+    s1_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[1]), persisted=True), index=True)
+    s2_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[2]), persisted=True), index=True)
+    s3_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[3]), persisted=True), index=True)
+    s4_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[4]), persisted=True), index=True)
+    s5_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[5]), persisted=True), index=True)
+    s6_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[6]), persisted=True), index=True)
+    s7_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[7]), persisted=True), index=True)
+    s8_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[8]), persisted=True), index=True)
+    s9_score    = Column(SmallInteger, Computed(_score_sql(SECTIONS[9]), persisted=True), index=True)
+    s10_score   = Column(SmallInteger, Computed(_score_sql(SECTIONS[10]), persisted=True), index=True)
+    s11_score   = Column(SmallInteger, Computed(_score_sql(SECTIONS[11]), persisted=True), index=True)
+    s12_score   = Column(SmallInteger, Computed(_score_sql(SECTIONS[12]), persisted=True), index=True)
+    s13_score   = Column(SmallInteger, Computed(_score_sql(SECTIONS[13]), persisted=True), index=True)
+    s14_score   = Column(SmallInteger, Computed(_score_sql(SECTIONS[14]), persisted=True), index=True)
 
     call = relationship("Call", back_populates="questionnaire")
 
-    @property
-    def total_score(self) -> int:
-        fields = [
-            self.q1_1, self.q1_2, self.q1_3,
-            self.q2_1, self.q2_2, self.q2_3,
-            self.q3_1, self.q3_2,
-            self.q4_1, self.q4_2, self.q4_3, self.q4_4,
-            self.q5_1, self.q5_2, self.q5_3,
-            self.q6_1, self.q6_2, self.q6_3,
-            self.q7_1, self.q7_2, self.q7_3,
-            self.q8_1, self.q8_2, self.q8_3,
-            self.q9_1, self.q9_2,
-            self.q10_1, self.q10_2,
-            self.q11_1, self.q11_2, self.q11_3,
-            self.q12_1, self.q13_1, self.q14_1,
-        ]
-        return sum(1 for f in fields if f is True)
+    # Generated колонки забираются через RETURNING сразу после INSERT/UPDATE
+    # (иначе ленивая догрузка в async-сессии)
+    __mapper_args__ = {"eager_defaults": True}
 
 
 class Outcome(Base):
@@ -142,3 +187,88 @@ class Outcome(Base):
     redeemed   = Column(Boolean)
     avg_check  = Column(Numeric(10, 2))
     updated_at = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
+
+
+class OperatorDailyStats(Base):
+    """
+    Rollup по оператору и дню (UTC дата call_date), обновляется инкрементально
+    при сохранении анкеты — см. app/services/operator_stats.py.
+    qN_M_yes — критерий выполнен, qN_M_total — критерий оценён (не null).
+    """
+    __tablename__ = "operator_daily_stats"
+
+    operator_id = Column(Integer, ForeignKey("operators.id", ondelete="CASCADE"), primary_key=True)
+    day         = Column(Date, primary_key=True)
+    calls_count = Column(Integer, nullable=False, default=0)
+    score_sum   = Column(Integer, nullable=False, default=0)
+
+    q1_1_yes    = Column(Integer, nullable=False, default=0)
+    q1_1_total  = Column(Integer, nullable=False, default=0)
+    q1_2_yes    = Column(Integer, nullable=False, default=0)
+    q1_2_total  = Column(Integer, nullable=False, default=0)
+    q1_3_yes    = Column(Integer, nullable=False, default=0)
+    q1_3_total  = Column(Integer, nullable=False, default=0)
+    q2_1_yes    = Column(Integer, nullable=False, default=0)
+    q2_1_total  = Column(Integer, nullable=False, default=0)
+    q2_2_yes    = Column(Integer, nullable=False, default=0)
+    q2_2_total  = Column(Integer, nullable=False, default=0)
+    q2_3_yes    = Column(Integer, nullable=False, default=0)
+    q2_3_total  = Column(Integer, nullable=False, default=0)
+    q3_1_yes    = Column(Integer, nullable=False, default=0)
+    q3_1_total  = Column(Integer, nullable=False, default=0)
+    q3_2_yes    = Column(Integer, nullable=False, default=0)
+    q3_2_total  = Column(Integer, nullable=False, default=0)
+    q4_1_yes    = Column(Integer, nullable=False, default=0)
+    q4_1_total  = Column(Integer, nullable=False, default=0)
+    q4_2_yes    = Column(Integer, nullable=False, default=0)
+    q4_2_total  = Column(Integer, nullable=False, default=0)
+    q4_3_yes    = Column(Integer, nullable=False, default=0)
+    q4_3_total  = Column(Integer, nullable=False, default=0)
+    q4_4_yes    = Column(Integer, nullable=False, default=0)
+    q4_4_total  = Column(Integer, nullable=False, default=0)
+    q5_1_yes    = Column(Integer, nullable=False, default=0)
+    q5_1_total  = Column(Integer, nullable=False, default=0)
+    q5_2_yes    = Column(Integer, nullable=False, default=0)
+    q5_2_total  = Column(Integer, nullable=False, default=0)
+    q5_3_yes    = Column(Integer, nullable=False, default=0)
+    q5_3_total  = Column(Integer, nullable=False, default=0)
+    q6_1_yes    = Column(Integer, nullable=False, default=0)
+    q6_1_total  = Column(Integer, nullable=False, default=0)
+    q6_2_yes    = Column(Integer, nullable=False, default=0)
+    q6_2_total  = Column(Integer, nullable=False, default=0)
+    q6_3_yes    = Column(Integer, nullable=False, default=0)
+    q6_3_total  = Column(Integer, nullable=False, default=0)
+    q7_1_yes    = Column(Integer, nullable=False, default=0)
+    q7_1_total  = Column(Integer, nullable=False, default=0)
+    q7_2_yes    = Column(Integer, nullable=False, default=0)
+    q7_2_total  = Column(Integer, nullable=False, default=0)
+    q7_3_yes    = Column(Integer, nullable=False, default=0)
+    q7_3_total  = Column(Integer, nullable=False, default=0)
+    q8_1_yes    = Column(Integer, nullable=False, default=0)
+    q8_1_total  = Column(Integer, nullable=False, default=0)
+    q8_2_yes    = Column(Integer, nullable=False, default=0)
+    q8_2_total  = Column(Integer, nullable=False, default=0)
+    q8_3_yes    = Column(Integer, nullable=False, default=0)
+    q8_3_total  = Column(Integer, nullable=False, default=0)
+    q9_1_yes    = Column(Integer, nullable=False, default=0)
+    q9_1_total  = Column(Integer, nullable=False, default=0)
+    q9_2_yes    = Column(Integer, nullable=False, default=0)
+    q9_2_total  = Column(Integer, nullable=False, default=0)
+    q10_1_yes   = Column(Integer, nullable=False, default=0)
+    q10_1_total = Column(Integer, nullable=False, default=0)
+    q10_2_yes   = Column(Integer, nullable=False, default=0)
+    q10_2_total = Column(Integer, nullable=False, default=0)
+    q11_1_yes   = Column(Integer, nullable=False, default=0)
+    q11_1_total = Column(Integer, nullable=False, default=0)
+    q11_2_yes   = Column(Integer, nullable=False, default=0)
+    q11_2_total = Column(Integer, nullable=False, default=0)
+    q11_3_yes   = Column(Integer, nullable=False, default=0)
+    q11_3_total = Column(Integer, nullable=False, default=0)
+    q12_1_yes   = Column(Integer, nullable=False, default=0)
+    q12_1_total = Column(Integer, nullable=False, default=0)
+    q13_1_yes   = Column(Integer, nullable=False, default=0)
+    q13_1_total = Column(Integer, nullable=False, default=0)
+    q14_1_yes   = Column(Integer, nullable=False, default=0)
+    q14_1_total = Column(Integer, nullable=False, default=0)
+
+    updated_at  = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
@@ -2,34 +2,54 @@ import json
 import logging
 import os
 
-from openai import AuthenticationError, OpenAI, RateLimitError, APIError
+from openai import AuthenticationError, AsyncOpenAI, RateLimitError, APIError
 
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+from app.core import metrics
+from app.core.config import settings
+from app.services.ratelimit import call_limited, estimate_tokens, sdk_max_retries
+
+# Запросы идут через call_limited — 429 повторяет он, а не SDK (см. sdk_max_retries)
+client = AsyncOpenAI(
+    api_key=os.environ["OPENAI_API_KEY"], base_url=settings.openai_base_url, max_retries=sdk_max_retries()
+)
 log = logging.getLogger(__name__)
 
 
-def _translate_to_english(transcript: str) -> str:
+def translation_request(transcript: str) -> dict:
+    """Параметры chat.completions для перевода (общие для online и Batch API)."""
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You are a translator. This is an automatic transcription of a call center "
+                    "phone conversation in Georgian. The text may contain recognition errors. "
+                    "Translate to English as accurately as possible, restoring the meaning. "
+                    "Preserve the dialogue structure. Do not add explanations."
+                ),
+            },
+            {"role": "user", "content": transcript},
+        ],
+        "temperature": 0,
+    }
+
+
+async def _translate_to_english(transcript: str) -> str:
     """
     Переводит транскрипт на английский язык для более точного анализа GPT.
     Использует gpt-4o — он лучше восстанавливает смысл из корявой автотранскрипции.
     """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a translator. This is an automatic transcription of a call center "
-                        "phone conversation in Georgian. The text may contain recognition errors. "
-                        "Translate to English as accurately as possible, restoring the meaning. "
-                        "Preserve the dialogue structure. Do not add explanations."
-                    ),
-                },
-                {"role": "user", "content": transcript},
-            ],
-            temperature=0,
+        request = translation_request(transcript)
+        response = await call_limited(
+            "openai",
+            lambda: client.chat.completions.create(**request),
+            # перевод: на выходе примерно столько же токенов, сколько на входе
+            tokens=estimate_tokens(request) + len(transcript) // 3,
+            operation="translate",
         )
+        metrics.record_usage("openai", request["model"], response.usage)
         translated = response.choices[0].message.content
         log.info(f"Translated transcript to English ({len(translated)} chars)")
         return translated
@@ -65,6 +85,28 @@ SYSTEM_PROMPT = """Ты — аналитик качества звонков г
 
 Верни ТОЛЬКО валидный JSON без markdown и пояснений."""
 
+# Single-pass: оценка транскрипта на языке оригинала, без отдельного шага перевода
+SINGLE_PASS_SYSTEM_PROMPT = """Ты — аналитик качества звонков грузинского колл-центра.
+Тебе дают транскрипт телефонного разговора между оператором и клиентом.
+Транскрипт на языке оригинала ({language_name}) — это автоматическое распознавание речи, возможны ошибки распознавания.
+Не переводи транскрипт в ответе. Восстанавливай смысл реплик и оценивай смысл и контекст разговора целиком, не придираясь к точным формулировкам.
+Твоя задача — оценить работу оператора по чек-листу и вернуть результат в формате JSON.
+
+Правила:
+- true  — критерий выполнен (даже частично / неточно)
+- false — критерий явно НЕ выполнен
+- null  — критерий не применим к данному звонку
+
+Верни ТОЛЬКО валидный JSON без markdown и пояснений."""
+
+LANGUAGE_NAMES = {
+    "ka": "Georgian", "hy": "Armenian", "az": "Azerbaijani",
+    "uk": "Ukrainian", "kk": "Kazakh", "ro": "Romanian",
+}
+
+# Языки, которые оцениваются напрямую обычным промптом (без перевода)
+DIRECT_LANGUAGES = ("ru", "en")
+
 QUESTIONNAIRE_PROMPT = """Оцени звонок по следующим критериям:
 
 1. ПРИВЕТСТВИЕ
@@ -148,26 +190,48 @@ QUESTIONNAIRE_PROMPT = """Оцени звонок по следующим кри
 }"""
 
 
-def analyze_transcript(transcript: str, language: str = "ka") -> dict:
+def needs_translation(language: str) -> bool:
+    """Нужен ли отдельный шаг перевода. В режиме single_pass — никогда."""
+    return language not in DIRECT_LANGUAGES and settings.analysis_mode != "single_pass"
+
+
+async def translate_transcript(transcript: str, language: str = "ka") -> str:
+    """
+    Стадия translate: для языков кроме ru/en переводит транскрипт на английский.
+    При ошибке перевода возвращает исходный транскрипт (см. _translate_to_english).
+    """
+    if not needs_translation(language):
+        return transcript
+    log.info(f"Translating transcript from '{language}' to English for analysis")
+    return await _translate_to_english(transcript)
+
+
+async def analyze_transcript(transcript: str, language: str = "ka") -> dict:
     """
     Анализирует транскрипт звонка и возвращает заполненную анкету.
-    Если язык не русский/английский — переводит транскрипт на русский перед анализом.
+    Если язык не русский/английский — переводит транскрипт на английский перед анализом
+    (в режиме analysis_mode="single_pass" — оценивает оригинал одним запросом).
     Бросает RuntimeError при ошибках API (нет токенов, auth, quota и т.д.).
     """
-    analysis_text = transcript
-    if language not in ("ru", "en"):
-        log.info(f"Translating transcript from '{language}' to English for analysis")
-        analysis_text = _translate_to_english(transcript)
+    if needs_translation(language):
+        return await score_transcript(await translate_transcript(transcript, language))
+    return await score_transcript(transcript, language)
 
+
+async def score_transcript(analysis_text: str, language: str | None = None) -> dict:
+    """
+    Стадия analyze: заполняет анкету по транскрипту.
+    language=None — текст уже переведён на английский; иначе — язык оригинала
+    (для не ru/en это single-pass оценка без перевода).
+    Бросает RuntimeError при ошибках API (нет токенов, auth, quota и т.д.).
+    """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"{QUESTIONNAIRE_PROMPT}\n\nТРАНСКРИПТ ЗВОНКА:\n{analysis_text}"},
-            ],
-            temperature=0,
-            response_format={"type": "json_object"},
+        request = scoring_request(analysis_text, language)
+        response = await call_limited(
+            "openai",
+            lambda: client.chat.completions.create(**request),
+            tokens=estimate_tokens(request),
+            operation="score",
         )
     except AuthenticationError as e:
         raise RuntimeError(f"OpenAI auth error (проверь OPENAI_API_KEY): {e}") from e
@@ -176,7 +240,33 @@ def analyze_transcript(transcript: str, language: str = "ka") -> dict:
     except APIError as e:
         raise RuntimeError(f"OpenAI API error: {e}") from e
 
-    raw = response.choices[0].message.content
+    metrics.record_usage("openai", request["model"], response.usage)
+    return parse_scoring_response(response.choices[0].message.content)
+
+
+def scoring_request(analysis_text: str, language: str | None = None) -> dict:
+    """
+    Параметры chat.completions для оценки анкеты (общие для online и Batch API).
+    Для непереведённого транскрипта не на ru/en — single-pass промпт и модель.
+    """
+    if language is not None and language not in DIRECT_LANGUAGES:
+        model = settings.analysis_single_pass_model
+        system_prompt = SINGLE_PASS_SYSTEM_PROMPT.format(language_name=LANGUAGE_NAMES.get(language, language))
+    else:
+        model, system_prompt = "gpt-4o-mini", SYSTEM_PROMPT
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"{QUESTIONNAIRE_PROMPT}\n\nТРАНСКРИПТ ЗВОНКА:\n{analysis_text}"},
+        ],
+        "temperature": 0,
+        "response_format": {"type": "json_object"},
+    }
+
+
+def parse_scoring_response(raw: str) -> dict:
+    """Разбирает JSON-ответ GPT в словарь анкеты. Бросает RuntimeError на невалидный JSON."""
     log.debug(f"GPT raw response: {raw[:200]}")
 
     try:
@@ -0,0 +1,226 @@
+"""
+Content-addressed кэш нормализованного аудио (чанков) и транскриптов на локальном диске.
+
+Ключ — sha256 байтов исходного аудио (+ язык и модель для транскрипта), поэтому
+повторная отправка той же записи из CRM или retry задачи не идут ни в ffmpeg, ни в Groq.
+Размер ограничен settings.audio_cache_max_mb, вытеснение — LRU по mtime
+(при попадании файл «трогается»). Размер кэша считается инкрементально при
+записи; полный обход папки — только при первой записи, при превышении лимита
+(тогда вытесняется до EVICT_TO_RATIO лимита, чтобы обход не повторялся на каждой
+записи) и раз в RESCAN_SECONDS — учесть записи других процессов на том же диске.
+
+Методы класса синхронные и работают с диском — из async-кода вызывать через
+asyncio.to_thread (см. transcriber), чтобы не блокировать event loop воркера.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+_HASH_BLOCK = 1024 * 1024
+EVICT_TO_RATIO = 0.9
+RESCAN_SECONDS = 300
+SEGMENTS_MANIFEST = "MANIFEST"  # число чанков в записи .segments
+
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    """Hardlink (без копирования байт); между файловыми системами — копия."""
+    try:
+        os.link(src, dest)
+    except OSError as e:
+        if isinstance(e, FileNotFoundError):
+            raise
+        shutil.copyfile(src, dest)
+
+
+def hash_file(path: Path) -> str:
+    """sha256 содержимого файла (читается блоками, без загрузки в память целиком)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(_HASH_BLOCK):
+            h.update(block)
+    return h.hexdigest()
+
+
+class AudioCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: int | None = None   # None — ещё не считали
+        self._scanned_at = 0.0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def transcript_key(audio_hash: str, language: str, model: str) -> str:
+        return hashlib.sha256(f"{audio_hash}|{language}|{model}".encode()).hexdigest()
+
+    def _path(self, name: str) -> Path:
+        # Раскладываем по подпапкам, чтобы не держать сотни тысяч файлов в одной
+        return self.root / name[:2] / name
+
+    def _hit(self, path: Path) -> bool:
+        try:
+            os.utime(path)  # LRU: обновляем mtime при каждом попадании
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get_transcript(self, key: str) -> str | None:
+        path = self._path(f"{key}.txt")
+        if not self._hit(path):
+            return None
+        try:
+            return path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None  # вытеснен между utime и чтением
+
+    def put_transcript(self, key: str, text: str) -> None:
+        self._write(f"{key}.txt", lambda tmp: tmp.write_text(text, encoding="utf-8"))
+
+    def get_segments(self, audio_hash: str) -> Path | None:
+        """Папка с нормализованными 5-минутными чанками (см. transcriber.normalize_audio)."""
+        path = self._path(f"{audio_hash}.segments")
+        return path if self._hit(path) else None
+
+    def link_segments(self, audio_hash: str, dest_dir: Path) -> bool:
+        """
+        Чанки из кэша → dest_dir (рабочая папка звонка). Звонок транскрибирует
+        свою копию: вытеснение записи кэша во время ASR её не трогает. False — промах.
+
+        Число чанков сверяется с манифестом записи: если запись вытесняли,
+        пока мы её копировали, набор может быть неполным — это промах.
+        """
+        src = self.get_segments(audio_hash)
+        if src is None:
+            return False
+        try:
+            expected = int((src / SEGMENTS_MANIFEST).read_text())
+        except (FileNotFoundError, ValueError):
+            return False  # вытеснена или записана до появления манифеста
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        dest_dir.mkdir(parents=True)
+        linked = 0
+        try:
+            for f in src.iterdir():
+                if f.name != SEGMENTS_MANIFEST:
+                    _link_or_copy(f, dest_dir / f.name)
+                    linked += 1
+        except FileNotFoundError:
+            pass
+        if linked == expected:
+            return True
+        log.info(f"Audio cache entry {audio_hash} incomplete ({linked}/{expected} chunks), re-normalizing")
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        return False
+
+    def put_segments(self, audio_hash: str, src_dir: Path) -> Path:
+        """
+        Кладёт папку чанков в кэш целиком (атомарно: temp-папка + rename)
+        вместе с манифестом — числом чанков для проверки в link_segments.
+        """
+        dest = self._path(f"{audio_hash}.segments")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=dest.parent, prefix=".tmp-"))
+        try:
+            chunks = 0
+            for f in src_dir.iterdir():
+                _link_or_copy(f, tmp / f.name)
+                chunks += 1
+            (tmp / SEGMENTS_MANIFEST).write_text(str(chunks))
+            size = self._entry_size(tmp)
+            replaced = self._size_if_exists(dest)
+            shutil.rmtree(dest, ignore_errors=True)
+            os.replace(tmp, dest)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._added(size - replaced)
+        return dest
+
+    def _write(self, name: str, writer) -> Path:
+        """Атомарная запись: temp-файл в той же папке + rename."""
+        dest = self._path(name)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=dest.parent, prefix=".tmp-")
+        os.close(fd)
+        tmp = Path(tmp_name)
+        try:
+            writer(tmp)
+            size = tmp.stat().st_size
+            replaced = self._size_if_exists(dest)
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self._added(size - replaced)
+        return dest
+
+    @staticmethod
+    def _entry_size(path: Path) -> int:
+        if path.is_dir():
+            return sum(f.stat().st_size for f in path.iterdir())
+        return path.stat().st_size
+
+    def _size_if_exists(self, path: Path) -> int:
+        try:
+            return self._entry_size(path)
+        except FileNotFoundError:
+            return 0
+
+    def _added(self, delta: int) -> None:
+        """Учитывает запись в размере кэша; полный обход — только когда он нужен."""
+        with self._lock:
+            if self._size is None or time.monotonic() - self._scanned_at > RESCAN_SECONDS:
+                self._evict(self._scan())
+            else:
+                self._size += delta
+                if self._size > self.max_bytes:
+                    self._evict(self._scan())
+
+    def _scan(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.root.glob("*/*"):
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                entries.append((path.stat().st_mtime, self._entry_size(path), path))
+            except FileNotFoundError:
+                continue
+        self._scanned_at = time.monotonic()
+        return entries
+
+    def _evict(self, entries: list[tuple[float, int, Path]]) -> None:
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICT_TO_RATIO
+            entries.sort()  # самые давно использованные — первыми
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+                total -= size
+                log.info(f"Audio cache evicted {path.name} ({size/1024:.0f} KB)")
+        self._size = total
+
+
+_cache: AudioCache | None = None
+
+
+def get_audio_cache() -> AudioCache | None:
+    """Общий на процесс экземпляр кэша; None, если кэш выключен."""
+    global _cache
+    if not settings.audio_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = AudioCache(Path(settings.audio_cache_dir), settings.audio_cache_max_mb * 1024 * 1024)
+    return _cache
@@ -0,0 +1,282 @@
+"""
+Batch-режим анализа через OpenAI Batch API для несрочных звонков (priority="batch").
+
+Пайплайн для таких звонков останавливается после транскрипции. Дальше:
+  1. submit_analysis_batch — собирает ожидающие звонки в JSONL (перевод или оценка,
+     в зависимости от стадии) и создаёт батч; calls.analysis_batch_id = id батча.
+  2. poll_analysis_batches — проверяет батчи; по готовности разбирает результаты,
+     чекпоинтит перевод/анализ и пачкой пишет questionnaire_responses.
+Звонок, которому нужен перевод, проходит два батча: translate, затем analyze.
+
+Звонки захватываются короткой транзакцией (analysis_batch_id = claim:<время>:<uuid>),
+запросы к OpenAI идут уже без блокировок строк; при сбое захват снимается.
+Из батча, завершившегося неуспешно (failed/expired/cancelled), применяется то,
+что успело выполниться. Звонки без результата или с ошибкой в строке батча
+переводятся на обычный путь (priority="normal", задача analyze_call).
+"""
+import json
+import logging
+import time
+import uuid
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import Call, QuestionnaireResponse
+from app.services import results_cache
+from app.services import analyzer
+from app.services.analyzer import (
+    EXPECTED_FIELDS,
+    needs_translation,
+    parse_scoring_response,
+    scoring_request,
+    translation_request,
+)
+from app.services.notifications import publish_call_event
+from app.services.operator_stats import answers_of, apply_questionnaire_changes
+
+log = logging.getLogger(__name__)
+
+# Files/Batches API идут мимо call_limited — повторы на сбоях оставляем SDK
+client = analyzer.client.with_options(max_retries=2)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+PENDING_BATCH_STATUSES = {"validating", "in_progress", "finalizing", "cancelling"}
+CLAIM_PREFIX = "claim:"
+# Захват без батча дольше этого — процесс упал между захватом и batches.create
+CLAIM_TIMEOUT_SECONDS = 3600
+# Анкет в одном INSERT: ~36 параметров на строку, у asyncpg лимит 32767 на запрос
+UPSERT_CHUNK_ROWS = 500
+
+
+def _batch_line(call: Call) -> dict:
+    """Строка JSONL для звонка: перевод, если он нужен и ещё не сделан, иначе оценка."""
+    if call.processing_stage == "transcribe" and needs_translation(call.language):
+        custom_id, body = f"translate:{call.id}", translation_request(call.transcript_text)
+    else:
+        body = (
+            scoring_request(call.translated_text) if call.translated_text
+            else scoring_request(call.transcript_text, call.language)
+        )
+        custom_id = f"analyze:{call.id}"
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+async def submit_analysis_batch() -> str | None:
+    """Отправляет накопленные звонки одним батчем. Возвращает id батча или None."""
+    claim = f"{CLAIM_PREFIX}{int(time.time())}:{uuid.uuid4().hex}"
+    async with AsyncSessionLocal() as db:
+        calls = (await db.scalars(
+            select(Call)
+            .where(
+                Call.priority == "batch",
+                Call.processing_status == "processing",
+                Call.analysis_batch_id.is_(None),
+                Call.processing_stage.in_(("transcribe", "translate")),
+            )
+            .order_by(Call.id)
+            .limit(settings.analysis_batch_max_size)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if not calls:
+            return None
+        # Захват — и сразу commit: загрузка файла в OpenAI идёт без блокировок строк
+        for call in calls:
+            call.analysis_batch_id = claim
+        await db.commit()
+
+        try:
+            payload = "\n".join(json.dumps(_batch_line(c), ensure_ascii=False) for c in calls)
+            batch_file = await client.files.create(
+                file=("analysis.jsonl", payload.encode("utf-8")),
+                purpose="batch",
+            )
+            batch = await client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window="24h",
+            )
+        except Exception:
+            await db.execute(update(Call).where(Call.analysis_batch_id == claim).values(analysis_batch_id=None))
+            await db.commit()
+            raise
+
+        await db.execute(update(Call).where(Call.analysis_batch_id == claim).values(analysis_batch_id=batch.id))
+        await db.commit()
+        log.info(f"Submitted analysis batch {batch.id} with {len(calls)} calls")
+        return batch.id
+
+
+async def poll_analysis_batches() -> int:
+    """Проверяет все батчи в работе. Возвращает число звонков, доведённых до done."""
+    async with AsyncSessionLocal() as db:
+        batch_ids = (await db.scalars(
+            select(Call.analysis_batch_id).where(Call.analysis_batch_id.is_not(None)).distinct()
+        )).all()
+
+        completed = 0
+        for batch_id in batch_ids:
+            if batch_id.startswith(CLAIM_PREFIX):
+                await _release_stale_claim(db, batch_id)
+                continue
+            # Сбой одного батча не должен блокировать разбор остальных
+            try:
+                completed += await _poll_batch(db, batch_id)
+            except Exception as exc:
+                await db.rollback()
+                log.error(f"Batch {batch_id} processing failed: {exc}", exc_info=True)
+        return completed
+
+
+async def _release_stale_claim(db, claim: str) -> None:
+    """Снимает захват, если submit_analysis_batch не дошёл до батча (процесс упал)."""
+    claimed_at = int(claim[len(CLAIM_PREFIX):].split(":", 1)[0])
+    if time.time() - claimed_at < CLAIM_TIMEOUT_SECONDS:
+        return
+    await db.execute(update(Call).where(Call.analysis_batch_id == claim).values(analysis_batch_id=None))
+    await db.commit()
+    log.warning(f"Released stale batch claim {claim}")
+
+
+async def _poll_batch(db, batch_id: str) -> int:
+    batch = await client.batches.retrieve(batch_id)
+    if batch.status in PENDING_BATCH_STATUSES:
+        return 0
+
+    calls = {
+        c.id: c for c in (await db.scalars(
+            select(Call).where(Call.analysis_batch_id == batch_id)
+        )).all()
+    }
+    if batch.status != "completed":
+        log.warning(f"Batch {batch_id} ended with status '{batch.status}', applying partial results")
+    # У expired/cancelled батча выполненные запросы тоже лежат в output/error файлах
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            results.update(await _read_results(file_id))
+    completed, failed = await _apply_results(db, calls, results)
+
+    requeued = []
+    for call in calls.values():
+        call.analysis_batch_id = None
+        if call.id in failed or not _has_result(call.id, results):
+            _to_normal_path(call, failed.get(call.id) or f"no result in batch {batch_id} ({batch.status})")
+            requeued.append(call)
+    await db.commit()
+    await results_cache.invalidate(*(c.id for c in calls.values() if c.processing_status == "done"))
+
+    for call in calls.values():
+        if call.processing_status == "done":
+            metrics.CALLS_FINISHED.labels("done").inc()
+            await publish_call_event(call, total_score=sum(1 for v in call.analysis_result.values() if v is True))
+    _enqueue_normal_path(requeued)
+    return completed
+
+
+def _has_result(call_id: int, results: dict[str, dict]) -> bool:
+    return f"translate:{call_id}" in results or f"analyze:{call_id}" in results
+
+
+def _to_normal_path(call: Call, reason: str) -> None:
+    """Звонок, который батч не довёл, анализируется обычной задачей analyze_call."""
+    log.warning(f"[call_id={call.id}] Batch analysis failed ({reason}), moving to the normal path")
+    call.priority = "normal"
+    call.processing_error = f"Batch analysis failed: {reason}"
+    call.stage_updated_at = func.now()
+
+
+def _enqueue_normal_path(calls: list[Call]) -> None:
+    from app.tasks import analyze_call
+
+    for call in calls:
+        try:
+            analyze_call.delay(call.id, call.audio_url, call.language)
+        except Exception as exc:
+            # priority уже normal — звонок подберёт requeue_stalled_calls
+            log.error(f"[call_id={call.id}] Failed to enqueue analyze_call: {exc}")
+
+
+async def _read_results(file_id: str) -> dict[str, dict]:
+    """custom_id → строка результата батча."""
+    content = await client.files.content(file_id)
+    results = {}
+    for line in content.text.splitlines():
+        if line.strip():
+            item = json.loads(line)
+            results[item["custom_id"]] = item
+    return results
+
+
+def _result_content(item: dict) -> str:
+    """Текст ответа модели из строки результата; RuntimeError если запрос в батче упал."""
+    response = item.get("response") or {}
+    if item.get("error") or response.get("status_code") != 200:
+        error = item.get("error") or response.get("body", {}).get("error")
+        raise RuntimeError(f"OpenAI batch request failed: {error}")
+    body = response["body"]
+    metrics.record_usage("openai_batch", body.get("model", ""), body.get("usage"))
+    return body["choices"][0]["message"]["content"]
+
+
+async def _apply_results(db, calls: dict[int, Call], results: dict[str, dict]) -> tuple[int, dict[int, str]]:
+    """(число сохранённых анкет, {call_id: ошибка} для строк батча, завершившихся ошибкой)."""
+    rows = []
+    failed = {}
+    for custom_id, item in results.items():
+        stage, _, raw_id = custom_id.partition(":")
+        call = calls.get(int(raw_id))
+        if call is None:
+            continue
+
+        try:
+            content = _result_content(item)
+            if stage == "translate":
+                call.translated_text = content
+                call.processing_stage = "translate"
+                continue
+            answers = parse_scoring_response(content)
+        except RuntimeError as exc:
+            log.error(f"[call_id={call.id}] Batch {stage} failed: {exc}")
+            failed[call.id] = str(exc)
+            continue
+
+        call.analysis_result = answers
+        call.processing_stage = "analyze"
+        rows.append({"call_id": call.id, "filled_by_ai": True, **answers})
+
+    if not rows:
+        return 0, failed
+
+    # Старые ответы нужны, чтобы rollup оператора не задвоился при перезаписи анкеты
+    existing = {
+        qr.call_id: answers_of(qr) for qr in (await db.scalars(
+            select(QuestionnaireResponse).where(QuestionnaireResponse.call_id.in_([r["call_id"] for r in rows]))
+        )).all()
+    }
+    await apply_questionnaire_changes(db, [
+        (calls[r["call_id"]].operator_id, calls[r["call_id"]].call_date, existing.get(r["call_id"]), r)
+        for r in rows
+    ])
+
+    # Сохранение анкет пачками по UPSERT_CHUNK_ROWS (idempotent: повтор обновит те же строки).
+    # Порядок по call_id — параллельные upsert'ы блокируют строки в одном порядке.
+    rows.sort(key=lambda r: r["call_id"])
+    for start in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        stmt = insert(QuestionnaireResponse).values(rows[start:start + UPSERT_CHUNK_ROWS])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[QuestionnaireResponse.call_id],
+            set_={**{f: stmt.excluded[f] for f in EXPECTED_FIELDS}, "updated_at": func.now()},
+        )
+        await db.execute(stmt)
+
+    for row in rows:
+        call = calls[row["call_id"]]
+        call.processing_status = "done"
+        call.processing_error = None
+        call.processing_stage = "save"
+    log.info(f"Saved {len(rows)} questionnaires from batch results")
+    return len(rows), failed
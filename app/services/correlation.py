@@ -0,0 +1,239 @@
+"""
+Какие пункты анкеты связаны с результатом заказа (approved / redeemed / avg_check).
+
+Для каждого вопроса и группы (все звонки, оператор, команда) сравниваются звонки,
+где пункт выполнен (yes), и где оценён, но не выполнен (no):
+  value — конверсия (approved/redeemed) или средний чек (avg_check),
+  ci    — 95% доверительный интервал (Wilson для долей, нормальный для среднего),
+  lift  — value_yes / value_no,  diff — value_yes - value_no.
+
+Загрузка: Postgres упаковывает 34 ответа в два bigint (бит на вопрос — «да» и
+«оценён») и отдаёт все звонки одной строкой массивов (array_agg); в NumPy биты
+распаковываются в булеву матрицу N×34. Дальше только векторные операции
+(матричное умножение по группам) — без циклов по звонкам и ORM-объектов.
+
+Результат кэшируется в Redis по версии outcomes (outcomes:version, растёт при
+каждом upsert outcomes) — пересчёт только после прихода новых результатов.
+"""
+import json
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from redis.exceptions import RedisError
+from sqlalchemy import BigInteger, ColumnElement, Float, Integer, case, cast, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.models import QUESTION_FIELDS, Call, Operator, Outcome, QuestionnaireResponse
+
+log = logging.getLogger(__name__)
+
+METRICS = ("approved", "redeemed", "avg_check")
+GROUPINGS = ("overall", "operator", "team")
+OUTCOMES_VERSION_KEY = "outcomes:version"
+MATMUL_CHUNK_ROWS = 65_536
+Z = 1.96   # 95%
+
+
+@dataclass
+class ScoreMatrix:
+    yes: np.ndarray          # bool N×34 — пункт выполнен
+    answered: np.ndarray     # bool N×34 — пункт оценён (не null)
+    operator_id: np.ndarray  # int64 N, -1 — без оператора
+    team: np.ndarray         # object N
+    outcomes: dict[str, np.ndarray]   # float64 N, NaN — нет значения
+
+
+def _bitmask(predicate) -> ColumnElement:
+    """Сумма 2^i по вопросам, где predicate(колонка) истинен, — бит на вопрос."""
+    return sum(
+        case((predicate(getattr(QuestionnaireResponse, q)), literal(1 << i, BigInteger)), else_=literal(0, BigInteger))
+        for i, q in enumerate(QUESTION_FIELDS)
+    )
+
+
+def _unpack(bits: np.ndarray) -> np.ndarray:
+    return (bits[:, None] >> np.arange(len(QUESTION_FIELDS), dtype=np.int64)) & 1 == 1
+
+
+async def load_matrix(db: AsyncSession, date_from: date | None = None, date_to: date | None = None) -> ScoreMatrix:
+    """Звонки с анкетой и outcome; date_from/date_to — включительно (UTC)."""
+    stmt = (
+        select(
+            _bitmask(lambda col: col.is_(True)).label("yes_bits"),
+            _bitmask(lambda col: col.is_not(None)).label("answered_bits"),
+            Call.operator_id,
+            Operator.team,
+            Outcome.approved,
+            Outcome.redeemed,
+            Outcome.avg_check,
+        )
+        .select_from(Call)
+        .join(QuestionnaireResponse, QuestionnaireResponse.call_id == Call.id)
+        .join(Outcome, Outcome.order_id == Call.order_id)
+        .outerjoin(Operator, Operator.id == Call.operator_id)
+    )
+    if date_from is not None:
+        stmt = stmt.where(Call.call_date >= datetime.combine(date_from, datetime.min.time(), timezone.utc))
+    if date_to is not None:
+        stmt = stmt.where(Call.call_date < datetime.combine(date_to + timedelta(days=1), datetime.min.time(), timezone.utc))
+
+    # Одна строка из колонок-массивов: asyncpg разбирает массивы в C, без объекта на звонок
+    rows = stmt.subquery()
+    yes_bits, answered_bits, operator_id, team, approved, redeemed, avg_check = (await db.execute(select(
+        func.array_agg(rows.c.yes_bits),
+        func.array_agg(rows.c.answered_bits),
+        func.array_agg(func.coalesce(rows.c.operator_id, -1)),
+        func.array_agg(rows.c.team),
+        func.array_agg(cast(cast(rows.c.approved, Integer), Float)),
+        func.array_agg(cast(cast(rows.c.redeemed, Integer), Float)),
+        func.array_agg(cast(rows.c.avg_check, Float)),
+    ))).one()
+    # None → NaN
+    outcomes = {m: np.array(v or [], dtype=np.float64) for m, v in zip(METRICS, (approved, redeemed, avg_check))}
+    return ScoreMatrix(
+        yes=_unpack(np.array(yes_bits or [], dtype=np.int64)),
+        answered=_unpack(np.array(answered_bits or [], dtype=np.int64)),
+        operator_id=np.array(operator_id or [], dtype=np.int64),
+        team=np.array(team or [], dtype=object),
+        outcomes=outcomes,
+    )
+
+
+@dataclass
+class _Groups:
+    keys: list
+    order: np.ndarray    # индексы звонков, отсортированные по группе
+    bounds: np.ndarray   # звонки группы g — order[bounds[g]:bounds[g + 1]]
+
+
+def _groups(matrix: ScoreMatrix, group_by: str) -> _Groups:
+    if group_by == "operator":
+        keys, inverse = np.unique(matrix.operator_id, return_inverse=True)
+        keys = [None if k == -1 else int(k) for k in keys]
+    elif group_by == "team":
+        keys, inverse = np.unique(np.where(matrix.team == None, "", matrix.team).astype(str), return_inverse=True)  # noqa: E711
+        keys = [k or None for k in keys]
+    else:
+        keys, inverse = [None], np.zeros(len(matrix.operator_id), dtype=np.int64)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+    return _Groups(keys, order, bounds)
+
+
+def _num(x: float) -> float | None:
+    return None if not np.isfinite(x) else round(float(x), 4)
+
+
+def _group_sums(groups: _Groups, mask: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Σ weights по звонкам mask для каждой группы и вопроса: (N×34, N×W) → G×34×W.
+    Звонки отсортированы по группе; на каждый кусок группы — одно матричное
+    умножение mask.T @ weights (BLAS). Куски по MATMUL_CHUNK_ROWS строк, чтобы
+    временная float-матрица не росла с N.
+    """
+    out = np.zeros((len(groups.keys), mask.shape[1], weights.shape[1]))
+    for g in range(len(groups.keys)):
+        for start in range(groups.bounds[g], groups.bounds[g + 1], MATMUL_CHUNK_ROWS):
+            idx = groups.order[start:min(start + MATMUL_CHUNK_ROWS, groups.bounds[g + 1])]
+            out[g] += mask[idx].T.astype(np.float64) @ weights[idx]
+    return out
+
+
+def _wilson(successes: np.ndarray, n: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    p = successes / n
+    denom = 1 + Z ** 2 / n
+    center = (p + Z ** 2 / (2 * n)) / denom
+    half = Z * np.sqrt(p * (1 - p) / n + Z ** 2 / (4 * n ** 2)) / denom
+    return center - half, center + half
+
+
+def _side(groups: _Groups, mask: np.ndarray, weights: np.ndarray, binary: bool) -> dict[str, np.ndarray]:
+    """n, value, ci для звонков mask (N×34) по группам → массивы G×34."""
+    sums = _group_sums(groups, mask, weights)
+    n, total, squares = sums[..., 0], sums[..., 1], sums[..., 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = total / n
+        if binary:
+            lo, hi = _wilson(total, n)
+        else:
+            std = np.sqrt(np.maximum(squares / n - value ** 2, 0) * n / (n - 1))
+            lo, hi = value - Z * std / np.sqrt(n), value + Z * std / np.sqrt(n)
+    return {"n": n, "value": value, "lo": lo, "hi": hi}
+
+
+def compute_correlation(matrix: ScoreMatrix, metric: str, group_by: str, min_calls: int = 0) -> dict:
+    y = matrix.outcomes[metric]
+    valid = ~np.isnan(y)
+    y = np.where(valid, y, 0.0)
+    # Веса: [звонок с метрикой, значение, квадрат значения] — n, сумма и Σx² одним умножением
+    weights = np.column_stack([valid, y, y ** 2])
+    binary = metric != "avg_check"
+
+    groups = _groups(matrix, group_by)
+    yes = _side(groups, matrix.yes, weights, binary)
+    no = _side(groups, matrix.answered & ~matrix.yes, weights, binary)
+    calls = np.add.reduceat(valid[groups.order], groups.bounds[:-1], dtype=np.int64) if len(y) else np.zeros(len(groups.keys))
+    total = np.add.reduceat(y[groups.order], groups.bounds[:-1]) if len(y) else np.zeros(len(groups.keys))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        base = total / calls
+        lift = yes["value"] / no["value"]
+        diff = yes["value"] - no["value"]
+
+    result = []
+    for g, key in enumerate(groups.keys):
+        if calls[g] < max(min_calls, 1):
+            continue
+        result.append({
+            "key": key,
+            "calls": int(calls[g]),
+            "value": _num(base[g]),
+            "questions": {
+                q: {
+                    "yes": {"n": int(yes["n"][g, i]), "value": _num(yes["value"][g, i]),
+                            "ci": [_num(yes["lo"][g, i]), _num(yes["hi"][g, i])]},
+                    "no": {"n": int(no["n"][g, i]), "value": _num(no["value"][g, i]),
+                           "ci": [_num(no["lo"][g, i]), _num(no["hi"][g, i])]},
+                    "lift": _num(lift[g, i]),
+                    "diff": _num(diff[g, i]),
+                }
+                for i, q in enumerate(QUESTION_FIELDS)
+            },
+        })
+    return {"metric": metric, "group_by": group_by, "calls": int(valid.sum()), "groups": result}
+
+
+# --------------------------------------------------------------------------- #
+# Кэш по версии outcomes
+# --------------------------------------------------------------------------- #
+async def bump_outcomes_version() -> None:
+    """Вызывать после commit изменения outcomes — закэшированная аналитика устаревает."""
+    try:
+        await get_redis().incr(OUTCOMES_VERSION_KEY)
+    except RedisError as e:
+        log.warning(f"Failed to bump outcomes version: {e}")
+
+
+async def cached(key: str):
+    try:
+        redis = get_redis()
+        version = await redis.get(OUTCOMES_VERSION_KEY) or "0"
+        raw = await redis.get(f"analytics:{version}:{key}")
+    except RedisError as e:
+        log.warning(f"Analytics cache unavailable: {e}")
+        return None, None
+    return version, json.loads(raw) if raw is not None else None
+
+
+async def store(version: str | None, key: str, value: dict) -> None:
+    if version is None:
+        return
+    try:
+        await get_redis().set(
+            f"analytics:{version}:{key}", json.dumps(value, ensure_ascii=False), ex=settings.analytics_cache_ttl
+        )
+    except RedisError as e:
+        log.warning(f"Analytics cache unavailable: {e}")
@@ -0,0 +1,156 @@
+"""
+Потоковая выгрузка оценённых звонков для BI: анкета (34 ответа + баллы)
+вместе с outcomes, в CSV или Parquet.
+
+Строки читаются server-side курсором (AsyncSession.stream + yield_per)
+пачками по EXPORT_BATCH_ROWS и сразу сериализуются — память не зависит
+от числа строк. Используется в GET /exports/calls и scripts/export_calls.py.
+
+Parquet требует pyarrow (опциональная зависимость: pip install pyarrow).
+"""
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import Select, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.models import QUESTION_FIELDS, SECTIONS, Call, Operator, Outcome, QuestionnaireResponse
+
+EXPORT_BATCH_ROWS = 5000
+
+EXPORT_COLUMNS = {
+    "call_id": Call.id,
+    "order_id": Call.order_id,
+    "operator_id": Call.operator_id,
+    "operator_name": Operator.name,
+    "operator_team": Operator.team,
+    "call_date": Call.call_date,
+    "duration_sec": Call.duration_sec,
+    "language": Call.language,
+    "total_score": QuestionnaireResponse.total_score,
+    **{f"s{n}_score": getattr(QuestionnaireResponse, f"s{n}_score") for n in SECTIONS},
+    **{q: getattr(QuestionnaireResponse, q) for q in QUESTION_FIELDS},
+    "filled_by_ai": QuestionnaireResponse.filled_by_ai,
+    "corrected_by_human": QuestionnaireResponse.corrected_by_human,
+    "approved": Outcome.approved,
+    "redeemed": Outcome.redeemed,
+    "avg_check": Outcome.avg_check,
+}
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def export_query(
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    operator_id: int | None = None,
+) -> Select:
+    """Звонки с анкетой; date_from включительно, date_to — нет."""
+    stmt = (
+        select(*(col.label(name) for name, col in EXPORT_COLUMNS.items()))
+        .select_from(Call)
+        .join(QuestionnaireResponse, QuestionnaireResponse.call_id == Call.id)
+        .outerjoin(Operator, Operator.id == Call.operator_id)
+        .outerjoin(Outcome, Outcome.order_id == Call.order_id)
+        .order_by(Call.call_date, Call.id)
+    )
+    if date_from is not None:
+        stmt = stmt.where(Call.call_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Call.call_date < date_to)
+    if operator_id is not None:
+        stmt = stmt.where(Call.operator_id == operator_id)
+    return stmt
+
+
+async def _partitions(stmt: Select):
+    """Пачки строк из server-side курсора (своя сессия — живёт, пока идёт выгрузка)."""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+        async for partition in result.partitions():
+            yield partition
+
+
+async def csv_chunks(stmt: Select):
+    """CSV: заголовок, затем по куску байт на пачку строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for rows in _partitions(stmt):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+class _DrainSink(io.RawIOBase):
+    """Файл-приёмник для ParquetWriter: копит записанное до очередного drain()."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _parquet_schema(pa):
+    types = {
+        "call_id": pa.int32(), "operator_id": pa.int32(), "duration_sec": pa.int32(),
+        "call_date": pa.timestamp("us", tz="UTC"),
+        "avg_check": pa.decimal128(10, 2),
+        "order_id": pa.string(), "operator_name": pa.string(), "operator_team": pa.string(), "language": pa.string(),
+    }
+    return pa.schema([
+        (name, types.get(name, pa.int16() if name.endswith("_score") else pa.bool_()))
+        for name in EXPORT_COLUMNS
+    ])
+
+
+async def parquet_chunks(stmt: Select):
+    """Parquet: row group на пачку строк, байты отдаются по мере записи."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+
+    schema = _parquet_schema(pa)
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for rows in _partitions(stmt):
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(fmt: str, stmt: Select):
+    if fmt == "parquet":
+        return parquet_chunks(stmt)
+    return csv_chunks(stmt)
+
+
+def pyarrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,93 @@
+"""
+События завершения обработки звонка (status → done / error).
+
+Каждое событие:
+  1. публикуется в Redis pub/sub (канал CALL_EVENTS_CHANNEL) — из него читает
+     SSE-поток GET /calls/events;
+  2. если у звонка есть callback_url — ставится Celery-задача deliver_webhook:
+     POST JSON с HMAC-SHA256 подписью, повторы с экспоненциальным backoff.
+
+Подпись (если задан settings.webhook_secret):
+    X-Vladtrans-Timestamp: <unix time>
+    X-Vladtrans-Signature: sha256=<hex hmac(secret, "<timestamp>.<body>")>
+Получатель пересчитывает HMAC по сырому телу и отбрасывает старые timestamp.
+
+Статус error не всегда окончательный: Celery может повторить задачу,
+и следом придёт done. Актуален последний полученный статус.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+import weakref
+from datetime import datetime, timezone
+
+import httpx
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.models import Call
+
+log = logging.getLogger(__name__)
+
+CALL_EVENTS_CHANNEL = "calls:events"
+
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def call_event(call: Call, total_score: int | None = None) -> dict:
+    return {
+        "event": f"call.{call.processing_status}",
+        "call_id": call.id,
+        "order_id": call.order_id,
+        "status": call.processing_status,
+        "total_score": total_score,
+        "error": call.processing_error,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+async def publish_call_event(call: Call, total_score: int | None = None) -> None:
+    """Вызывается после commit статуса done/error. Ошибки доставки не роняют пайплайн."""
+    event = call_event(call, total_score)
+    try:
+        await get_redis().publish(CALL_EVENTS_CHANNEL, json.dumps(event, ensure_ascii=False))
+    except RedisError as e:
+        log.warning(f"[call_id={call.id}] Failed to publish call event: {e}")
+
+    if call.callback_url:
+        from app.tasks import deliver_webhook
+        try:
+            deliver_webhook.delay(call.callback_url, event)
+        except Exception as e:
+            log.error(f"[call_id={call.id}] Failed to enqueue webhook: {e}")
+
+
+def sign_payload(body: bytes, timestamp: int) -> str:
+    digest = hmac.new(settings.webhook_secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256)
+    return f"sha256={digest.hexdigest()}"
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=settings.webhook_timeout, follow_redirects=False)
+        _http_clients[loop] = client
+    return client
+
+
+async def deliver_webhook(url: str, event: dict) -> None:
+    """Один POST на callback_url; исключение при сетевой ошибке или не-2xx ответе."""
+    body = json.dumps(event, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json", "X-Vladtrans-Event": event["event"]}
+    if settings.webhook_secret:
+        timestamp = int(time.time())
+        headers["X-Vladtrans-Timestamp"] = str(timestamp)
+        headers["X-Vladtrans-Signature"] = sign_payload(body, timestamp)
+
+    response = await _get_http_client().post(url, content=body, headers=headers)
+    response.raise_for_status()
@@ -0,0 +1,85 @@
+"""
+Инкрементальное обновление rollup-таблицы operator_daily_stats.
+
+Вызывается в той же транзакции, что и сохранение анкеты: к строке (оператор, день)
+прибавляются новые ответы и вычитаются старые (если анкета перезаписывается),
+поэтому повторный анализ и ручная правка не задваивают счётчики.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import QUESTION_FIELDS, OperatorDailyStats
+
+COUNTER_COLUMNS = (
+    "calls_count", "score_sum",
+    *(f"{q}_{kind}" for q in QUESTION_FIELDS for kind in ("yes", "total")),
+)
+# Строк (оператор, день) в одном INSERT: ~72 параметра на строку, у asyncpg лимит 32767
+UPSERT_CHUNK_ROWS = 400
+
+
+def answers_of(qr) -> dict | None:
+    """Ответы анкеты ORM-объекта в виде словаря (None, если анкеты нет)."""
+    if qr is None:
+        return None
+    return {q: getattr(qr, q) for q in QUESTION_FIELDS}
+
+
+def _counters(answers: dict | None) -> dict[str, int]:
+    if answers is None:
+        return dict.fromkeys(COUNTER_COLUMNS, 0)
+    counters = {"calls_count": 1, "score_sum": sum(1 for q in QUESTION_FIELDS if answers.get(q) is True)}
+    for q in QUESTION_FIELDS:
+        counters[f"{q}_yes"] = int(answers.get(q) is True)
+        counters[f"{q}_total"] = int(answers.get(q) is not None)
+    return counters
+
+
+def _day(call_date: datetime):
+    if call_date.tzinfo is None:
+        return call_date.date()
+    return call_date.astimezone(timezone.utc).date()
+
+
+async def apply_questionnaire_changes(
+    db: AsyncSession,
+    changes: list[tuple[int | None, datetime, dict | None, dict | None]],
+) -> None:
+    """
+    changes — список (operator_id, call_date, старые ответы, новые ответы).
+    Дельты суммируются по (оператор, день) и пишутся INSERT ... ON CONFLICT пачками
+    по UPSERT_CHUNK_ROWS, отсортированными по (оператор, день): параллельные
+    транзакции блокируют строки в одном порядке и не ловят deadlock.
+    Звонки без оператора пропускаются.
+    """
+    deltas: dict[tuple, dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+    for operator_id, call_date, old, new in changes:
+        if operator_id is None:
+            continue
+        delta = deltas[(operator_id, _day(call_date))]
+        before, after = _counters(old), _counters(new)
+        for col in COUNTER_COLUMNS:
+            delta[col] += after[col] - before[col]
+
+    if not deltas:
+        return
+
+    rows = [
+        {"operator_id": operator_id, "day": day, **delta}
+        for (operator_id, day), delta in sorted(deltas.items())
+    ]
+    table = OperatorDailyStats.__table__
+    for start in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        stmt = insert(OperatorDailyStats).values(rows[start:start + UPSERT_CHUNK_ROWS])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.operator_id, table.c.day],
+            set_={
+                **{col: table.c[col] + stmt.excluded[col] for col in COUNTER_COLUMNS},
+                "updated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
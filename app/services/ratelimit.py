@@ -0,0 +1,231 @@
+"""
+Клиентский rate limiting для Groq и OpenAI.
+
+Два уровня:
+  1. Token bucket в Redis (общий для всех воркеров и API): запросы в минуту (rpm)
+     и «токены» в минуту (tpm). Для OpenAI токены — оценка токенов запроса,
+     для Groq — секунды аудио. Списание из обоих ведер атомарно (Lua-скрипт).
+  2. Адаптивная конкурентность в процессе (AIMD): лимит одновременных запросов
+     делится пополам на каждый 429 и растёт на 1 после серии успешных запросов.
+Так пропускная способность держится у потолка провайдера, а не скачет между
+пачкой 429 и простоем.
+
+Если Redis недоступен — лимитер пропускает запросы (fail open), AIMD продолжает работать.
+"""
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+
+from redis.exceptions import RedisError
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.redis import get_redis, lua_script
+
+log = logging.getLogger(__name__)
+
+# KEYS — ведра, ARGV — пары (ёмкость в минуту, запрошено) на каждое ведро.
+# Возвращает 0, если всё списано, иначе сколько мс ждать (ничего не списывается).
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local wait = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[2 * i - 1])
+  local requested = math.min(tonumber(ARGV[2 * i]), capacity)
+  local rate = capacity / 60000.0
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(state[1]) or capacity
+  local ts = tonumber(state[2]) or now
+  tokens = math.min(capacity, tokens + (now - ts) * rate)
+  levels[i] = tokens
+  if tokens < requested then
+    wait = math.max(wait, (requested - tokens) / rate)
+  end
+end
+for i, key in ipairs(KEYS) do
+  local tokens = levels[i]
+  if wait == 0 then
+    tokens = tokens - math.min(tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i - 1]))
+  end
+  redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+  redis.call('PEXPIRE', key, 120000)
+end
+return math.ceil(wait)
+"""
+TOKEN_BUCKET_SCRIPT = lua_script(TOKEN_BUCKET_LUA)
+
+
+class TokenBucket:
+    """Общие для всех процессов ведра rpm/tpm провайдера в Redis."""
+
+    def __init__(self, provider: str, rpm: int, tpm: int):
+        self.provider = provider
+        self.rpm = rpm
+        self.tpm = tpm
+
+    async def acquire(self, tokens: int = 0) -> None:
+        keys, args = [], []
+        if self.rpm > 0:
+            keys.append(f"ratelimit:{self.provider}:rpm")
+            args += [self.rpm, 1]
+        if self.tpm > 0 and tokens > 0:
+            keys.append(f"ratelimit:{self.provider}:tpm")
+            args += [self.tpm, tokens]
+        if not keys:
+            return
+
+        redis = get_redis()
+        while True:
+            try:
+                wait_ms = int(await TOKEN_BUCKET_SCRIPT(keys=keys, args=args, client=redis))
+            except RedisError as e:
+                log.warning(f"Rate limiter unavailable ({e}) — proceeding without {self.provider} limit")
+                return
+            if wait_ms <= 0:
+                return
+            # Джиттер, чтобы воркеры не просыпались синхронно
+            await asyncio.sleep(wait_ms / 1000 * (1 + random.random() * 0.1))
+
+
+class AdaptiveConcurrency:
+    """AIMD-лимит одновременных запросов в процессе."""
+
+    def __init__(self, provider: str, maximum: int, minimum: int = 1):
+        self.provider = provider
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._cond: asyncio.Condition | None = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self) -> None:
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+
+    def on_rate_limited(self) -> None:
+        new_limit = max(self.minimum, self.limit // 2)
+        if new_limit != self.limit:
+            log.warning(f"{self.provider}: 429 — concurrency {self.limit} → {new_limit}")
+        self.limit = new_limit
+        self._successes = 0
+
+
+class ProviderLimiter:
+    def __init__(self, provider: str, rpm: int, tpm: int, max_concurrency: int):
+        self.bucket = TokenBucket(provider, rpm, tpm)
+        self.concurrency = AdaptiveConcurrency(provider, max_concurrency)
+
+
+_limiters: dict[str, ProviderLimiter] = {}
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    if provider not in _limiters:
+        if provider == "groq":
+            _limiters[provider] = ProviderLimiter(
+                "groq", settings.groq_rpm, settings.groq_audio_seconds_per_minute, settings.groq_max_concurrency
+            )
+        elif provider == "openai":
+            _limiters[provider] = ProviderLimiter(
+                "openai", settings.openai_rpm, settings.openai_tpm, settings.openai_max_concurrency
+            )
+        else:
+            raise ValueError(f"Unknown provider: {provider!r}")
+    return _limiters[provider]
+
+
+def sdk_max_retries() -> int:
+    """
+    max_retries для SDK-клиентов, чьи запросы идут через call_limited. Свои повторы
+    SDK на 429 прячут троттлинг от AdaptiveConcurrency (она снижает лимит поздно
+    и недосчитывает 429), поэтому при включённом лимитере их нет: 429 повторяет
+    call_limited, остальные ошибки — retry задачи Celery. Без лимитера — дефолт SDK.
+    """
+    return 0 if settings.rate_limit_enabled else 2
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    """429 от Groq или OpenAI SDK (оба выставляют status_code)."""
+    return getattr(exc, "status_code", None) == 429
+
+
+def _retry_after(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+async def call_limited(provider: str, make_call, tokens: int = 0, operation: str = "request"):
+    """
+    Выполняет make_call() (корутину-фабрику) под лимитами провайдера.
+    На 429 уменьшает конкурентность и повторяет с backoff (до settings.rate_limit_retries раз).
+    operation — метка запроса в метриках (transcribe_chunk, translate, score, ...).
+    """
+    if not settings.rate_limit_enabled:
+        return await _timed_call(provider, operation, make_call)
+
+    limiter = get_limiter(provider)
+    attempt = 0
+    while True:
+        waiting = time.perf_counter()
+        async with limiter.concurrency.slot():
+            await limiter.bucket.acquire(tokens)
+            metrics.PROVIDER_WAIT.labels(provider).observe(time.perf_counter() - waiting)
+            try:
+                result = await _timed_call(provider, operation, make_call)
+            except Exception as exc:
+                if not is_rate_limit_error(exc) or attempt >= settings.rate_limit_retries:
+                    raise
+                limiter.concurrency.on_rate_limited()
+                delay = _retry_after(exc) or min(2 ** attempt, 30)
+            else:
+                limiter.concurrency.on_success()
+                return result
+        attempt += 1
+        log.info(f"{provider}: rate limited, retry {attempt}/{settings.rate_limit_retries} in {delay:.1f}s")
+        await asyncio.sleep(delay * (1 + random.random() * 0.2))
+
+
+async def _timed_call(provider: str, operation: str, make_call):
+    in_flight = metrics.PROVIDER_IN_FLIGHT.labels(provider)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        return await make_call()
+    except Exception as exc:
+        if is_rate_limit_error(exc):
+            metrics.PROVIDER_RATE_LIMITED.labels(provider).inc()
+        raise
+    finally:
+        metrics.PROVIDER_REQUEST_DURATION.labels(provider, operation).observe(time.perf_counter() - started)
+        in_flight.dec()
+
+
+def estimate_tokens(request: dict) -> int:
+    """Грубая оценка токенов chat-запроса: ~3 символа на токен + запас на ответ."""
+    chars = sum(len(m["content"]) for m in request["messages"])
+    return chars // 3 + 1000
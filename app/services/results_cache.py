@@ -0,0 +1,115 @@
+"""
+Read-through кэш результатов done-звонков в Redis (GET /calls/{id}/results).
+
+Результат готового звонка меняется только при пересохранении анкеты
+(повторный анализ, batch) или ручной правке — там запись явно удаляется
+(invalidate). TTL — страховка от пропущенной инвалидации.
+Хранится готовый JSON ответа вместе с ETag/Last-Modified.
+
+Гонка «GET прочитал БД до commit правки, а положил в кэш после invalidate»
+закрыта версией звонка (results_version:{id}, INCR при каждой invalidate):
+get возвращает версию вместе с записью, put пишет только если версия с тех
+пор не менялась (проверка и SET — одним Lua-скриптом).
+
+Счётчики попаданий/промахов общие для всех процессов API — INCR делается
+внутри того же скрипта, что и чтение, без лишнего round trip.
+Если Redis недоступен — читаем из Postgres как без кэша.
+"""
+import json
+import logging
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis, lua_script
+
+log = logging.getLogger(__name__)
+
+KEY_PREFIX = "results:"
+VERSION_PREFIX = "results_version:"
+HITS_KEY = "results_cache:hits"
+MISSES_KEY = "results_cache:misses"
+
+# KEYS — запись, версия, hits, misses. Возвращает {запись или nil, версия}.
+GET_LUA = """
+local raw = redis.call('GET', KEYS[1])
+if raw then redis.call('INCR', KEYS[3]) else redis.call('INCR', KEYS[4]) end
+return {raw, redis.call('GET', KEYS[2]) or '0'}
+"""
+
+# KEYS — запись, версия; ARGV — версия на момент чтения БД, JSON, TTL.
+# Пишет, только если invalidate с тех пор не вызывался.
+PUT_LUA = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+  return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+return 1
+"""
+
+GET_SCRIPT = lua_script(GET_LUA)
+PUT_SCRIPT = lua_script(PUT_LUA)
+
+
+def _keys(call_id: int) -> list[str]:
+    return [f"{KEY_PREFIX}{call_id}", f"{VERSION_PREFIX}{call_id}"]
+
+
+async def get(call_id: int) -> tuple[str | None, dict | None]:
+    """(версия, запись). Версию передать в put — даже при промахе."""
+    if not settings.results_cache_enabled:
+        return None, None
+    redis = get_redis()
+    try:
+        raw, version = await GET_SCRIPT(keys=[*_keys(call_id), HITS_KEY, MISSES_KEY], client=redis)
+    except RedisError as e:
+        log.warning(f"Results cache unavailable: {e}")
+        return None, None
+    return version, json.loads(raw) if raw is not None else None
+
+
+async def put(version: str | None, call_id: int, entry: dict) -> None:
+    """entry — {"body": JSON-совместимый ответ, "headers": {...}}; version — из get до чтения БД."""
+    if version is None:
+        return
+    redis = get_redis()
+    try:
+        await PUT_SCRIPT(
+            keys=_keys(call_id),
+            args=[version, json.dumps(entry, ensure_ascii=False), settings.results_cache_ttl],
+            client=redis,
+        )
+    except RedisError as e:
+        log.warning(f"Results cache unavailable: {e}")
+
+
+async def invalidate(*call_ids: int) -> None:
+    """Вызывать после commit изменения анкеты."""
+    if not settings.results_cache_enabled or not call_ids:
+        return
+    try:
+        pipe = get_redis().pipeline()
+        for call_id in call_ids:
+            key, version_key = _keys(call_id)
+            # Версия — до удаления: put, прочитавший БД раньше, уже не запишет старое.
+            # TTL версии с запасом перекрывает окно между get и put одного запроса.
+            pipe.incr(version_key)
+            pipe.expire(version_key, settings.results_cache_ttl)
+            pipe.delete(key)
+        await pipe.execute()
+    except RedisError as e:
+        log.warning(f"Results cache invalidation failed for {call_ids}: {e}")
+
+
+async def stats() -> dict:
+    try:
+        hits, misses = await get_redis().mget(HITS_KEY, MISSES_KEY)
+    except RedisError as e:
+        return {"enabled": settings.results_cache_enabled, "error": str(e)}
+    hits, misses = int(hits or 0), int(misses or 0)
+    return {
+        "enabled": settings.results_cache_enabled,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+    }
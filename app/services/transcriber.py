@@ -1,13 +1,34 @@
+import asyncio
 import logging
 import os
+import shutil
+import subprocess
 import tempfile
+import weakref
 from pathlib import Path
 
 import httpx
 
+from app.core import metrics
+from app.core.config import settings
+from app.services.audio_cache import get_audio_cache, hash_file
+from app.services.ratelimit import call_limited, sdk_max_retries
+
 log = logging.getLogger(__name__)
 
-MAX_FILE_SIZE_MB = 24  # Whisper limit is 25 MB
+DOWNLOAD_BLOCK_SIZE = 256 * 1024
+SEGMENT_SECONDS = 300  # 5-min chunks: Groq стабильнее на коротких кусках, и каждый < 25 МБ лимита Whisper
+
+GROQ_MODEL = "whisper-large-v3"
+OPENAI_TRANSLATION_MODEL = "whisper-1"
+
+# Контекстный промпт помогает Whisper точнее транскрибировать
+# и не путать языки в начале звонка (автодозвонщик на русском/английском)
+GROQ_CONTEXT_PROMPT = (
+    "Call center phone conversation. "
+    "Operator offers health products to a client."
+)
+PREV_TEXT_CHARS = 200  # сколько символов предыдущего чанка идёт в prompt
 
 # Groq поддерживает Georgian и ещё 98 языков (whisper-large-v3).
 # Для языков НЕ поддерживаемых Groq используем OpenAI translations → English.
@@ -25,205 +46,345 @@ GROQ_SUPPORTED_LANGUAGES = {
 }
 
 
+# SDK-клиенты на event loop: их пул соединений httpx привязан к loop, а новый клиент
+# на каждый чанк — это новый пул, который никто не закрывает
+_groq_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_openai_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
 def _get_groq_client():
-    """Создаёт Groq клиент. Требует GROQ_API_KEY в окружении."""
-    try:
-        from groq import Groq
-        return Groq(api_key=os.environ["GROQ_API_KEY"], timeout=120.0)
-    except ImportError:
-        raise RuntimeError("groq package not installed. Run: pip install groq")
-    except KeyError:
-        raise RuntimeError("GROQ_API_KEY not set in environment")
+    """Async Groq клиент на текущий event loop. Требует GROQ_API_KEY в окружении."""
+    loop = asyncio.get_running_loop()
+    client = _groq_clients.get(loop)
+    if client is None:
+        try:
+            from groq import AsyncGroq
+            client = AsyncGroq(
+                api_key=os.environ["GROQ_API_KEY"], base_url=settings.groq_base_url, timeout=120.0,
+                max_retries=sdk_max_retries(),
+            )
+        except ImportError:
+            raise RuntimeError("groq package not installed. Run: pip install groq")
+        except KeyError:
+            raise RuntimeError("GROQ_API_KEY not set in environment")
+        _groq_clients[loop] = client
+    return client
 
 
 def _get_openai_client():
-    from openai import OpenAI
-    return OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(
+            api_key=os.environ["OPENAI_API_KEY"], base_url=settings.openai_base_url, max_retries=sdk_max_retries()
+        )
+        _openai_clients[loop] = client
+    return client
+
+
+async def _run_ffmpeg(*args: str) -> None:
+    """Запускает ffmpeg как subprocess без блокировки event loop."""
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, ["ffmpeg", *args], stdout, stderr)
 
 
-def transcribe_audio(audio_source: str | Path, language: str = "ka") -> str:
+async def transcribe_audio(audio_source: str | Path, language: str = "ka") -> str:
     """
     Транскрибирует аудио через Groq Whisper large-v3 (основной провайдер).
     Если язык не поддерживается Groq — fallback на OpenAI translations → English.
     Принимает локальный путь или HTTP(S) URL.
-    Если файл > 24 МБ — нарезает на чанки через ffmpeg.
-    """
-    source = str(audio_source)
 
-    if source.startswith("http://") or source.startswith("https://"):
-        return _transcribe_url(source, language)
+    Выполняет все стадии подряд: download → normalize → transcribe.
+    Пайплайн Celery (app.tasks) вызывает стадии по отдельности и чекпоинтит каждую.
+    Результат кэшируется по хэшу аудио (см. audio_cache) — до ffmpeg и Groq.
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix="vladtrans-"))
+    try:
+        audio_path = await download_audio(str(audio_source), work_dir)
+        audio_hash = await hash_audio(audio_path)
+        cached = await cached_transcript(audio_hash, language)
+        if cached is not None:
+            return cached
+
+        segments_dir = await normalize_audio(audio_path, work_dir, audio_hash)
+        transcript = await transcribe_segments(segments_dir, language)
+        await cache_transcript(audio_hash, language, transcript)
+        return transcript
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
-    return _transcribe_file(Path(source), language)
 
+# --------------------------------------------------------------------------- #
+# Стадия download
+# --------------------------------------------------------------------------- #
+async def download_audio(source: str, work_dir: Path) -> Path:
+    """
+    HTTP(S) URL — скачивает в work_dir и возвращает путь.
+    Локальный путь возвращает как есть (без копирования).
+    """
+    if not (source.startswith("http://") or source.startswith("https://")):
+        return Path(source)
 
-def _transcribe_url(url: str, language: str) -> str:
-    """Скачивает аудио по URL во временный файл и транскрибирует."""
-    clean_url = url.split("?")[0]
+    clean_url = source.split("?")[0]
     suffix = "." + clean_url.rsplit(".", 1)[-1] if "." in clean_url else ".mp3"
     if len(suffix) > 5:
         suffix = ".mp3"
 
-    with httpx.Client(timeout=120) as http:
-        response = http.get(url)
-        response.raise_for_status()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    out_path = work_dir / f"source{suffix}"
+    try:
+        await _stream_download(source, out_path)
+    except BaseException:
+        out_path.unlink(missing_ok=True)
+        raise
+    log.info(f"Downloaded {out_path.stat().st_size/1024:.0f} KB from {clean_url}")
+    return out_path
 
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-        tmp.write(response.content)
-        tmp_path = Path(tmp.name)
 
-    try:
-        return _transcribe_file(tmp_path, language)
-    finally:
-        tmp_path.unlink(missing_ok=True)
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
 
 
-def _transcribe_file(audio_path: Path, language: str) -> str:
-    file_size_mb = audio_path.stat().st_size / (1024 * 1024)
+def _get_http_client() -> httpx.AsyncClient:
+    """Общий HTTP-клиент на event loop: пул keep-alive соединений к АТС/CDN."""
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(120, connect=10),
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+        _http_client_loop = loop
+    return _http_client
 
-    if file_size_mb <= MAX_FILE_SIZE_MB:
-        return _transcribe_single(audio_path, language)
-    else:
-        return _transcribe_chunked(audio_path, language)
 
+async def _stream_download(url: str, out_path: Path) -> None:
+    """
+    Пишет ответ на диск блоками, не держа файл в памяти.
+    Лимит размера — settings.download_max_mb. При обрыве соединения докачивает
+    с места обрыва через HTTP Range (если сервер не отдал 206 — качает заново).
+    """
+    max_bytes = settings.download_max_mb * 1024 * 1024
+    http = _get_http_client()
+    written = 0
+    attempt = 0
+
+    with open(out_path, "wb") as f:
+        while True:
+            headers = {"Range": f"bytes={written}-"} if written else {}
+            try:
+                async with http.stream("GET", url, headers=headers) as response:
+                    response.raise_for_status()
+                    if written and response.status_code != 206:
+                        log.warning(f"Server ignored Range for {url} — restarting download")
+                        f.seek(0)
+                        f.truncate()
+                        written = 0
+
+                    length = response.headers.get("content-length")
+                    if length is not None and written + int(length) > max_bytes:
+                        raise ValueError(
+                            f"Audio too large: {(written + int(length)) / 1024 / 1024:.0f} MB "
+                            f"> {settings.download_max_mb} MB"
+                        )
+
+                    async for block in response.aiter_bytes(DOWNLOAD_BLOCK_SIZE):
+                        written += len(block)
+                        if written > max_bytes:
+                            raise ValueError(f"Audio too large: > {settings.download_max_mb} MB")
+                        f.write(block)
+                return
+            except httpx.TransportError as exc:
+                attempt += 1
+                if attempt > settings.download_retries:
+                    raise
+                log.warning(
+                    f"Download interrupted at {written} bytes ({exc!r}), "
+                    f"resuming ({attempt}/{settings.download_retries})"
+                )
+                await asyncio.sleep(min(2 ** attempt, 10))
 
-def _transcribe_single(audio_path: Path, language: str) -> str:
-    if language in GROQ_SUPPORTED_LANGUAGES:
-        return _transcribe_groq(audio_path, language)
-    else:
-        log.warning(f"Language '{language}' not supported by Groq — falling back to OpenAI translations")
-        return _transcribe_openai_translation(audio_path)
 
+async def hash_audio(audio_path: Path) -> str:
+    """sha256 исходного аудио — ключ кэша (файл читается в отдельном потоке)."""
+    return await asyncio.to_thread(hash_file, audio_path)
 
-def _normalize_audio(audio_path: Path) -> Path:
+
+def _transcription_model(language: str) -> str:
+    return GROQ_MODEL if language in GROQ_SUPPORTED_LANGUAGES else OPENAI_TRANSLATION_MODEL
+
+
+async def cached_transcript(audio_hash: str, language: str) -> str | None:
+    """Транскрипт из кэша по sha256 аудио + язык + модель (None — промах или кэш выключен)."""
+    cache = get_audio_cache()
+    if cache is None:
+        return None
+    key = cache.transcript_key(audio_hash, language, _transcription_model(language))
+    transcript = await asyncio.to_thread(cache.get_transcript, key)
+    if transcript is not None:
+        log.info(f"Transcript cache hit ({audio_hash[:12]})")
+    return transcript
+
+
+async def cache_transcript(audio_hash: str, language: str, transcript: str) -> None:
+    cache = get_audio_cache()
+    if cache is None or not transcript or not transcript.strip():
+        return
+    key = cache.transcript_key(audio_hash, language, _transcription_model(language))
+    await asyncio.to_thread(cache.put_transcript, key, transcript)
+
+
+# --------------------------------------------------------------------------- #
+# Стадия normalize
+# --------------------------------------------------------------------------- #
+async def normalize_audio(audio_path: Path, work_dir: Path, audio_hash: str | None = None) -> Path:
     """
-    Перекодирует аудио в MP3 32kbps 16kHz mono через ffmpeg.
-    Попутно убирает начальную/конечную тишину и гудки (silenceremove).
+    Один проход ffmpeg: декодирует, убирает начальную тишину/гудки (silenceremove),
+    перекодирует в MP3 32kbps 16kHz mono и сразу режет на чанки по 5 мин.
+    Возвращает папку с chunk_NNN.mp3.
     Решает:
       1. Нестандартные форматы АТС (MPEG 2.5 @ 8kHz) — Groq их не принимает.
-      2. Размер: MP3 32kbps даёт ~5.5 МБ/24 мин vs ~46 МБ WAV.
+      2. Размер: MP3 32kbps даёт ~1.2 МБ на 5-минутный чанк — далеко от лимита Whisper 25 МБ.
       3. Гудки/тишина в начале — они транскрибируются как мусор и портят оценку.
+    Промежуточный полный .mp3 на диск не пишется. Для минимума I/O держи
+    pipeline_work_dir на tmpfs. Чанки всегда лежат в work_dir/segments: если
+    audio_hash уже встречался, они связываются из кэша (hardlink), а не читаются
+    из него напрямую — вытеснение кэша не удалит их посреди транскрипции.
     """
-    import subprocess
-    out_path = audio_path.with_suffix(".norm.mp3")
-    subprocess.run(
-        [
-            "ffmpeg", "-y", "-i", str(audio_path),
-            # Убираем только начальную тишину (до первого звука разговора).
-            # stop_periods намеренно не указан — иначе обрежет паузы внутри звонка.
-            "-af", "silenceremove=start_periods=1:start_duration=1:start_threshold=-40dB",
-            "-ar", "16000", "-ac", "1", "-b:a", "32k",
-            str(out_path),
-        ],
-        check=True,
-        capture_output=True,
+    cache = get_audio_cache() if audio_hash else None
+    out_dir = work_dir / "segments"
+    if cache and await asyncio.to_thread(cache.link_segments, audio_hash, out_dir):
+        log.info(f"Normalized audio cache hit for {audio_path.name}")
+        return out_dir
+
+    shutil.rmtree(out_dir, ignore_errors=True)  # остатки прерванной попытки
+    out_dir.mkdir(parents=True)
+    await _run_ffmpeg(
+        "-y", "-i", str(audio_path),
+        # Убираем только начальную тишину (до первого звука разговора).
+        # stop_periods намеренно не указан — иначе обрежет паузы внутри звонка.
+        "-af", "silenceremove=start_periods=1:start_duration=1:start_threshold=-40dB",
+        "-ar", "16000", "-ac", "1", "-b:a", "32k",
+        "-f", "segment", "-segment_time", str(SEGMENT_SECONDS), "-reset_timestamps", "1",
+        str(out_dir / "chunk_%03d.mp3"),
     )
-    return out_path
-
+    chunks = sorted(out_dir.glob("chunk_*.mp3"))
+    total_kb = sum(c.stat().st_size for c in chunks) / 1024
+    log.info(f"Normalized {audio_path.name} → {len(chunks)} chunks, {total_kb:.0f} KB MP3 16kHz")
 
-def _transcribe_groq(audio_path: Path, language: str) -> str:
-    """Транскрипция через Groq Whisper large-v3 (поддерживает Georgian).
-    1. Нормализует в MP3 32kbps 16kHz mono (фикс MPEG 2.5 @ 8/12kHz формата АТС).
-    2. Нарезает на чанки по 5 мин — Groq стабильнее на коротких кусках.
-    """
-    import subprocess
+    if cache:
+        await asyncio.to_thread(cache.put_segments, audio_hash, out_dir)
+    return out_dir
 
-    norm_path = None
-    chunks_dir = None
-    try:
-        norm_path = _normalize_audio(audio_path)
-        norm_size_kb = norm_path.stat().st_size / 1024
-        log.info(f"Normalized {audio_path.name} → {norm_size_kb:.0f} KB MP3 16kHz")
-
-        chunks_dir = Path(tempfile.mkdtemp())
-        chunk_pattern = str(chunks_dir / "chunk_%03d.mp3")
-        subprocess.run(
-            [
-                "ffmpeg", "-y", "-i", str(norm_path),
-                "-f", "segment", "-segment_time", "300",  # 5-min chunks
-                "-c", "copy", chunk_pattern,
-            ],
-            check=True,
-            capture_output=True,
-        )
 
-        chunks = sorted(chunks_dir.glob("chunk_*.mp3"))
-        log.info(f"Split into {len(chunks)} chunks of 5 min")
+# --------------------------------------------------------------------------- #
+# Стадия transcribe
+# --------------------------------------------------------------------------- #
+async def transcribe_segments(segments_dir: Path, language: str) -> str:
+    """
+    Транскрибирует нормализованные чанки из normalize_audio:
+    Groq Whisper large-v3, либо OpenAI translations → English для языков без поддержки Groq.
+    """
+    chunks = sorted(segments_dir.glob("chunk_*.mp3"))
 
+    if language in GROQ_SUPPORTED_LANGUAGES:
         client = _get_groq_client()
-        # Контекстный промпт помогает Whisper точнее транскрибировать
-        # и не путать языки в начале звонка (автодозвонщик на русском/английском)
-        context_prompt = (
-            "Call center phone conversation. "
-            "Operator offers health products to a client."
-        )
-        transcripts = []
-        prev_text = ""  # последний фрагмент предыдущего чанка для контекста
-        for i, chunk in enumerate(chunks):
-            log.info(f"Transcribing chunk {i+1}/{len(chunks)} ({chunk.stat().st_size/1024:.0f} KB)")
-            prompt = (context_prompt + " " + prev_text).strip()
-            with open(chunk, "rb") as f:
-                result = client.audio.transcriptions.create(
-                    model="whisper-large-v3",
-                    file=("audio.mp3", f, "audio/mpeg"),
-                    language=language,
-                    response_format="text",
-                    prompt=prompt,
-                )
-            transcripts.append(result)
-            prev_text = result[-200:] if result else ""  # контекст для следующего чанка
-
-        log.info(f"Groq transcription done: {len(chunks)} chunks for {audio_path.name}")
-        return " ".join(transcripts)
+        transcripts = await _transcribe_groq_chunks(client, chunks, language)
+        log.info(f"Groq transcription done: {len(chunks)} chunks")
+    else:
+        log.warning(f"Language '{language}' not supported by Groq — falling back to OpenAI translations")
+        transcripts = [await _transcribe_openai_translation(chunk) for chunk in chunks]
 
-    finally:
-        if norm_path and norm_path.exists():
-            norm_path.unlink(missing_ok=True)
-        if chunks_dir and chunks_dir.exists():
-            for f in chunks_dir.glob("*"):
-                f.unlink(missing_ok=True)
-            chunks_dir.rmdir()
+    return " ".join(transcripts)
 
 
-def _transcribe_openai_translation(audio_path: Path) -> str:
-    """Fallback: OpenAI audio/translations → English (для неподдерживаемых языков)."""
-    from openai import OpenAI
-    client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-    with open(audio_path, "rb") as f:
-        result = client.audio.translations.create(
-            model="whisper-1",
-            file=f,
+async def _transcribe_groq_chunk(client, chunk: Path, language: str, prev_text: str = "") -> str:
+    """Транскрибирует один чанк. prev_text — хвост предыдущего чанка для контекста."""
+    log.info(f"Transcribing {chunk.name} ({chunk.stat().st_size/1024:.0f} KB)")
+    prompt = (GROQ_CONTEXT_PROMPT + " " + prev_text[-PREV_TEXT_CHARS:]).strip()
+    audio = await asyncio.to_thread(chunk.read_bytes)
+    seconds = _audio_seconds(audio)
+    result = await call_limited(
+        "groq",
+        lambda: client.audio.transcriptions.create(
+            model=GROQ_MODEL,
+            file=("audio.mp3", audio, "audio/mpeg"),
+            language=language,
             response_format="text",
-            prompt="This is a sales call from a call center.",
-        )
-    log.info(f"OpenAI translation done for {audio_path.name}")
+            prompt=prompt,
+        ),
+        tokens=seconds,
+        operation="transcribe_chunk",
+    )
+    metrics.PROVIDER_AUDIO_SECONDS.labels("groq", GROQ_MODEL).inc(seconds)
     return result
 
 
-def _transcribe_chunked(audio_path: Path, language: str) -> str:
+def _audio_seconds(audio: bytes) -> int:
+    """Длительность нормализованного чанка по размеру (MP3 32 kbps = 4000 байт/с)."""
+    return max(1, len(audio) // 4000)
+
+
+async def _transcribe_groq_chunks(client, chunks: list[Path], language: str) -> list[str]:
     """
-    Режет аудио на чанки по ~10 минут через ffmpeg и транскрибирует каждый.
-    Требует ffmpeg в системе.
+    Транскрибирует чанки и возвращает тексты в исходном порядке.
+    Режим задаётся settings.groq_chunk_concurrency / groq_chunk_context.
     """
-    import subprocess
-
-    chunks_dir = Path(tempfile.mkdtemp())
-    chunk_pattern = str(chunks_dir / "chunk_%03d.mp3")
-
-    subprocess.run(
-        [
-            "ffmpeg", "-i", str(audio_path),
-            "-f", "segment", "-segment_time", "600",
-            "-c", "copy", chunk_pattern,
-        ],
-        check=True,
-        capture_output=True,
-    )
+    mode = settings.groq_chunk_context
+    workers = max(1, settings.groq_chunk_concurrency)
 
-    chunks = sorted(chunks_dir.glob("chunk_*.mp3"))
-    transcripts = [_transcribe_single(chunk, language) for chunk in chunks]
+    if mode == "chain" or workers == 1 or len(chunks) == 1:
+        # Последовательно: хвост предыдущего чанка — контекст для следующего
+        transcripts = []
+        prev_text = ""
+        for chunk in chunks:
+            result = await _transcribe_groq_chunk(client, chunk, language, prev_text)
+            transcripts.append(result)
+            prev_text = result or ""
+        return transcripts
 
-    for chunk in chunks:
-        chunk.unlink()
-    chunks_dir.rmdir()
+    log.info(f"Transcribing {len(chunks)} chunks in parallel (workers={workers}, context={mode})")
+    semaphore = asyncio.Semaphore(workers)
 
-    return " ".join(transcripts)
+    async def bounded(chunk: Path, prev_text: str = "") -> str:
+        async with semaphore:
+            return await _transcribe_groq_chunk(client, chunk, language, prev_text)
+
+    # gather сохраняет порядок чанков
+    transcripts = list(await asyncio.gather(*(bounded(c) for c in chunks)))
+
+    if mode == "two_pass":
+        # Второй проход: чанки 2..N с хвостом текста предыдущего чанка из первого прохода
+        second = await asyncio.gather(*(
+            bounded(chunk, prev or "") for chunk, prev in zip(chunks[1:], transcripts[:-1])
+        ))
+        transcripts = [transcripts[0], *second]
+
+    return transcripts
+
+
+async def _transcribe_openai_translation(audio_path: Path) -> str:
+    """Fallback: OpenAI audio/translations → English (для неподдерживаемых языков)."""
+    client = _get_openai_client()
+    audio = await asyncio.to_thread(audio_path.read_bytes)
+    result = await call_limited(
+        "openai",
+        lambda: client.audio.translations.create(
+            model=OPENAI_TRANSLATION_MODEL,
+            file=(audio_path.name, audio),
+            response_format="text",
+            prompt="This is a sales call from a call center.",
+        ),
+        operation="translate_audio",
+    )
+    metrics.PROVIDER_AUDIO_SECONDS.labels("openai", OPENAI_TRANSLATION_MODEL).inc(_audio_seconds(audio))
+    log.info(f"OpenAI translation done for {audio_path.name}")
+    return result
@@ -1,96 +1,437 @@
-import asyncio
 import logging
+import random
+import shutil
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 
-from sqlalchemy import select
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.celery_app import celery_app
+from app.core import metrics
+from app.core.celery_app import celery_app, run_in_worker_loop
+from app.core.config import settings
 from app.core.database import AsyncSessionLocal
 from app.models.models import Call, QuestionnaireResponse
-from app.services.analyzer import analyze_transcript
-from app.services.transcriber import transcribe_audio
+from app.services import batch_analysis, notifications, results_cache
+from app.services.analyzer import needs_translation, score_transcript, translate_transcript
+from app.services.operator_stats import answers_of, apply_questionnaire_changes
+from app.services.transcriber import (
+    cache_transcript,
+    cached_transcript,
+    download_audio,
+    hash_audio,
+    normalize_audio,
+    transcribe_segments,
+)
 
 log = logging.getLogger(__name__)
 
+# Стадии пайплайна по порядку. calls.processing_stage хранит последнюю завершённую,
+# retry задачи продолжает с первой незавершённой.
+STAGES = ("download", "normalize", "transcribe", "translate", "analyze", "save")
+
+# Пайплайн — цепочка из трёх задач, каждая в своей очереди (маршруты — в celery_app):
+#   audio: process_call    — download → normalize (ffmpeg, CPU)
+#   asr:   transcribe_call — Groq / OpenAI Whisper по чанкам (I/O)
+#   llm:   analyze_call    — перевод → анкета → сохранение (I/O)
+# Задача, завершив свою часть, ставит следующую; что ставить — решает стадия
+# по состоянию звонка (кэш транскрипта пропускает asr, batch-звонки не идут в llm).
+# Не удалось поставить — retry задачи: стадия уже зачекпоинчена, повтор только
+# переставит следующую. Если не вышло и это (брокер лежит дольше ретраев) —
+# звонок подберёт requeue_stalled_calls.
+
+
+def _retry(task, exc: Exception):
+    # Экспоненциальный backoff с джиттером: 60, 120, 240 с (+ до 20%),
+    # чтобы упавшие разом задачи не возвращались к провайдеру одной пачкой
+    countdown = 60 * 2 ** task.request.retries
+    return task.retry(exc=exc, countdown=countdown + random.randint(0, countdown // 5))
+
+
+def _run_stage(task, stage: str, call_id: int, audio_path: str, language: str):
+    try:
+        next_stage = run_in_worker_loop(_STAGE_RUNNERS[stage](call_id, audio_path, language))
+    except Exception as exc:
+        log.error(f"[call_id={call_id}] Stage '{stage}' failed: {exc}", exc_info=True)
+        if task.request.retries >= task.max_retries:
+            run_in_worker_loop(_give_up(call_id, stage, exc))
+        raise _retry(task, exc)
+    if next_stage is None:
+        return
+    try:
+        _STAGE_TASKS[next_stage].delay(call_id, audio_path, language)
+    except Exception as exc:
+        log.error(f"[call_id={call_id}] Failed to enqueue stage '{next_stage}': {exc}", exc_info=True)
+        raise _retry(task, exc)
+
 
 @celery_app.task(bind=True, max_retries=3)
 def process_call(self, call_id: int, audio_path: str, language: str = "ka"):
     """
-    Основная задача: транскрибирует звонок и заполняет анкету.
-    Запускается асинхронно через Celery.
+    Вход пайплайна (очередь audio): скачивание и нормализация аудио,
+    дальше — transcribe_call и analyze_call.
     """
+    _run_stage(self, "audio", call_id, audio_path, language)
+
+
+@celery_app.task(bind=True, max_retries=3)
+def transcribe_call(self, call_id: int, audio_path: str, language: str = "ka"):
+    """Транскрипция нормализованных чанков (очередь asr)."""
+    _run_stage(self, "asr", call_id, audio_path, language)
+
+
+@celery_app.task(bind=True, max_retries=3)
+def analyze_call(self, call_id: int, audio_path: str, language: str = "ka"):
+    """Перевод, заполнение анкеты и сохранение (очередь llm)."""
+    _run_stage(self, "llm", call_id, audio_path, language)
+
+
+_STAGE_TASKS = {"audio": process_call, "asr": transcribe_call, "llm": analyze_call}
+
+
+@celery_app.task
+def submit_analysis_batch():
+    """Периодическая (beat): отправляет накопленные batch-звонки в OpenAI Batch API."""
+    return run_in_worker_loop(batch_analysis.submit_analysis_batch())
+
+
+@celery_app.task
+def poll_analysis_batches():
+    """Периодическая (beat): забирает готовые батчи и сохраняет анкеты."""
+    return run_in_worker_loop(batch_analysis.poll_analysis_batches())
+
+
+@celery_app.task
+def requeue_stalled_calls():
+    """Периодическая (beat): заново ставит звонки, чья задача потерялась."""
+    return run_in_worker_loop(_requeue_stalled_calls())
+
+
+@celery_app.task(bind=True, max_retries=settings.webhook_max_retries)
+def deliver_webhook(self, url: str, event: dict):
+    """Доставка события на callback_url звонка (см. app/services/notifications.py)."""
     try:
-        asyncio.run(_process_call_async(call_id, audio_path, language))
+        run_in_worker_loop(notifications.deliver_webhook(url, event))
     except Exception as exc:
-        log.error(f"[call_id={call_id}] Task failed: {exc}", exc_info=True)
-        raise self.retry(exc=exc, countdown=60)
+        log.warning(f"[call_id={event.get('call_id')}] Webhook to {url} failed: {exc}")
+        # 30 с, 1, 2, 4 ... мин, не больше часа, + джиттер
+        countdown = min(30 * 2 ** self.request.retries, 3600)
+        raise self.retry(exc=exc, countdown=countdown + random.randint(0, countdown // 5))
+
+
+def _stage_done(call: Call, stage: str) -> bool:
+    if call.processing_stage not in STAGES:
+        return False
+    return STAGES.index(call.processing_stage) >= STAGES.index(stage)
+
+
+def _existing_file(path: str | None) -> Path | None:
+    """Файл-чекпоинт, если он ещё есть на диске этого воркера."""
+    if path and Path(path).exists():
+        return Path(path)
+    return None
+
+
+async def _checkpoint(db: AsyncSession, call: Call, stage: str):
+    call.processing_stage = stage
+    call.stage_updated_at = datetime.now(timezone.utc)
+    await db.commit()
+    log.info(f"[call_id={call.id}] Stage '{stage}' checkpointed")
+
+
+async def _fail(db: AsyncSession, call: Call, error_msg: str):
+    """
+    Ошибка попытки: текст — в processing_error, статус остаётся processing,
+    задача уйдёт в retry. error, метрика и событие — в _give_up.
+    """
+    call.processing_error = error_msg
+    await db.commit()
+
+
+async def _give_up(call_id: int, stage: str, exc: Exception):
+    """Ретраи исчерпаны (у /calls/upload их нет): звонок → error, событие error на callback_url."""
+    try:
+        async with AsyncSessionLocal() as db:
+            call = await db.get(Call, call_id)
+            if call is None or call.processing_status in ("done", "error"):
+                return
+            call.processing_status = "error"
+            call.processing_error = call.processing_error or f"Stage '{stage}' failed: {exc}"
+            await db.commit()
+    except Exception as e:
+        log.error(f"[call_id={call_id}] Failed to mark call as error: {e}")
+        return
+    metrics.CALLS_FINISHED.labels("error").inc()
+    await notifications.publish_call_event(call)
+
+
+async def _load_call(db: AsyncSession, call_id: int) -> Call:
+    call = await db.get(Call, call_id)
+    if not call:
+        raise ValueError(f"Call {call_id} not found in DB")
+    return call
+
+
+async def _start(db: AsyncSession, call: Call):
+    """
+    status → processing; ожидание в очереди — при первом старте.
+    stage_updated_at — на каждом старте стадии: звонок в работе не считается застрявшим.
+    processing_error прошлой попытки сбрасывается — у новой своя.
+    """
+    call.stage_updated_at = datetime.now(timezone.utc)
+    call.processing_error = None
+    if call.processing_status == "pending" and call.created_at is not None:
+        created_at = call.created_at if call.created_at.tzinfo else call.created_at.replace(tzinfo=timezone.utc)
+        metrics.QUEUE_WAIT.observe((datetime.now(timezone.utc) - created_at).total_seconds())
+    call.processing_status = "processing"
+    await db.commit()
+
+
+def _work_dir(call: Call) -> Path:
+    return Path(settings.pipeline_work_dir) / str(call.id)
 
 
 async def _process_call_async(call_id: int, audio_path: str, language: str = "ka"):
-    async with AsyncSessionLocal() as db:
-        call = await db.get(Call, call_id)
-        if not call:
-            raise ValueError(f"Call {call_id} not found in DB")
+    """Все стадии подряд в текущем процессе (POST /calls/upload)."""
+    stage = "audio"
+    try:
+        while stage is not None:
+            stage = await _STAGE_RUNNERS[stage](call_id, audio_path, language)
+    except Exception as exc:
+        await _give_up(call_id, stage, exc)
+        raise
 
-        # --- Шаг 1: Транскрипция ---
-        log.info(f"[call_id={call_id}] Starting transcription: {audio_path}")
-        call.processing_status = "processing"
-        await db.commit()
 
+async def _audio_stage(call_id: int, audio_path: str, language: str) -> str | None:
+    """download → normalize. Возвращает следующую стадию (None — звонок дальше не идёт)."""
+    async with AsyncSessionLocal() as db:
+        call = await _load_call(db, call_id)
+        if _stage_done(call, "save"):
+            log.info(f"[call_id={call_id}] Already processed, skipping")
+            return None
+        if _stage_done(call, "transcribe"):
+            return _after_transcribe(call)
+
+        log.info(f"[call_id={call_id}] Starting processing: {audio_path} (last stage: {call.processing_stage})")
+        await _start(db, call)
         try:
-            transcript = transcribe_audio(audio_path, language)
+            cached = await _prepare_audio(db, call, audio_path, language)
         except Exception as exc:
             error_msg = f"Transcription failed: {exc}"
             log.error(f"[call_id={call_id}] {error_msg}", exc_info=True)
-            call.processing_status = "error"
-            call.processing_error = error_msg
-            await db.commit()
+            await _fail(db, call, error_msg)
             raise
 
-        if not transcript or not transcript.strip():
-            error_msg = "Transcription returned empty result"
-            log.warning(f"[call_id={call_id}] {error_msg}")
-            call.processing_status = "error"
-            call.processing_error = error_msg
-            await db.commit()
-            raise ValueError(error_msg)
+        if cached is not None:
+            return await _save_transcript(db, call, cached)
+        return "asr"
+
 
-        call.transcript_text = transcript
-        log.info(f"[call_id={call_id}] Transcription done, {len(transcript)} chars")
+async def _asr_stage(call_id: int, audio_path: str, language: str) -> str | None:
+    """Транскрипция чанков из normalize."""
+    async with AsyncSessionLocal() as db:
+        call = await _load_call(db, call_id)
+        if _stage_done(call, "transcribe"):
+            return _after_transcribe(call)
 
-        # --- Шаг 2: Анализ анкеты ---
-        log.info(f"[call_id={call_id}] Starting AI analysis")
+        await _start(db, call)
         try:
-            answers = analyze_transcript(transcript, language)
+            segments_dir = _existing_file(call.normalized_path) if _stage_done(call, "normalize") else None
+            transcript = None
+            if segments_dir is None:
+                # Чанков нет на диске этого воркера: PIPELINE_WORK_DIR не общий
+                # с воркером audio или очищен — готовим аудио здесь, чтобы звонок не застрял
+                log.warning(f"[call_id={call_id}] Normalized audio not found on this worker, re-running audio stage")
+                if (transcript := await _prepare_audio(db, call, audio_path, language)) is None:
+                    segments_dir = Path(call.normalized_path)
+            if transcript is None:
+                with metrics.stage_timer("transcribe"):
+                    transcript = await transcribe_segments(segments_dir, language)
+                await cache_transcript(call.audio_sha256, language, transcript)
         except Exception as exc:
-            error_msg = f"AI analysis failed: {exc}"
+            error_msg = f"Transcription failed: {exc}"
             log.error(f"[call_id={call_id}] {error_msg}", exc_info=True)
-            call.processing_status = "error"
-            call.processing_error = error_msg
-            await db.commit()
+            await _fail(db, call, error_msg)
             raise
 
-        if not answers:
-            error_msg = "AI analysis returned empty result"
-            log.warning(f"[call_id={call_id}] {error_msg}")
-            call.processing_status = "error"
-            call.processing_error = error_msg
+        return await _save_transcript(db, call, transcript)
+
+
+async def _save_transcript(db: AsyncSession, call: Call, transcript: str) -> str | None:
+    if not transcript or not transcript.strip():
+        error_msg = "Transcription returned empty result"
+        log.warning(f"[call_id={call.id}] {error_msg}")
+        await _fail(db, call, error_msg)
+        raise ValueError(error_msg)
+
+    call.transcript_text = transcript
+    log.info(f"[call_id={call.id}] Transcription done, {len(transcript)} chars")
+    await _checkpoint(db, call, "transcribe")
+    # Дальше нужен только текст
+    shutil.rmtree(_work_dir(call), ignore_errors=True)
+    return _after_transcribe(call)
+
+
+def _after_transcribe(call: Call) -> str | None:
+    if call.priority == "batch" and not _stage_done(call, "analyze"):
+        # Перевод и анализ уйдут в OpenAI Batch API (см. submit_analysis_batch)
+        log.info(f"[call_id={call.id}] Queued for batch analysis")
+        return None
+    return "llm"
+
+
+async def _llm_stage(call_id: int, audio_path: str, language: str) -> None:
+    """Перевод → анкета → сохранение."""
+    async with AsyncSessionLocal() as db:
+        call = await _load_call(db, call_id)
+        if _stage_done(call, "save"):
+            log.info(f"[call_id={call_id}] Already processed, skipping")
+            return None
+        if _after_transcribe(call) is None:
+            return None
+        await _start(db, call)
+
+        # --- Перевод (только не ru/en) ---
+        if not _stage_done(call, "translate"):
+            if needs_translation(language):
+                with metrics.stage_timer("translate"):
+                    call.translated_text = await translate_transcript(call.transcript_text, language)
+            await _checkpoint(db, call, "translate")
+
+        # --- Анализ анкеты ---
+        if not _stage_done(call, "analyze"):
+            log.info(f"[call_id={call_id}] Starting AI analysis")
+            try:
+                with metrics.stage_timer("analyze"):
+                    if call.translated_text:
+                        answers = await score_transcript(call.translated_text)
+                    else:
+                        answers = await score_transcript(call.transcript_text, language)
+            except Exception as exc:
+                error_msg = f"AI analysis failed: {exc}"
+                log.error(f"[call_id={call_id}] {error_msg}", exc_info=True)
+                await _fail(db, call, error_msg)
+                raise
+
+            if not answers:
+                error_msg = "AI analysis returned empty result"
+                log.warning(f"[call_id={call_id}] {error_msg}")
+                await _fail(db, call, error_msg)
+                raise ValueError(error_msg)
+
+            call.analysis_result = answers
+            log.info(f"[call_id={call_id}] AI analysis done, {len(answers)} fields")
+            await _checkpoint(db, call, "analyze")
+
+        # --- Сохранение анкеты (idempotent) ---
+        with metrics.stage_timer("save"):
+            answers = call.analysis_result
+            existing = await db.scalar(
+                select(QuestionnaireResponse).where(QuestionnaireResponse.call_id == call_id)
+            )
+            # Rollup оператора обновляется в той же транзакции, что и анкета
+            await apply_questionnaire_changes(
+                db, [(call.operator_id, call.call_date, answers_of(existing), answers)]
+            )
+            if existing:
+                for key, val in answers.items():
+                    setattr(existing, key, val)
+            else:
+                qr = QuestionnaireResponse(call_id=call_id, filled_by_ai=True, **answers)
+                db.add(qr)
+
+            call.processing_status = "done"
+            call.processing_error = None
+            call.processing_stage = "save"
             await db.commit()
-            raise ValueError(error_msg)
-
-        log.info(f"[call_id={call_id}] AI analysis done, {len(answers)} fields")
-
-        # --- Шаг 3: Сохранение анкеты (idempotent) ---
-        existing = await db.scalar(
-            select(QuestionnaireResponse).where(QuestionnaireResponse.call_id == call_id)
-        )
-        if existing:
-            for key, val in answers.items():
-                setattr(existing, key, val)
-        else:
-            qr = QuestionnaireResponse(call_id=call_id, filled_by_ai=True, **answers)
-            db.add(qr)
-
-        call.processing_status = "done"
-        call.processing_error = None
-        await db.commit()
+        metrics.CALLS_FINISHED.labels("done").inc()
+        await results_cache.invalidate(call_id)
         log.info(f"[call_id={call_id}] Processing complete")
+        await notifications.publish_call_event(call, total_score=sum(1 for v in answers.values() if v is True))
+    return None
+
+
+async def _prepare_audio(db: AsyncSession, call: Call, audio_path: str, language: str) -> str | None:
+    """
+    Стадии download → normalize с чекпоинтами. Возвращает транскрипт, если он
+    уже есть в кэше (проверяется до ffmpeg), иначе None — дальше стадия asr.
+    Файлы-чекпоинты переиспользуются, только если они ещё на диске;
+    иначе стадия выполняется заново.
+    """
+    work_dir = _work_dir(call)
+    source = _existing_file(call.audio_local_path) if _stage_done(call, "download") else None
+    if source is None:
+        with metrics.stage_timer("download"):
+            source = await download_audio(audio_path, work_dir)
+            call.audio_local_path = str(source)
+            call.audio_sha256 = await hash_audio(source)
+        await _checkpoint(db, call, "download")
+
+    cached = await cached_transcript(call.audio_sha256, language)
+    if cached is not None:
+        return cached
+
+    segments_dir = _existing_file(call.normalized_path) if _stage_done(call, "normalize") else None
+    if segments_dir is None:
+        # Один проход ffmpeg: нормализация и нарезка на чанки
+        with metrics.stage_timer("normalize"):
+            segments_dir = await normalize_audio(source, work_dir, call.audio_sha256)
+        call.normalized_path = str(segments_dir)
+        await _checkpoint(db, call, "normalize")
+    return None
+
+
+_STAGE_RUNNERS = {"audio": _audio_stage, "asr": _asr_stage, "llm": _llm_stage}
+
+# Последняя завершённая стадия → задача, с которой звонок продолжится
+_RESUME_FROM = {
+    None: "audio", "download": "audio", "normalize": "asr",
+    "transcribe": "llm", "translate": "llm", "analyze": "llm", "save": "llm",
+}
+STALLED_REQUEUE_LIMIT = 500
+
+
+async def _requeue_stalled_calls() -> int:
+    """
+    Звонки pending/processing без движения дольше stalled_call_timeout: их задача
+    потерялась (следующую стадию не удалось поставить в брокер). Ставит задачу
+    стадии, с которой звонок продолжится, — стадии пропускают зачекпоинченное.
+    Не трогает загрузки (POST /calls/upload: файл есть только у API) и batch-звонки
+    после транскрипции (их ведут submit/poll_analysis_batches).
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.stalled_call_timeout)
+    async with AsyncSessionLocal() as db:
+        calls = (await db.scalars(
+            select(Call)
+            .where(
+                Call.processing_status.in_(("pending", "processing")),
+                Call.stage_updated_at < cutoff,
+                ~Call.audio_url.startswith("local:"),
+                or_(
+                    Call.priority.is_distinct_from("batch"),
+                    Call.processing_stage.is_(None),
+                    Call.processing_stage.not_in(("transcribe", "translate", "analyze")),
+                ),
+            )
+            .order_by(Call.id)
+            .limit(STALLED_REQUEUE_LIMIT)
+            .with_for_update(skip_locked=True)
+        )).all()
+
+        requeued = 0
+        for call in calls:
+            stage = _RESUME_FROM.get(call.processing_stage, "audio")
+            try:
+                _STAGE_TASKS[stage].delay(call.id, call.audio_url, call.language)
+            except Exception as exc:
+                log.error(f"[call_id={call.id}] Failed to requeue stalled call: {exc}")
+                continue
+            log.warning(
+                f"[call_id={call.id}] Stalled at stage '{call.processing_stage}' since "
+                f"{call.stage_updated_at:%Y-%m-%d %H:%M:%S}, requeued to '{stage}'"
+            )
+            # Следующая проверка — не раньше чем через stalled_call_timeout
+            call.stage_updated_at = func.now()
+            requeued += 1
+        await db.commit()
+        return requeued
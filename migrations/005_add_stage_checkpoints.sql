@@ -0,0 +1,14 @@
+-- ============================================================
+-- 005_add_stage_checkpoints.sql
+-- Чекпоинты стадий пайплайна (download → normalize → transcribe →
+-- translate → analyze → save). Retry задачи продолжает с первой
+-- незавершённой стадии, не повторяя платные вызовы Groq/OpenAI.
+-- ============================================================
+
+ALTER TABLE calls
+    ADD COLUMN IF NOT EXISTS processing_stage VARCHAR(20),   -- последняя завершённая стадия
+    ADD COLUMN IF NOT EXISTS audio_local_path TEXT,          -- download: локальный файл на воркере
+    ADD COLUMN IF NOT EXISTS audio_sha256     VARCHAR(64),   -- download: ключ кэша транскриптов
+    ADD COLUMN IF NOT EXISTS normalized_path  TEXT,          -- normalize: MP3 16kHz mono
+    ADD COLUMN IF NOT EXISTS translated_text  TEXT,          -- translate: текст для анализа
+    ADD COLUMN IF NOT EXISTS analysis_result  JSONB;         -- analyze: ответы анкеты до сохранения
@@ -0,0 +1,18 @@
+-- ============================================================
+-- 006_add_batch_analysis.sql
+-- Batch-режим анализа (OpenAI Batch API) для несрочных звонков.
+-- priority = 'normal' — анализ сразу в пайплайне,
+-- priority = 'batch'  — анализ копится и уходит JSONL-батчем.
+-- ============================================================
+
+ALTER TABLE calls
+    ADD COLUMN IF NOT EXISTS priority          VARCHAR(10) DEFAULT 'normal',
+    ADD COLUMN IF NOT EXISTS analysis_batch_id VARCHAR(64);   -- id батча OpenAI, пока он в работе
+
+-- Поиск звонков, ожидающих отправки в батч / результата батча
+CREATE INDEX IF NOT EXISTS idx_calls_batch_pending
+    ON calls(processing_stage)
+    WHERE priority = 'batch' AND processing_status = 'processing';
+CREATE INDEX IF NOT EXISTS idx_calls_analysis_batch_id
+    ON calls(analysis_batch_id)
+    WHERE analysis_batch_id IS NOT NULL;
@@ -0,0 +1,149 @@
+-- ============================================================
+-- 007_operator_daily_stats.sql
+-- Предагрегированная статистика оператора по дням (UTC дата call_date).
+-- Обновляется инкрементально при сохранении анкеты (app/services/operator_stats.py),
+-- эндпоинты /operators/{id}/stats и /operators/leaderboard читают только её.
+-- qN_M_yes   — сколько раз критерий выполнен (true)
+-- qN_M_total — сколько раз критерий оценён (true/false, без null)
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS operator_daily_stats (
+    operator_id     INTEGER NOT NULL REFERENCES operators(id) ON DELETE CASCADE,
+    day             DATE    NOT NULL,
+    calls_count     INTEGER NOT NULL DEFAULT 0,
+    score_sum       INTEGER NOT NULL DEFAULT 0,
+    q1_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q1_1_total      INTEGER NOT NULL DEFAULT 0,
+    q1_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q1_2_total      INTEGER NOT NULL DEFAULT 0,
+    q1_3_yes        INTEGER NOT NULL DEFAULT 0,
+    q1_3_total      INTEGER NOT NULL DEFAULT 0,
+    q2_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q2_1_total      INTEGER NOT NULL DEFAULT 0,
+    q2_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q2_2_total      INTEGER NOT NULL DEFAULT 0,
+    q2_3_yes        INTEGER NOT NULL DEFAULT 0,
+    q2_3_total      INTEGER NOT NULL DEFAULT 0,
+    q3_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q3_1_total      INTEGER NOT NULL DEFAULT 0,
+    q3_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q3_2_total      INTEGER NOT NULL DEFAULT 0,
+    q4_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q4_1_total      INTEGER NOT NULL DEFAULT 0,
+    q4_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q4_2_total      INTEGER NOT NULL DEFAULT 0,
+    q4_3_yes        INTEGER NOT NULL DEFAULT 0,
+    q4_3_total      INTEGER NOT NULL DEFAULT 0,
+    q4_4_yes        INTEGER NOT NULL DEFAULT 0,
+    q4_4_total      INTEGER NOT NULL DEFAULT 0,
+    q5_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q5_1_total      INTEGER NOT NULL DEFAULT 0,
+    q5_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q5_2_total      INTEGER NOT NULL DEFAULT 0,
+    q5_3_yes        INTEGER NOT NULL DEFAULT 0,
+    q5_3_total      INTEGER NOT NULL DEFAULT 0,
+    q6_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q6_1_total      INTEGER NOT NULL DEFAULT 0,
+    q6_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q6_2_total      INTEGER NOT NULL DEFAULT 0,
+    q6_3_yes        INTEGER NOT NULL DEFAULT 0,
+    q6_3_total      INTEGER NOT NULL DEFAULT 0,
+    q7_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q7_1_total      INTEGER NOT NULL DEFAULT 0,
+    q7_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q7_2_total      INTEGER NOT NULL DEFAULT 0,
+    q7_3_yes        INTEGER NOT NULL DEFAULT 0,
+    q7_3_total      INTEGER NOT NULL DEFAULT 0,
+    q8_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q8_1_total      INTEGER NOT NULL DEFAULT 0,
+    q8_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q8_2_total      INTEGER NOT NULL DEFAULT 0,
+    q8_3_yes        INTEGER NOT NULL DEFAULT 0,
+    q8_3_total      INTEGER NOT NULL DEFAULT 0,
+    q9_1_yes        INTEGER NOT NULL DEFAULT 0,
+    q9_1_total      INTEGER NOT NULL DEFAULT 0,
+    q9_2_yes        INTEGER NOT NULL DEFAULT 0,
+    q9_2_total      INTEGER NOT NULL DEFAULT 0,
+    q10_1_yes       INTEGER NOT NULL DEFAULT 0,
+    q10_1_total     INTEGER NOT NULL DEFAULT 0,
+    q10_2_yes       INTEGER NOT NULL DEFAULT 0,
+    q10_2_total     INTEGER NOT NULL DEFAULT 0,
+    q11_1_yes       INTEGER NOT NULL DEFAULT 0,
+    q11_1_total     INTEGER NOT NULL DEFAULT 0,
+    q11_2_yes       INTEGER NOT NULL DEFAULT 0,
+    q11_2_total     INTEGER NOT NULL DEFAULT 0,
+    q11_3_yes       INTEGER NOT NULL DEFAULT 0,
+    q11_3_total     INTEGER NOT NULL DEFAULT 0,
+    q12_1_yes       INTEGER NOT NULL DEFAULT 0,
+    q12_1_total     INTEGER NOT NULL DEFAULT 0,
+    q13_1_yes       INTEGER NOT NULL DEFAULT 0,
+    q13_1_total     INTEGER NOT NULL DEFAULT 0,
+    q14_1_yes       INTEGER NOT NULL DEFAULT 0,
+    q14_1_total     INTEGER NOT NULL DEFAULT 0,
+    updated_at      TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (operator_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_operator_daily_stats_day ON operator_daily_stats(day);
+
+-- Первичное заполнение из уже обработанных звонков.
+-- ON CONFLICT DO NOTHING — повторный прогон миграции не задваивает счётчики.
+INSERT INTO operator_daily_stats (
+    operator_id, day, calls_count, score_sum,
+    q1_1_yes, q1_1_total, q1_2_yes, q1_2_total, q1_3_yes, q1_3_total,
+    q2_1_yes, q2_1_total, q2_2_yes, q2_2_total, q2_3_yes, q2_3_total,
+    q3_1_yes, q3_1_total, q3_2_yes, q3_2_total, q4_1_yes, q4_1_total,
+    q4_2_yes, q4_2_total, q4_3_yes, q4_3_total, q4_4_yes, q4_4_total,
+    q5_1_yes, q5_1_total, q5_2_yes, q5_2_total, q5_3_yes, q5_3_total,
+    q6_1_yes, q6_1_total, q6_2_yes, q6_2_total, q6_3_yes, q6_3_total,
+    q7_1_yes, q7_1_total, q7_2_yes, q7_2_total, q7_3_yes, q7_3_total,
+    q8_1_yes, q8_1_total, q8_2_yes, q8_2_total, q8_3_yes, q8_3_total,
+    q9_1_yes, q9_1_total, q9_2_yes, q9_2_total, q10_1_yes, q10_1_total,
+    q10_2_yes, q10_2_total, q11_1_yes, q11_1_total, q11_2_yes, q11_2_total,
+    q11_3_yes, q11_3_total, q12_1_yes, q12_1_total, q13_1_yes, q13_1_total,
+    q14_1_yes, q14_1_total
+)
+SELECT
+    c.operator_id,
+    (c.call_date AT TIME ZONE 'UTC')::date,
+    COUNT(*),
+    COALESCE(SUM(qr.total_score), 0),
+    COUNT(*) FILTER (WHERE qr.q1_1),   COUNT(qr.q1_1),
+    COUNT(*) FILTER (WHERE qr.q1_2),   COUNT(qr.q1_2),
+    COUNT(*) FILTER (WHERE qr.q1_3),   COUNT(qr.q1_3),
+    COUNT(*) FILTER (WHERE qr.q2_1),   COUNT(qr.q2_1),
+    COUNT(*) FILTER (WHERE qr.q2_2),   COUNT(qr.q2_2),
+    COUNT(*) FILTER (WHERE qr.q2_3),   COUNT(qr.q2_3),
+    COUNT(*) FILTER (WHERE qr.q3_1),   COUNT(qr.q3_1),
+    COUNT(*) FILTER (WHERE qr.q3_2),   COUNT(qr.q3_2),
+    COUNT(*) FILTER (WHERE qr.q4_1),   COUNT(qr.q4_1),
+    COUNT(*) FILTER (WHERE qr.q4_2),   COUNT(qr.q4_2),
+    COUNT(*) FILTER (WHERE qr.q4_3),   COUNT(qr.q4_3),
+    COUNT(*) FILTER (WHERE qr.q4_4),   COUNT(qr.q4_4),
+    COUNT(*) FILTER (WHERE qr.q5_1),   COUNT(qr.q5_1),
+    COUNT(*) FILTER (WHERE qr.q5_2),   COUNT(qr.q5_2),
+    COUNT(*) FILTER (WHERE qr.q5_3),   COUNT(qr.q5_3),
+    COUNT(*) FILTER (WHERE qr.q6_1),   COUNT(qr.q6_1),
+    COUNT(*) FILTER (WHERE qr.q6_2),   COUNT(qr.q6_2),
+    COUNT(*) FILTER (WHERE qr.q6_3),   COUNT(qr.q6_3),
+    COUNT(*) FILTER (WHERE qr.q7_1),   COUNT(qr.q7_1),
+    COUNT(*) FILTER (WHERE qr.q7_2),   COUNT(qr.q7_2),
+    COUNT(*) FILTER (WHERE qr.q7_3),   COUNT(qr.q7_3),
+    COUNT(*) FILTER (WHERE qr.q8_1),   COUNT(qr.q8_1),
+    COUNT(*) FILTER (WHERE qr.q8_2),   COUNT(qr.q8_2),
+    COUNT(*) FILTER (WHERE qr.q8_3),   COUNT(qr.q8_3),
+    COUNT(*) FILTER (WHERE qr.q9_1),   COUNT(qr.q9_1),
+    COUNT(*) FILTER (WHERE qr.q9_2),   COUNT(qr.q9_2),
+    COUNT(*) FILTER (WHERE qr.q10_1),  COUNT(qr.q10_1),
+    COUNT(*) FILTER (WHERE qr.q10_2),  COUNT(qr.q10_2),
+    COUNT(*) FILTER (WHERE qr.q11_1),  COUNT(qr.q11_1),
+    COUNT(*) FILTER (WHERE qr.q11_2),  COUNT(qr.q11_2),
+    COUNT(*) FILTER (WHERE qr.q11_3),  COUNT(qr.q11_3),
+    COUNT(*) FILTER (WHERE qr.q12_1),  COUNT(qr.q12_1),
+    COUNT(*) FILTER (WHERE qr.q13_1),  COUNT(qr.q13_1),
+    COUNT(*) FILTER (WHERE qr.q14_1),  COUNT(qr.q14_1)
+FROM calls c
+JOIN questionnaire_responses qr ON qr.call_id = c.id
+WHERE c.operator_id IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (operator_id, day) DO NOTHING;
@@ -0,0 +1,74 @@
+-- ============================================================
+-- 008_section_scores.sql
+-- Баллы по разделам анкеты (s1_score..s14_score) как STORED generated
+-- колонки + индексы по ним и по total_score: фильтры вида
+-- «оператор X, балл < 20, последняя неделя» выполняются в SQL.
+-- ============================================================
+
+ALTER TABLE questionnaire_responses
+    ADD COLUMN IF NOT EXISTS s1_score SMALLINT GENERATED ALWAYS AS (COALESCE(q1_1::int,0) + COALESCE(q1_2::int,0) + COALESCE(q1_3::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s2_score SMALLINT GENERATED ALWAYS AS (COALESCE(q2_1::int,0) + COALESCE(q2_2::int,0) + COALESCE(q2_3::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s3_score SMALLINT GENERATED ALWAYS AS (COALESCE(q3_1::int,0) + COALESCE(q3_2::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s4_score SMALLINT GENERATED ALWAYS AS (COALESCE(q4_1::int,0) + COALESCE(q4_2::int,0) + COALESCE(q4_3::int,0) + COALESCE(q4_4::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s5_score SMALLINT GENERATED ALWAYS AS (COALESCE(q5_1::int,0) + COALESCE(q5_2::int,0) + COALESCE(q5_3::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s6_score SMALLINT GENERATED ALWAYS AS (COALESCE(q6_1::int,0) + COALESCE(q6_2::int,0) + COALESCE(q6_3::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s7_score SMALLINT GENERATED ALWAYS AS (COALESCE(q7_1::int,0) + COALESCE(q7_2::int,0) + COALESCE(q7_3::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s8_score SMALLINT GENERATED ALWAYS AS (COALESCE(q8_1::int,0) + COALESCE(q8_2::int,0) + COALESCE(q8_3::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s9_score SMALLINT GENERATED ALWAYS AS (COALESCE(q9_1::int,0) + COALESCE(q9_2::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s10_score SMALLINT GENERATED ALWAYS AS (COALESCE(q10_1::int,0) + COALESCE(q10_2::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s11_score SMALLINT GENERATED ALWAYS AS (COALESCE(q11_1::int,0) + COALESCE(q11_2::int,0) + COALESCE(q11_3::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s12_score SMALLINT GENERATED ALWAYS AS (COALESCE(q12_1::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s13_score SMALLINT GENERATED ALWAYS AS (COALESCE(q13_1::int,0)) STORED,
+    ADD COLUMN IF NOT EXISTS s14_score SMALLINT GENERATED ALWAYS AS (COALESCE(q14_1::int,0)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_qr_total_score ON questionnaire_responses(total_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s1_score  ON questionnaire_responses(s1_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s2_score  ON questionnaire_responses(s2_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s3_score  ON questionnaire_responses(s3_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s4_score  ON questionnaire_responses(s4_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s5_score  ON questionnaire_responses(s5_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s6_score  ON questionnaire_responses(s6_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s7_score  ON questionnaire_responses(s7_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s8_score  ON questionnaire_responses(s8_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s9_score  ON questionnaire_responses(s9_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s10_score ON questionnaire_responses(s10_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s11_score ON questionnaire_responses(s11_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s12_score ON questionnaire_responses(s12_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s13_score ON questionnaire_responses(s13_score);
+CREATE INDEX IF NOT EXISTS idx_qr_s14_score ON questionnaire_responses(s14_score);
+
+-- Состав колонок view меняется — CREATE OR REPLACE так не умеет
+DROP VIEW IF EXISTS call_analytics;
+
+CREATE VIEW call_analytics AS
+SELECT
+    c.id            AS call_id,
+    c.order_id,
+    c.call_date,
+    c.duration_sec,
+    o.name          AS operator_name,
+    o.team          AS operator_team,
+    qr.total_score,
+    qr.s1_score, qr.s2_score, qr.s3_score, qr.s4_score, qr.s5_score, qr.s6_score, qr.s7_score,
+    qr.s8_score, qr.s9_score, qr.s10_score, qr.s11_score, qr.s12_score, qr.s13_score, qr.s14_score,
+    qr.q1_1, qr.q1_2, qr.q1_3,
+    qr.q2_1, qr.q2_2, qr.q2_3,
+    qr.q3_1, qr.q3_2,
+    qr.q4_1, qr.q4_2, qr.q4_3, qr.q4_4,
+    qr.q5_1, qr.q5_2, qr.q5_3,
+    qr.q6_1, qr.q6_2, qr.q6_3,
+    qr.q7_1, qr.q7_2, qr.q7_3,
+    qr.q8_1, qr.q8_2, qr.q8_3,
+    qr.q9_1, qr.q9_2,
+    qr.q10_1, qr.q10_2,
+    qr.q11_1, qr.q11_2, qr.q11_3,
+    qr.q12_1, qr.q13_1, qr.q14_1,
+    qr.filled_by_ai,
+    qr.corrected_by_human,
+    out.approved,
+    out.redeemed,
+    out.avg_check
+FROM calls c
+LEFT JOIN operators               o   ON c.operator_id = o.id
+LEFT JOIN questionnaire_responses qr  ON c.id = qr.call_id
+LEFT JOIN outcomes                out ON c.order_id = out.order_id;
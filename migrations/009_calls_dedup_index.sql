@@ -0,0 +1,7 @@
+-- ============================================================
+-- 009_calls_dedup_index.sql
+-- POST /calls/bulk дедуплицирует звонки по (order_id, audio_url):
+-- составной индекс для поиска уже принятых звонков пачкой.
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS ix_calls_order_id_audio_url ON calls(order_id, audio_url);
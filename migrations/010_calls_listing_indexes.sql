@@ -0,0 +1,9 @@
+-- ============================================================
+-- 010_calls_listing_indexes.sql
+-- Индексы для GET /calls/: keyset-пагинация по (call_date, id)
+-- от новых к старым, с фильтром по оператору или статусу.
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS idx_calls_call_date_id          ON calls(call_date, id);
+CREATE INDEX IF NOT EXISTS idx_calls_operator_call_date_id ON calls(operator_id, call_date, id);
+CREATE INDEX IF NOT EXISTS idx_calls_status_call_date_id   ON calls(processing_status, call_date, id);
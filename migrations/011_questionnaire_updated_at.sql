@@ -0,0 +1,14 @@
+-- ============================================================
+-- 011_questionnaire_updated_at.sql
+-- Время последнего изменения анкеты: Last-Modified/ETag для
+-- GET /calls/{id}/results (поллеры получают 304, пока анкета не менялась).
+-- ============================================================
+
+ALTER TABLE questionnaire_responses
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+
+UPDATE questionnaire_responses SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+
+ALTER TABLE questionnaire_responses
+    ALTER COLUMN updated_at SET DEFAULT NOW(),
+    ALTER COLUMN updated_at SET NOT NULL;
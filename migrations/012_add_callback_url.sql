@@ -0,0 +1,7 @@
+-- ============================================================
+-- 012_add_callback_url.sql
+-- URL для webhook о завершении обработки звонка (done / error).
+-- ============================================================
+
+ALTER TABLE calls
+    ADD COLUMN IF NOT EXISTS callback_url TEXT;
@@ -0,0 +1,33 @@
+-- ============================================================
+-- 013_calls_dedup_unique.sql
+-- Дедупликация POST /calls/bulk по (order_id, audio_url) переносится в БД:
+-- уникальный индекс + INSERT ... ON CONFLICT DO NOTHING. Проверка «есть ли
+-- уже такой звонок» перед INSERT не защищала от двух параллельных запросов
+-- с одинаковыми строками.
+--
+-- В индексе — md5(audio_url), а не сам URL: строка btree-индекса ограничена
+-- ~2.7 КБ, длинный подписанный URL не вставился бы вовсе.
+--
+-- Исторические дубликаты не трогаются (у них могут быть анкеты): хэш
+-- получает только первый звонок каждой пары, у остальных audio_url_md5 NULL —
+-- NULL в уникальный индекс не попадает. Так же POST /calls/ сохраняет повтор
+-- уже принятого звонка (переобработка).
+-- ============================================================
+
+ALTER TABLE calls ADD COLUMN IF NOT EXISTS audio_url_md5 VARCHAR(32);
+
+UPDATE calls c
+SET audio_url_md5 = md5(c.audio_url)
+FROM (
+    SELECT DISTINCT ON (order_id, md5(audio_url)) id
+    FROM calls
+    WHERE audio_url IS NOT NULL
+    ORDER BY order_id, md5(audio_url), id
+) first
+WHERE c.id = first.id
+  AND c.audio_url_md5 IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_calls_order_id_audio_url_md5 ON calls(order_id, audio_url_md5);
+
+-- Поиск уже принятых звонков идёт по хэшу; индекс по полному URL (009) не нужен
+DROP INDEX IF EXISTS ix_calls_order_id_audio_url;
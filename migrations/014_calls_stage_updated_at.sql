@@ -0,0 +1,23 @@
+-- ============================================================
+-- 014_calls_stage_updated_at.sql
+-- Время последнего движения звонка по пайплайну (старт стадии,
+-- чекпоинт, повторная постановка). По нему beat-задача
+-- requeue_stalled_calls находит звонки, задача которых потерялась
+-- (не удалось поставить следующую стадию в брокер).
+-- ============================================================
+
+ALTER TABLE calls
+    ADD COLUMN IF NOT EXISTS stage_updated_at TIMESTAMPTZ;
+-- DEFAULT после ADD COLUMN — только для новых строк, без перезаписи таблицы
+ALTER TABLE calls
+    ALTER COLUMN stage_updated_at SET DEFAULT NOW();
+
+-- Звонки в работе на момент миграции: отсчёт от создания
+UPDATE calls
+SET stage_updated_at = created_at
+WHERE stage_updated_at IS NULL
+  AND processing_status IN ('pending', 'processing');
+
+CREATE INDEX IF NOT EXISTS idx_calls_in_flight_stage_updated_at
+    ON calls(stage_updated_at)
+    WHERE processing_status IN ('pending', 'processing');
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Офлайн end-to-end бенчмарк пайплайна: без сети и ключей API.
+
+Использование:
+    python scripts/benchmark.py --calls 40 --concurrency 8 --durations 60,300,900
+    python scripts/benchmark.py --mode upload --asr-latency 0.5 --rate-429 0.05 --json bench.json
+    python scripts/benchmark.py --stub-only --port 9900     # только stub-серверы (для docker-compose)
+
+Что делает:
+  1. Генерирует ffmpeg'ом синтетическое аудио нужных длительностей (тон + шум,
+     MP3 8 кГц mono — как записи АТС). Каждый звонок получает уникальный
+     ID3-тег, чтобы кэш аудио/транскриптов не подменял работу пайплайна.
+  2. Поднимает stub-сервер (отдельный процесс), который отвечает как
+       Groq   POST /groq/openai/v1/audio/transcriptions
+       OpenAI POST /openai/v1/chat/completions, /openai/v1/audio/translations
+     с задержкой (--asr-latency + --asr-rtf × секунды аудио, --llm-latency)
+     и долей ответов 429 (--rate-429). Он же раздаёт аудио для POST /calls.
+  3. Запускает API (uvicorn) и Celery worker с GROQ_BASE_URL / OPENAI_BASE_URL
+     на stub: один на все очереди стадий (--workers single) или по воркеру на
+     очередь, как в docker-compose.yml (--workers split: audio — prefork,
+     asr и llm — threads). Вместо этого можно указать уже запущенный API (--api-url).
+  4. Отправляет звонки конкурентно через POST /calls и /calls/upload
+     (--mode url|upload|mixed) и опрашивает GET /calls/{id}/results до done/error.
+  5. Печатает throughput, p50/p95/p99 end-to-end и по стадиям (из Prometheus-
+     метрик API и воркера), пиковый RSS API и воркера.
+
+Нужны локальные Postgres (DATABASE_URL) и Redis (REDIS_URL) и ffmpeg в PATH.
+Воркер бенчмарка слушает общую очередь Celery — не запускай его рядом с
+рабочим воркером на том же Redis.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.models.models import QUESTION_FIELDS
+
+WORK_DIR = Path(os.getenv("BENCH_WORK_DIR", "/tmp/vladtrans-bench"))
+STAGES = ("download", "normalize", "transcribe", "translate", "analyze", "save")
+# Очереди стадий пайплайна (settings.celery_*_queue) + очередь по умолчанию
+QUEUES = {
+    "audio": os.getenv("CELERY_AUDIO_QUEUE", "audio"),
+    "asr": os.getenv("CELERY_ASR_QUEUE", "asr"),
+    "llm": os.getenv("CELERY_LLM_QUEUE", "llm"),
+}
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# --------------------------------------------------------------------------- #
+# Stub Groq / OpenAI
+# --------------------------------------------------------------------------- #
+def stub_app(args):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+    app = FastAPI()
+    rng = random.Random(args.seed)
+    audio_files: dict[str, bytes] = {}
+
+    async def delay_or_429(seconds: float):
+        if rng.random() < args.rate_429:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after": "1"},
+            )
+        await asyncio.sleep(seconds * rng.uniform(0.8, 1.2))
+        return None
+
+    def words(seconds: float) -> str:
+        # ~2 слова в секунду речи
+        return " ".join(rng.choice(("გამარჯობა", "კურსი", "შეკვეთა", "ფასი", "მიწოდება")) for _ in range(int(seconds * 2) + 1))
+
+    async def audio_seconds(request: Request) -> float:
+        form = await request.form()
+        audio = await form["file"].read()
+        # Пайплайн шлёт нормализованный MP3 32 kbps
+        return len(audio) / 4000
+
+    @app.post("/groq/openai/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        seconds = await audio_seconds(request)
+        if (error := await delay_or_429(args.asr_latency + seconds * args.asr_rtf)) is not None:
+            return error
+        return PlainTextResponse(words(seconds))
+
+    @app.post("/openai/v1/audio/translations")
+    async def translations(request: Request):
+        seconds = await audio_seconds(request)
+        if (error := await delay_or_429(args.asr_latency + seconds * args.asr_rtf)) is not None:
+            return error
+        return PlainTextResponse("Hello, this is a call about the course. " * (int(seconds) // 5 + 1))
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if (error := await delay_or_429(args.llm_latency)) is not None:
+            return error
+        prompt = sum(len(m["content"]) for m in body["messages"]) // 3
+        if body.get("response_format", {}).get("type") == "json_object":
+            content = json.dumps({q: rng.choice((True, True, False, None)) for q in QUESTION_FIELDS})
+        else:
+            content = body["messages"][-1]["content"]
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": len(content) // 3,
+                      "total_tokens": prompt + len(content) // 3},
+        }
+
+    @app.get("/audio/{name}")
+    async def audio(name: str, nonce: str = ""):
+        if name not in audio_files:
+            path = WORK_DIR / "audio" / name
+            if path.parent != WORK_DIR / "audio" or not path.exists():
+                return Response(status_code=404)
+            audio_files[name] = path.read_bytes()
+        return Response(audio_files[name] + id3_tag(nonce), media_type="audio/mpeg")
+
+    return app
+
+
+def run_stub(args):
+    import uvicorn
+    uvicorn.run(stub_app(args), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# --------------------------------------------------------------------------- #
+# Синтетическое аудио
+# --------------------------------------------------------------------------- #
+def synth_audio(seconds: int) -> Path:
+    """Тон + шум нужной длительности (кэшируется в WORK_DIR/audio)."""
+    path = WORK_DIR / "audio" / f"synthetic_{seconds}s.mp3"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        subprocess.run([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-f", "lavfi", "-i", f"anoisesrc=duration={seconds}:amplitude=0.05",
+            "-filter_complex", "amix=inputs=2",
+            "-ar", "8000", "-ac", "1", "-b:a", "16k", str(path),
+        ], check=True)
+    return path
+
+
+def id3_tag(nonce: str) -> bytes:
+    """ID3v1 (128 байт в конце MP3): меняет sha256 файла, не меняя звук."""
+    if not nonce:
+        return b""
+    return b"TAG" + nonce.encode()[:30].ljust(30, b"\0") + b"\0" * 94 + b"\xff"
+
+
+# --------------------------------------------------------------------------- #
+# Процессы API / worker / stub
+# --------------------------------------------------------------------------- #
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn(name: str, cmd: list[str], env: dict) -> subprocess.Popen:
+    log_path = WORK_DIR / f"{name}.log"
+    print(f"Starting {name}: {' '.join(cmd)}  (log: {log_path})")
+    return subprocess.Popen(
+        cmd, cwd=ROOT, env=env, stdout=open(log_path, "wb"), stderr=subprocess.STDOUT, start_new_session=True
+    )
+
+
+async def wait_http(url: str, proc: subprocess.Popen | None = None, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"{proc.args[0]} exited with code {proc.returncode} — see {WORK_DIR}/*.log")
+            try:
+                if (await client.get(url, timeout=2)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.3)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def _vm_hwm_kb(pid: int) -> int:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid: int) -> list[int]:
+    children = []
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            # pid (comm) state ppid ... — comm может содержать пробелы
+            if int(stat.read_text().rsplit(")", 1)[1].split()[1]) == pid:
+                children.append(int(stat.parent.name))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def peak_rss_mb(proc: subprocess.Popen | None) -> float | None:
+    """
+    VmHWM процесса + живых дочерних (процессы prefork-пула), Linux.
+    Короткоживущие ffmpeg к моменту замера уже завершились и не входят.
+    """
+    if proc is None or proc.poll() is not None:
+        return None
+    return sum(_vm_hwm_kb(pid) for pid in (proc.pid, *_children(proc.pid))) / 1024 or None
+
+
+def stop(*procs: subprocess.Popen | None) -> None:
+    for proc in procs:
+        if proc is not None and proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGTERM)
+    for proc in procs:
+        if proc is not None:
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+
+
+# --------------------------------------------------------------------------- #
+# Нагрузка
+# --------------------------------------------------------------------------- #
+async def submit(client: httpx.AsyncClient, mode: str, audio: Path, seconds: int, order_id: str, args) -> int:
+    call_date = datetime.now(timezone.utc).isoformat()
+    if mode == "upload":
+        response = await client.post("/calls/upload", files={
+            "file": (audio.name, audio.read_bytes() + id3_tag(order_id), "audio/mpeg"),
+        }, data={"order_id": order_id, "call_date": call_date, "duration_sec": str(seconds), "language": args.language})
+    else:
+        response = await client.post("/calls/", json={
+            "order_id": order_id,
+            "call_date": call_date,
+            "duration_sec": seconds,
+            "audio_url": f"{args.stub_url}/audio/{audio.name}?nonce={order_id}",
+            "language": args.language,
+        })
+    response.raise_for_status()
+    return response.json()["call_id"]
+
+
+async def wait_finished(client: httpx.AsyncClient, call_id: int, args) -> str:
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        response = await client.get(f"/calls/{call_id}/results")
+        response.raise_for_status()
+        status = response.json()["status"]
+        if status in ("done", "error"):
+            return status
+        await asyncio.sleep(args.poll_interval)
+    return "timeout"
+
+
+async def drive(args, audio: dict[int, Path]) -> tuple[list[dict], float]:
+    run_id = datetime.now().strftime("%H%M%S")
+    semaphore = asyncio.Semaphore(args.concurrency)
+    modes = ("url", "upload") if args.mode == "mixed" else (args.mode,)
+    durations = list(audio)
+    results = []
+
+    async def one(client: httpx.AsyncClient, i: int):
+        mode, seconds = modes[i % len(modes)], durations[i % len(durations)]
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                call_id = await submit(client, mode, audio[seconds], seconds, f"bench-{run_id}-{i}", args)
+                accepted = time.perf_counter() - started
+                status = await wait_finished(client, call_id, args)
+            except httpx.HTTPError as exc:
+                print(f"  call {i} ({mode}): {exc!r}")
+                call_id, accepted, status = None, None, "http_error"
+            results.append({
+                "call_id": call_id, "mode": mode, "audio_seconds": seconds, "status": status,
+                "accept_seconds": accepted, "seconds": time.perf_counter() - started,
+            })
+            if len(results) % max(1, args.calls // 10) == 0:
+                print(f"  {len(results)}/{args.calls} finished")
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(args.calls)))
+        return results, time.perf_counter() - started
+
+
+# --------------------------------------------------------------------------- #
+# Отчёт
+# --------------------------------------------------------------------------- #
+def percentiles(values: list[float]) -> dict[str, float | None]:
+    if not values:
+        return {f"p{int(q * 100)}": None for q in QUANTILES}
+    values = sorted(values)
+    return {f"p{int(q * 100)}": values[min(len(values) - 1, int(q * len(values)))] for q in QUANTILES}
+
+
+def merged_histograms(texts: list[str]) -> dict[tuple, dict[float, float]]:
+    """(метрика, метки без le) → {le: накопленный счётчик}, суммировано по всем источникам."""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    histograms: dict[tuple, dict[float, float]] = {}
+    for text in texts:
+        for family in text_string_to_metric_families(text):
+            if family.type != "histogram":
+                continue
+            for sample in family.samples:
+                if not sample.name.endswith("_bucket"):
+                    continue
+                labels = tuple((k, v) for k, v in sample.labels.items() if k != "le")
+                buckets = histograms.setdefault((family.name, labels), {})
+                le = float(sample.labels["le"])
+                buckets[le] = buckets.get(le, 0) + sample.value
+    return histograms
+
+
+def histogram_quantile(q: float, buckets: dict[float, float]) -> float | None:
+    """Как histogram_quantile в PromQL: линейная интерполяция внутри бакета."""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total == 0:
+        return None
+    rank = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return prev_bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / max(count - prev_count, 1e-9)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def histogram_rows(histograms: dict, metric: str) -> list[tuple[str, int, dict]]:
+    rows = []
+    for (name, labels), buckets in sorted(histograms.items()):
+        if name != metric:
+            continue
+        label = " ".join(v for _, v in labels) or "-"
+        rows.append((label, int(buckets[float("inf")]), {
+            f"p{int(q * 100)}": histogram_quantile(q, buckets) for q in QUANTILES
+        }))
+    return rows
+
+
+def _fmt(value: float | None) -> str:
+    return "—" if value is None else f"{value:8.2f}"
+
+
+def report(args, results: list[dict], wall: float, histograms: dict, rss: dict) -> dict:
+    done = [r for r in results if r["status"] == "done"]
+    by_status = {s: sum(1 for r in results if r["status"] == s) for s in {r["status"] for r in results}}
+    audio_minutes = sum(r["audio_seconds"] for r in done) / 60
+    summary = {
+        "calls": len(results),
+        "status": by_status,
+        "wall_seconds": round(wall, 2),
+        "calls_per_minute": round(len(done) / wall * 60, 2),
+        "audio_minutes_per_minute": round(audio_minutes / wall * 60, 2),
+        "end_to_end": {mode: percentiles([r["seconds"] for r in done if r["mode"] == mode])
+                       for mode in sorted({r["mode"] for r in results})},
+        "accept": percentiles([r["accept_seconds"] for r in results if r["accept_seconds"] is not None]),
+        "stages": {},
+        "provider_requests": {},
+        "queue_wait": {},
+        "peak_rss_mb": rss,
+    }
+
+    print(f"\n{'=' * 72}")
+    print(f"Звонков: {len(results)}  {by_status}   за {wall:.1f} с")
+    print(f"Throughput: {summary['calls_per_minute']} звонков/мин, "
+          f"{summary['audio_minutes_per_minute']} мин аудио/мин")
+    print(f"\n{'':<28}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}   (сек)")
+    accept = summary["accept"]
+    print(f"{'accept (POST)':<28}{len(results):>6}{_fmt(accept['p50'])}{_fmt(accept['p95'])}{_fmt(accept['p99'])}")
+    for mode, p in summary["end_to_end"].items():
+        n = sum(1 for r in done if r["mode"] == mode)
+        print(f"{'end-to-end ' + mode:<28}{n:>6}{_fmt(p['p50'])}{_fmt(p['p95'])}{_fmt(p['p99'])}")
+
+    for title, metric, key in (
+        ("Стадии", "vladtrans_stage_duration_seconds", "stages"),
+        ("Запросы к провайдерам", "vladtrans_provider_request_duration_seconds", "provider_requests"),
+        ("Ожидание в очереди", "vladtrans_queue_wait_seconds", "queue_wait"),
+    ):
+        rows = histogram_rows(histograms, metric)
+        if key == "stages":
+            rows.sort(key=lambda row: STAGES.index(row[0]) if row[0] in STAGES else len(STAGES))
+        print(f"\n{title} (по гистограммам Prometheus):")
+        for label, n, p in rows:
+            print(f"  {label:<26}{n:>6}{_fmt(p['p50'])}{_fmt(p['p95'])}{_fmt(p['p99'])}")
+            summary[key][label] = {"n": n, **p}
+
+    print("\nПиковый RSS: " + ", ".join(f"{k} {v:.0f} MB" if v else f"{k} —" for k, v in rss.items()))
+    return summary
+
+
+async def fetch_metrics(urls: list[str]) -> list[str]:
+    texts = []
+    async with httpx.AsyncClient(timeout=10) as client:
+        for url in urls:
+            try:
+                response = await client.get(url)
+                response.raise_for_status()
+                texts.append(response.text)
+            except httpx.HTTPError as exc:
+                print(f"Metrics unavailable at {url}: {exc!r}")
+    return texts
+
+
+async def main(args):
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    durations = [int(d) for d in args.durations.split(",")]
+    print(f"Generating synthetic audio: {durations} s")
+    audio = {seconds: synth_audio(seconds) for seconds in durations}
+
+    stub = api = None
+    workers: dict[str, subprocess.Popen] = {}
+    try:
+        if args.stub_url is None:
+            port = free_port()
+            args.stub_url = f"http://127.0.0.1:{port}"
+            stub = spawn("stub", [sys.executable, __file__, "--stub-only", "--port", str(port),
+                                  "--asr-latency", str(args.asr_latency), "--asr-rtf", str(args.asr_rtf),
+                                  "--llm-latency", str(args.llm_latency), "--rate-429", str(args.rate_429),
+                                  "--seed", str(args.seed)], os.environ.copy())
+            await wait_http(f"{args.stub_url}/docs", stub)
+
+        metrics_urls = list(args.metrics_url or [])
+        if args.api_url is None:
+            api_port = free_port()
+            args.api_url = f"http://127.0.0.1:{api_port}"
+            env = {
+                **os.environ,
+                "OPENAI_API_KEY": "bench", "GROQ_API_KEY": "bench",
+                "OPENAI_BASE_URL": f"{args.stub_url}/openai/v1",
+                "GROQ_BASE_URL": f"{args.stub_url}/groq",
+            }
+            subprocess.run([sys.executable, "scripts/init_db.py"], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+            api = spawn("api", [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port),
+                                "--log-level", "warning"], env)
+            metrics_urls.append(f"{args.api_url}/metrics")
+
+            if args.workers == "split":
+                layout = {
+                    "audio": ([QUEUES["audio"]], "prefork", args.audio_concurrency),
+                    "asr": ([QUEUES["asr"]], "threads", args.worker_concurrency),
+                    "llm": ([QUEUES["llm"], "celery"], "threads", args.worker_concurrency),
+                }
+            else:
+                layout = {"worker": ([*QUEUES.values(), "celery"], "threads", args.worker_concurrency)}
+            for name, (queues, pool, concurrency) in layout.items():
+                worker_env = {**env, "WORKER_METRICS_PORT": str(free_port())}
+                if pool == "prefork":
+                    prom_dir = WORK_DIR / f"prometheus-{name}"
+                    shutil.rmtree(prom_dir, ignore_errors=True)
+                    prom_dir.mkdir(parents=True)
+                    worker_env["PROMETHEUS_MULTIPROC_DIR"] = str(prom_dir)
+                workers[name] = spawn(name, [
+                    sys.executable, "-m", "celery", "-A", "app.core.celery_app", "worker",
+                    "-Q", ",".join(dict.fromkeys(queues)), "-n", f"bench-{name}@%h",
+                    f"--pool={pool}", f"--concurrency={concurrency}", "--prefetch-multiplier=1",
+                    "--loglevel=warning", "--without-gossip", "--without-mingle",
+                ], worker_env)
+                metrics_urls.append(f"http://127.0.0.1:{worker_env['WORKER_METRICS_PORT']}/metrics")
+
+            await wait_http(f"{args.api_url}/health", api)
+            for proc, url in zip(workers.values(), metrics_urls[-len(workers):]):
+                await wait_http(url, proc)
+
+        print(f"Sending {args.calls} calls ({args.mode}, concurrency {args.concurrency}) to {args.api_url}")
+        results, wall = await drive(args, audio)
+        histograms = merged_histograms(await fetch_metrics(metrics_urls))
+        rss = {"api": peak_rss_mb(api), **{name: peak_rss_mb(proc) for name, proc in workers.items()}}
+        summary = report(args, results, wall, histograms, rss)
+    finally:
+        stop(*workers.values(), api, stub)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "summary": summary, "calls": results}, indent=2))
+        print(f"\nSaved to {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8, help="звонков в работе одновременно")
+    parser.add_argument("--mode", choices=("url", "upload", "mixed"), default="mixed")
+    parser.add_argument("--durations", default="60,300", help="длительности синтетического аудио, сек")
+    parser.add_argument("--language", default="ka")
+    parser.add_argument("--asr-latency", type=float, default=0.3, help="базовая задержка ASR-запроса, сек")
+    parser.add_argument("--asr-rtf", type=float, default=0.005, help="+ сек задержки на секунду аудио")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="задержка chat.completions, сек")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", choices=("single", "split"), default="single",
+                        help="один воркер на все очереди или по воркеру на стадию")
+    parser.add_argument("--worker-concurrency", type=int, default=32, help="потоков воркера (asr/llm при split)")
+    parser.add_argument("--audio-concurrency", type=int, default=os.cpu_count() or 4,
+                        help="процессов prefork-воркера audio при split")
+    parser.add_argument("--timeout", type=float, default=600, help="ожидание одного звонка, сек")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--api-url", help="уже запущенный API (тогда API и воркер не запускаются)")
+    parser.add_argument("--stub-url", help="уже запущенный stub (--stub-only)")
+    parser.add_argument("--metrics-url", action="append", help="доп. /metrics для отчёта по стадиям")
+    parser.add_argument("--json", help="сохранить сводку и все звонки в JSON")
+    parser.add_argument("--stub-only", action="store_true", help="только запустить stub-сервер")
+    parser.add_argument("--port", type=int, default=9900, help="порт stub-сервера для --stub-only")
+    args = parser.parse_args()
+
+    if args.stub_only:
+        run_stub(args)
+    else:
+        asyncio.run(main(args))
@@ -4,18 +4,30 @@
 
 Использование:
     python scripts/check_results.py
+    python scripts/check_results.py --wait --timeout 1800     # ждать завершения всех
+    python scripts/check_results.py --log test_audio/load_XXXX.json --wait --quiet
 
 Читает test_audio/sent_calls.json (создаётся send_test_calls.py),
 опрашивает GET /calls/{id}/results для каждого отправленного звонка
 и выводит сводную таблицу с результатами.
 
+С --wait звонки опрашиваются параллельно (общий httpx.AsyncClient) с
+экспоненциальным backoff до done/error, в конце — гистограмма end-to-end
+латентности (от sent_at до готовности) и throughput.
+
 Настройки:
     API_URL  — базовый URL API  (по умолчанию http://localhost:8000)
 """
 
+import argparse
+import asyncio
 import json
 import os
+import random
 import sys
+import time
+from collections import Counter
+from datetime import datetime
 from pathlib import Path
 
 import httpx
@@ -27,6 +39,11 @@ API_URL = os.getenv("API_URL", "http://localhost:8000")
 AUDIO_DIR = Path(__file__).resolve().parent.parent / "test_audio"
 SENT_LOG = AUDIO_DIR / "sent_calls.json"
 
+# Границы бакетов гистограммы латентности, сек
+LATENCY_BUCKETS = (5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 15.0
+
 # Группировка вопросов для читаемого вывода
 SECTIONS = {
     "1. Приветствие":        ["q1_1", "q1_2", "q1_3"],
@@ -54,12 +71,80 @@ def bool_icon(val: bool | None) -> str:
     return "—"  # null = не применимо
 
 
-def fetch_results(call_id: int) -> dict:
-    r = httpx.get(f"{API_URL}/calls/{call_id}/results", timeout=15)
+async def fetch_results(client: httpx.AsyncClient, call_id: int, include_transcript: bool = True) -> dict:
+    params = {"include_transcript": "true"} if include_transcript else {}
+    r = await client.get(f"/calls/{call_id}/results", params=params)
     r.raise_for_status()
     return r.json()
 
 
+async def wait_for_result(
+    client: httpx.AsyncClient, call_id: int, timeout: float, include_transcript: bool = False
+) -> dict:
+    """
+    Опрашивает результат до done/error: пауза растёт ×1.5 от POLL_INITIAL_DELAY
+    до POLL_MAX_DELAY (с джиттером). Сетевые ошибки и 5xx не прерывают ожидание.
+    По таймауту возвращает последний ответ со status="timeout".
+    """
+    deadline = time.monotonic() + timeout
+    delay = POLL_INITIAL_DELAY
+    data: dict = {"call_id": call_id}
+    while True:
+        try:
+            data = await fetch_results(client, call_id, include_transcript=False)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code < 500:
+                return {"call_id": call_id, "status": "error", "error": str(e)}
+        except httpx.TransportError:
+            pass
+        if data.get("status") in ("done", "error"):
+            if include_transcript and data["status"] == "done":
+                data = await fetch_results(client, call_id)
+            return data
+        if time.monotonic() + delay > deadline:
+            return {**data, "status": "timeout"}
+        await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+        delay = min(delay * 1.5, POLL_MAX_DELAY)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def print_latency_report(latencies: list[float], statuses: Counter, elapsed: float, audio_seconds: float = 0):
+    """Гистограмма end-to-end латентности done-звонков и throughput."""
+    print(f"\n{'=' * 60}")
+    print(f"{'НАГРУЗКА':^60}")
+    print(f"{'=' * 60}")
+    print("Статусы:  " + ", ".join(f"{status}={n}" for status, n in statuses.most_common()))
+    if not latencies:
+        print("Нет завершённых звонков.")
+        return
+
+    print(f"Латентность, сек: min {min(latencies):.1f}  p50 {_percentile(latencies, 0.5):.1f}  "
+          f"p90 {_percentile(latencies, 0.9):.1f}  p95 {_percentile(latencies, 0.95):.1f}  "
+          f"p99 {_percentile(latencies, 0.99):.1f}  max {max(latencies):.1f}")
+    # Бакет — первая граница >= значения; None — больше последней границы
+    counts = Counter(next((b for b in LATENCY_BUCKETS if v <= b), None) for v in latencies)
+    widest = max(counts.values())
+    lower = 0
+    for bucket in LATENCY_BUCKETS:
+        if lower >= max(latencies):
+            break
+        n = counts.get(bucket, 0)
+        print(f"  {f'{lower}–{bucket} с':>12}  {n:>5}  {'█' * round(n / widest * 40)}")
+        lower = bucket
+    if None in counts:
+        print(f"  {f'> {lower} с':>12}  {counts[None]:>5}  {'█' * round(counts[None] / widest * 40)}")
+
+    print(f"Throughput: {len(latencies) / elapsed * 60:.1f} звонков/мин за {elapsed:.0f} с", end="")
+    if audio_seconds:
+        print(f", {audio_seconds / elapsed:.1f} мин аудио/мин")
+    else:
+        print()
+
+
 def print_call_result(filename: str, call_id: int, data: dict):
     status = data.get("status")
     print(f"\n{'=' * 60}")
@@ -89,38 +174,83 @@ def print_call_result(filename: str, call_id: int, data: dict):
         print(f"  {transcript[:300]}{'...' if len(transcript) > 300 else ''}")
 
 
+async def check(sent: dict, args) -> tuple[list[tuple], dict[str, float]]:
+    """(filename, call_id, status, total_score) по каждому звонку и время готовности (--wait)."""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    finished_at: dict[str, float] = {}
+
+    async def one(client: httpx.AsyncClient, call_id: int, key: str) -> dict | Exception:
+        async with semaphore:
+            try:
+                if args.wait:
+                    data = await wait_for_result(client, call_id, args.timeout, include_transcript=not args.quiet)
+                    finished_at[key] = time.time()
+                    return data
+                return await fetch_results(client, call_id)
+            except Exception as e:
+                return e
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=API_URL, timeout=15, limits=limits) as client:
+        results = await asyncio.gather(*(one(client, info["call_id"], key) for key, info in sent.items()))
+
+    summary = []
+    for (filename, info), data in zip(sent.items(), results):
+        call_id = info["call_id"]
+        if isinstance(data, Exception):
+            print(f"\n[ERROR] {filename} (call_id={call_id}): {data}")
+            summary.append((filename, call_id, "error", None))
+            continue
+        if not args.quiet:
+            print_call_result(filename, call_id, data)
+        summary.append((filename, call_id, data.get("status"), data.get("total_score")))
+    return summary, finished_at
+
+
+def print_wait_report(sent: dict, summary: list[tuple], finished_at: dict[str, float]):
+    """Латентность от sent_at (send_test_calls.py) до момента, когда опрос увидел done."""
+    sent_at = {key: datetime.fromisoformat(info["sent_at"]).timestamp() for key, info in sent.items()}
+    done = [key for key, _, status, _ in summary if status == "done"]
+    latencies = [finished_at[key] - sent_at[key] for key in done]
+    elapsed = max((finished_at[key] for key in done), default=time.time()) - min(sent_at.values())
+    print_latency_report(latencies, Counter(row[2] for row in summary), elapsed)
+
+
 def main():
-    if not SENT_LOG.exists():
-        print(f"Лог {SENT_LOG} не найден. Сначала запустите send_test_calls.py.")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", type=Path, default=SENT_LOG, help="лог отправленных звонков")
+    parser.add_argument("--wait", action="store_true", help="ждать done/error с backoff и вывести латентность")
+    parser.add_argument("--timeout", type=float, default=1800, help="ожидание одного звонка с --wait, сек")
+    parser.add_argument("--concurrency", type=int, default=20, help="одновременных запросов к API")
+    parser.add_argument("--quiet", action="store_true", help="без анкеты по каждому звонку")
+    args = parser.parse_args()
+
+    if not args.log.exists():
+        print(f"Лог {args.log} не найден. Сначала запустите send_test_calls.py.")
         sys.exit(1)
 
-    sent = json.loads(SENT_LOG.read_text())
+    sent = json.loads(args.log.read_text())
     if not sent:
         print("Нет отправленных звонков.")
         sys.exit(0)
 
-    summary = []
-
-    for filename, info in sent.items():
-        call_id = info["call_id"]
-        try:
-            data = fetch_results(call_id)
-            print_call_result(filename, call_id, data)
-            summary.append((filename, call_id, data.get("status"), data.get("total_score")))
-        except Exception as e:
-            print(f"\n[ERROR] {filename} (call_id={call_id}): {e}")
-            summary.append((filename, call_id, "error", None))
+    summary, finished_at = asyncio.run(check(sent, args))
 
-    # Итоговая сводка
+    # Итоговая сводка (с --quiet — только не done)
     print(f"\n{'=' * 60}")
     print(f"{'СВОДКА':^60}")
     print(f"{'=' * 60}")
     print(f"{'Файл':<35} {'ID':>5} {'Статус':<12} {'Балл':>5}")
     print(f"{'-' * 60}")
     for fname, cid, st, sc in summary:
+        if args.quiet and st == "done":
+            continue
         score_str = str(sc) if sc is not None else "—"
         print(f"{fname:<35} {cid:>5} {st:<12} {score_str:>5}")
 
+    if args.wait:
+        print_wait_report(sent, summary, finished_at)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Сравнение режимов анализа: two_step (перевод → оценка) vs single_pass (оценка оригинала).
+
+Использование:
+    python scripts/eval_analysis_modes.py --limit 50 --language ka
+
+Берёт из БД последние обработанные звонки с транскриптом на указанном языке,
+прогоняет каждый через оба режима и выводит:
+  - согласие ответов по каждому вопросу анкеты и в целом,
+  - среднее абсолютное расхождение total_score,
+  - латентность и токены на звонок для каждого режима.
+Нужны DATABASE_URL и OPENAI_API_KEY (реальные запросы к OpenAI!).
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import select
+
+from app.core.database import AsyncSessionLocal
+from app.models.models import Call
+from app.services.analyzer import (
+    EXPECTED_FIELDS,
+    client,
+    parse_scoring_response,
+    scoring_request,
+    translation_request,
+)
+
+FIELDS = sorted(EXPECTED_FIELDS, key=lambda f: tuple(int(x) for x in f[1:].split("_")))
+
+
+async def _complete(request: dict) -> tuple[str, int]:
+    response = await client.chat.completions.create(**request)
+    return response.choices[0].message.content, response.usage.total_tokens
+
+
+async def run_two_step(transcript: str) -> dict:
+    started = time.perf_counter()
+    translated, t1 = await _complete(translation_request(transcript))
+    raw, t2 = await _complete(scoring_request(translated))
+    return {"answers": parse_scoring_response(raw), "seconds": time.perf_counter() - started, "tokens": t1 + t2}
+
+
+async def run_single_pass(transcript: str, language: str) -> dict:
+    started = time.perf_counter()
+    raw, tokens = await _complete(scoring_request(transcript, language))
+    return {"answers": parse_scoring_response(raw), "seconds": time.perf_counter() - started, "tokens": tokens}
+
+
+def _score(answers: dict) -> int:
+    return sum(1 for v in answers.values() if v is True)
+
+
+async def load_transcripts(language: str, limit: int) -> list[tuple[int, str]]:
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(Call.id, Call.transcript_text)
+            .where(Call.language == language, Call.transcript_text.is_not(None))
+            .order_by(Call.id.desc())
+            .limit(limit)
+        )
+        return [(r.id, r.transcript_text) for r in rows]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--language", default="ka")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output", help="сохранить ответы обоих режимов в JSON")
+    args = parser.parse_args()
+
+    calls = await load_transcripts(args.language, args.limit)
+    if not calls:
+        print(f"Нет звонков с транскриптом на языке '{args.language}'.")
+        sys.exit(0)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def evaluate(call_id: int, transcript: str) -> dict | None:
+        async with semaphore:
+            try:
+                two_step, single = await asyncio.gather(
+                    run_two_step(transcript), run_single_pass(transcript, args.language)
+                )
+            except Exception as e:
+                print(f"  [ERROR] call_id={call_id}: {e}")
+                return None
+        print(f"  call_id={call_id}: two_step={_score(two_step['answers'])} single_pass={_score(single['answers'])}")
+        return {"call_id": call_id, "two_step": two_step, "single_pass": single}
+
+    print(f"Оцениваю {len(calls)} звонков ({args.language}) в двух режимах...")
+    results = [r for r in await asyncio.gather(*(evaluate(*c) for c in calls)) if r]
+    if not results:
+        sys.exit(1)
+
+    print(f"\n{'=' * 60}")
+    print(f"{'СОГЛАСИЕ two_step vs single_pass':^60}")
+    print(f"{'=' * 60}")
+    total_agree = 0
+    for field in FIELDS:
+        agree = sum(1 for r in results if r["two_step"]["answers"][field] == r["single_pass"]["answers"][field])
+        total_agree += agree
+        print(f"  {field:<7} {agree / len(results) * 100:5.1f}%")
+
+    overall = total_agree / (len(results) * len(FIELDS)) * 100
+    mae = statistics.mean(
+        abs(_score(r["two_step"]["answers"]) - _score(r["single_pass"]["answers"])) for r in results
+    )
+    print(f"{'-' * 60}")
+    print(f"Звонков:                 {len(results)}")
+    print(f"Согласие по ответам:     {overall:.1f}%")
+    print(f"MAE total_score:         {mae:.2f}")
+    for mode in ("two_step", "single_pass"):
+        seconds = statistics.median(r[mode]["seconds"] for r in results)
+        tokens = statistics.mean(r[mode]["tokens"] for r in results)
+        print(f"{mode:<12} латентность p50 {seconds:6.1f} с, токенов в среднем {tokens:8.0f}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, ensure_ascii=False))
+        print(f"\nОтветы сохранены: {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
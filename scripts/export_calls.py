@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Выгрузка оценённых звонков (анкета + outcomes) в CSV или Parquet напрямую из БД.
+
+Использование:
+    python scripts/export_calls.py --output calls.parquet --date-from 2025-01-01 --date-to 2025-02-01
+    python scripts/export_calls.py --output calls.csv --operator-id 7
+
+Формат по расширению --output (или --format). Строки читаются server-side
+курсором и пишутся пачками — память не зависит от размера выгрузки.
+Parquet требует pyarrow (pip install pyarrow). Нужен DATABASE_URL.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.export import FORMATS, export_chunks, export_query
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--date-from", type=datetime.fromisoformat)
+    parser.add_argument("--date-to", type=datetime.fromisoformat)
+    parser.add_argument("--operator-id", type=int)
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    fmt = args.format or output.suffix.lstrip(".").lower()
+    if fmt not in FORMATS:
+        parser.error(f"Неизвестный формат '{fmt}' — укажи --format csv|parquet")
+
+    started = time.perf_counter()
+    written = 0
+    with open(output, "wb") as f:
+        async for chunk in export_chunks(fmt, export_query(args.date_from, args.date_to, args.operator_id)):
+            f.write(chunk)
+            written += len(chunk)
+
+    print(f"Готово: {output} ({written / 1024 / 1024:.1f} MB за {time.perf_counter() - started:.1f} с)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,40 +1,153 @@
 """
 Применяет SQL миграции к БД.
-Запускается автоматически при старте контейнера.
-Idempotent — повторный запуск не сломает уже существующие таблицы.
+Запускается автоматически при старте контейнера (start.sh).
+
+Применённые миграции записываются в таблицу schema_migrations (версия = имя
+файла, sha256 содержимого, время применения) — при следующих стартах они
+пропускаются, и старт не зависит от размера таблиц (раньше каждый старт заново
+выполнял все файлы, включая пересоздание total_score в 002 — полная перезапись
+questionnaire_responses).
+
+  - Каждая миграция выполняется в своей транзакции вместе с записью в ledger:
+    упала — откатывается целиком и будет применена при следующем старте.
+  - pg_advisory_lock на время прогона: параллельно стартующие API и воркеры
+    ждут первого, затем видят, что всё применено, и выходят.
+  - Изменился уже применённый файл (checksum не совпал) — ошибка: новая схема
+    оформляется новым файлом. --repair принимает текущие checksum'ы.
+
+База, размеченная старым скриптом (таблицы есть, ledger пуст): все файлы
+выполняются ещё один раз (они идемпотентны) и записываются в ledger.
+--baseline вместо этого только записывает их как применённые.
+
+Использование:
+    python scripts/init_db.py              # применить новые
+    python scripts/init_db.py --status     # что применено / что ждёт
+    python scripts/init_db.py --baseline   # разметить существующую БД без выполнения
 """
+import argparse
+import hashlib
 import sys
-import psycopg2
+import time
 from pathlib import Path
 
+import psycopg2
+
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from app.core.config import settings
 
 MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
 
+# Ключ pg_advisory_lock — общий для всех процессов, запускающих миграции
+MIGRATIONS_LOCK_KEY = 7_421_001
+
+LEDGER_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version      TEXT PRIMARY KEY,
+    checksum     TEXT NOT NULL,
+    applied_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    execution_ms INTEGER
+)
+"""
 
-def run():
-    conn = psycopg2.connect(settings.sync_database_url)
-    conn.autocommit = True
-    cur = conn.cursor()
 
+def _migrations() -> list[tuple[str, str, str]]:
+    """(version, checksum, sql) в порядке применения."""
+    result = []
     for sql_file in sorted(MIGRATIONS_DIR.glob("*.sql")):
-        print(f"Applying {sql_file.name}...")
         sql = sql_file.read_text()
-        try:
-            cur.execute(sql)
-            print(f"  OK: {sql_file.name}")
-        except psycopg2.errors.DuplicateTable:
-            print(f"  SKIP: {sql_file.name} (tables already exist)")
-        except Exception as e:
-            print(f"  ERROR in {sql_file.name}: {e}")
-            raise
-
-    cur.close()
-    conn.close()
+        result.append((sql_file.name, hashlib.sha256(sql.encode()).hexdigest(), sql))
+    return result
+
+
+def _applied(cur) -> dict[str, str]:
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cur.fetchall())
+
+
+def _plan(migrations: list[tuple[str, str, str]], applied: dict[str, str], repair: bool = False):
+    """
+    (ожидающие миграции, [(version, checksum)] для --repair).
+    Изменённый применённый файл без repair — RuntimeError.
+    """
+    pending, repaired = [], []
+    for version, checksum, sql in migrations:
+        if version not in applied:
+            pending.append((version, checksum, sql))
+        elif applied[version] != checksum:
+            if not repair:
+                raise RuntimeError(
+                    f"{version} changed after it was applied (checksum mismatch). "
+                    f"Put schema changes into a new migration file, or run with --repair "
+                    f"if the edit is known to be harmless."
+                )
+            repaired.append((version, checksum))
+    return pending, repaired
+
+
+def run(baseline: bool = False, repair: bool = False, status: bool = False):
+    conn = psycopg2.connect(settings.sync_database_url)
+    cur = conn.cursor()
+    try:
+        started = time.perf_counter()
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,))
+        cur.execute(LEDGER_DDL)
+        conn.commit()
+        waited = time.perf_counter() - started
+        if waited > 1:
+            print(f"Waited {waited:.1f}s for migrations lock")
+
+        applied = _applied(cur)
+        pending, repaired = _plan(_migrations(), applied, repair)
+        for version, checksum in repaired:
+            cur.execute("UPDATE schema_migrations SET checksum = %s WHERE version = %s", (checksum, version))
+            conn.commit()
+            print(f"  REPAIRED: {version}")
+
+        if status:
+            for version in sorted(applied):
+                print(f"  applied: {version}")
+            for version, _, _ in pending:
+                print(f"  pending: {version}")
+            return
+
+        for version, checksum, sql in pending:
+            if baseline:
+                print(f"Baselining {version}...")
+                cur.execute("INSERT INTO schema_migrations (version, checksum) VALUES (%s, %s)", (version, checksum))
+                conn.commit()
+                continue
+
+            print(f"Applying {version}...")
+            started = time.perf_counter()
+            try:
+                cur.execute(sql)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, checksum, execution_ms) VALUES (%s, %s, %s)",
+                    (version, checksum, int((time.perf_counter() - started) * 1000)),
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"  ERROR in {version}: {e}")
+                raise
+            print(f"  OK: {version} ({time.perf_counter() - started:.2f}s)")
+
+        if not pending:
+            print("Schema is up to date.")
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+        cur.close()
+        conn.close()
     print("DB initialization complete.")
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--status", action="store_true", help="показать применённые и ожидающие миграции")
+    mode.add_argument("--baseline", action="store_true", help="записать ожидающие миграции как применённые, не выполняя")
+    parser.add_argument("--repair", action="store_true", help="принять изменённые checksum'ы применённых миграций")
+    args = parser.parse_args()
+    run(baseline=args.baseline, repair=args.repair, status=args.status)
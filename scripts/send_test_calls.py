@@ -4,18 +4,33 @@
 
 Использование:
     python scripts/send_test_calls.py
+    python scripts/send_test_calls.py --load --count 200 --concurrency 20
+    python scripts/send_test_calls.py --load --count 500 --rate 2 --dir /data/recordings
 
 Кладёшь аудио файлы (.mp3 / .wav / .ogg / .m4a) в папку test_audio/,
 запускаешь скрипт — он отправляет каждый файл на POST /calls/upload
 и сохраняет результат в test_audio/sent_calls.json.
 
+--load — нагрузочный режим (общий httpx.AsyncClient): записи из папки
+проигрываются по кругу --count раз, либо с заданной частотой (--rate звонков/с,
+открытый цикл), либо с фиксированным числом звонков в работе (--concurrency).
+Каждый звонок ждёт done/error (опрос с backoff, см. check_results.py), в конце —
+гистограмма end-to-end латентности и throughput. К каждой копии дописывается
+ID3-тег с уникальным order_id, чтобы кэш аудио на сервере не срабатывал
+(--reuse-audio — отправлять файлы как есть). Лог — test_audio/load_<время>.json,
+его можно перепроверить: python scripts/check_results.py --log ... --wait
+
 Настройки — переменные окружения или .env:
     API_URL  — базовый URL API  (по умолчанию http://localhost:8000)
 """
 
+import argparse
+import asyncio
 import json
 import os
 import sys
+import time
+from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -57,7 +72,100 @@ def send_file(path: Path, operator_id: int | None = None) -> dict:
     return response.json()
 
 
+def id3_tag(order_id: str) -> bytes:
+    """ID3v1 в конец файла: другой sha256 при том же звуке."""
+    return b"TAG" + order_id.encode()[:30].ljust(30, b"\0") + b"\0" * 94 + b"\xff"
+
+
+async def send_file_async(client: httpx.AsyncClient, path: Path, order_id: str, unique: bool) -> dict:
+    audio = await asyncio.to_thread(path.read_bytes)
+    if unique:
+        audio += id3_tag(order_id)
+    response = await client.post(
+        "/calls/upload",
+        files={"file": (path.name, audio, "audio/mpeg")},
+        data={"order_id": order_id, "call_date": datetime.now(timezone.utc).isoformat()},
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def run_load(audio_files: list[Path], args):
+    from check_results import print_latency_report, wait_for_result
+
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_path = AUDIO_DIR / f"load_{run_id}.json"
+    jobs = [audio_files[i % len(audio_files)] for i in range(args.count or len(audio_files))]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    sent: dict[str, dict] = {}
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    audio_seconds = 0.0
+
+    async def one(client: httpx.AsyncClient, i: int, path: Path):
+        nonlocal audio_seconds
+        if args.rate:
+            # Открытый цикл: старт по расписанию, независимо от того, как быстро отвечает сервер
+            await asyncio.sleep(max(0.0, started + i / args.rate - time.monotonic()))
+        async with semaphore:
+            order_id = f"{path.stem}-{run_id}-{i}"
+            t0 = time.monotonic()
+            try:
+                result = await send_file_async(client, path, order_id, unique=not args.reuse_audio)
+            except httpx.HTTPError as e:
+                print(f"  ERROR {order_id}: {e!r}")
+                statuses["send_error"] += 1
+                return
+            sent[order_id] = {
+                "call_id": result["call_id"],
+                "status": result["status"],
+                "sent_at": datetime.now(timezone.utc).isoformat(),
+            }
+            if args.no_wait:
+                statuses["sent"] += 1
+                return
+            data = await wait_for_result(client, result["call_id"], args.timeout)
+        statuses[data["status"]] += 1
+        if data["status"] == "done":
+            latencies.append(time.monotonic() - t0)
+            audio_seconds += data.get("duration_sec") or 0
+        finished = sum(statuses.values())
+        if finished % max(1, len(jobs) // 20) == 0:
+            print(f"  {finished}/{len(jobs)}  {dict(statuses)}")
+
+    # Без --rate конкурентность — единственный ограничитель; с --rate — потолок на случай, если сервер не успевает
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    mode = f"rate {args.rate}/s" if args.rate else f"concurrency {args.concurrency}"
+    print(f"Load: {len(jobs)} calls from {len(audio_files)} files, {mode} → {API_URL}")
+    started = time.monotonic()
+    async with httpx.AsyncClient(base_url=API_URL, timeout=120, limits=limits) as client:
+        await asyncio.gather(*(one(client, i, path) for i, path in enumerate(jobs)))
+    elapsed = time.monotonic() - started
+
+    log_path.write_text(json.dumps(sent, indent=2, ensure_ascii=False))
+    print(f"\nЛог: {log_path}")
+    if args.no_wait:
+        print(f"Отправлено {len(sent)} звонков за {elapsed:.1f} с ({len(sent) / elapsed:.1f}/с)")
+        print(f"Дождаться результатов: python scripts/check_results.py --log {log_path} --wait --quiet")
+        return
+    print_latency_report(latencies, statuses, elapsed, audio_seconds / 60)
+
+
 def main():
+    global AUDIO_DIR, SENT_LOG
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", type=Path, default=AUDIO_DIR, help="папка с записями")
+    parser.add_argument("--load", action="store_true", help="нагрузочный режим")
+    parser.add_argument("--count", type=int, help="сколько звонков отправить (--load; по умолчанию — по разу каждый файл)")
+    parser.add_argument("--concurrency", type=int, default=10, help="звонков в работе одновременно (--load)")
+    parser.add_argument("--rate", type=float, help="звонков в секунду, открытый цикл (--load)")
+    parser.add_argument("--timeout", type=float, default=1800, help="ожидание одного звонка, сек (--load)")
+    parser.add_argument("--no-wait", action="store_true", help="только отправить, не ждать результатов (--load)")
+    parser.add_argument("--reuse-audio", action="store_true", help="не делать копии уникальными (--load)")
+    args = parser.parse_args()
+    AUDIO_DIR = args.dir
+    SENT_LOG = AUDIO_DIR / "sent_calls.json"
+
     if not AUDIO_DIR.exists():
         print(f"Папка {AUDIO_DIR} не найдена. Создайте её и положите в неё аудио файлы.")
         sys.exit(1)
@@ -71,6 +179,10 @@ def main():
         print(f"В папке {AUDIO_DIR} нет аудио файлов ({', '.join(AUDIO_EXTENSIONS)}).")
         sys.exit(0)
 
+    if args.load:
+        asyncio.run(run_load(audio_files, args))
+        return
+
     sent = load_sent()
     new_count = 0
 
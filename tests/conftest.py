@@ -0,0 +1,34 @@
+"""
+Общие фикстуры. Тестам не нужны Postgres, Redis и ключи провайдеров:
+Redis — in-process fakeredis (Lua через lupa), сессия БД — заглушки в самих тестах.
+"""
+import os
+import weakref
+
+# Settings требует ключи при импорте app.*
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+import fakeredis
+import pytest
+
+from app.core import redis as app_redis
+from app.core.config import settings
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """get_redis() во всех модулях отдаёт FakeAsyncRedis; состояние общее в пределах теста."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(app_redis, "_clients", weakref.WeakKeyDictionary())
+    monkeypatch.setattr(
+        app_redis.aioredis, "from_url",
+        lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs),
+    )
+    return server
+
+
+@pytest.fixture(autouse=True)
+def rate_limit_disabled(monkeypatch):
+    """Лимитер ходит в Redis — по умолчанию выключен; тесты ratelimit включают его сами."""
+    monkeypatch.setattr(settings, "rate_limit_enabled", False)
@@ -0,0 +1,17 @@
+"""Заглушки, общие для нескольких тестовых модулей."""
+
+
+class FakeRequest:
+    """Тело запроса для эндпоинтов, читающих Request напрямую (stream — кусками по step байт)."""
+
+    def __init__(self, body: bytes, content_type: str = "application/json", step: int = 7):
+        self._body = body
+        self.step = step
+        self.headers = {"content-type": content_type}
+
+    async def body(self):
+        return self._body
+
+    async def stream(self):
+        for start in range(0, len(self._body), self.step):
+            yield self._body[start:start + self.step]
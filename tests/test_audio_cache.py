@@ -0,0 +1,93 @@
+import hashlib
+import os
+import time
+
+from app.services.audio_cache import SEGMENTS_MANIFEST, AudioCache, hash_file
+
+AUDIO_HASH = "ab" * 32
+
+
+def _segments(path, count: int, size: int = 10):
+    path.mkdir()
+    for i in range(count):
+        (path / f"chunk_{i:03d}.mp3").write_bytes(bytes([i]) * size)
+    return path
+
+
+def _age(path, seconds: float):
+    """Сдвигает mtime назад — запись выглядит давно использованной."""
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_hash_file_is_sha256_of_content(tmp_path):
+    path = tmp_path / "a.mp3"
+    path.write_bytes(b"x" * 3_000_000)
+
+    assert hash_file(path) == hashlib.sha256(b"x" * 3_000_000).hexdigest()
+
+
+def test_transcript_round_trip_keyed_by_language_and_model(tmp_path):
+    cache = AudioCache(tmp_path / "cache", 10**6)
+    key = cache.transcript_key(AUDIO_HASH, "ka", "whisper-large-v3")
+    cache.put_transcript(key, "გამარჯობა")
+
+    assert cache.get_transcript(key) == "გამარჯობა"
+    assert cache.get_transcript(cache.transcript_key(AUDIO_HASH, "ru", "whisper-large-v3")) is None
+    assert cache.get_transcript(cache.transcript_key(AUDIO_HASH, "ka", "whisper-1")) is None
+
+
+def test_segments_are_linked_into_the_call_dir(tmp_path):
+    cache = AudioCache(tmp_path / "cache", 10**6)
+    entry = cache.put_segments(AUDIO_HASH, _segments(tmp_path / "src", 3))
+
+    assert (entry / SEGMENTS_MANIFEST).read_text() == "3"
+    assert cache.link_segments(AUDIO_HASH, tmp_path / "work")
+    assert sorted(p.name for p in (tmp_path / "work").iterdir()) == [
+        "chunk_000.mp3", "chunk_001.mp3", "chunk_002.mp3",
+    ]
+    assert not cache.link_segments("cd" * 32, tmp_path / "other")
+
+
+def test_partially_evicted_entry_is_a_miss(tmp_path):
+    cache = AudioCache(tmp_path / "cache", 10**6)
+    entry = cache.put_segments(AUDIO_HASH, _segments(tmp_path / "src", 3))
+    (entry / "chunk_002.mp3").unlink()
+
+    assert not cache.link_segments(AUDIO_HASH, tmp_path / "work")
+    assert not (tmp_path / "work").exists()
+
+
+def test_entry_without_manifest_is_a_miss(tmp_path):
+    cache = AudioCache(tmp_path / "cache", 10**6)
+    entry = cache.put_segments(AUDIO_HASH, _segments(tmp_path / "src", 2))
+    (entry / SEGMENTS_MANIFEST).unlink()
+
+    assert not cache.link_segments(AUDIO_HASH, tmp_path / "work")
+
+
+def test_size_is_tracked_incrementally(tmp_path):
+    cache = AudioCache(tmp_path / "cache", 10**6)
+    cache.put_transcript("a" * 64, "x" * 100)
+    cache.put_segments(AUDIO_HASH, _segments(tmp_path / "src", 3, size=50))
+    # Перезапись той же записи не считается дважды
+    cache.put_transcript("a" * 64, "y" * 40)
+
+    assert cache._size == 40 + 3 * 50 + 1
+    assert cache._size == sum(size for _, size, _ in cache._scan())
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = AudioCache(tmp_path / "cache", 350)
+    for name, age in (("old", 300), ("used", 400), ("new", 100)):
+        cache.put_transcript(name * 20, "x" * 100)
+        _age(cache._path(f"{name * 20}.txt"), age)
+    # Попадание обновляет mtime: самая старая запись становится свежей
+    assert cache.get_transcript("used" * 20) is not None
+
+    cache.put_transcript("next" * 16, "x" * 100)
+
+    assert cache.get_transcript("old" * 20) is None
+    for name in ("used" * 20, "new" * 20, "next" * 16):
+        assert cache.get_transcript(name) is not None
+    assert cache._size <= 350 * 0.9
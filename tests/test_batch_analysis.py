@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from app.models.models import Call
+from app.services import batch_analysis
+from app.services.batch_analysis import CLAIM_PREFIX, _batch_line, _result_content
+
+
+class FakeSession:
+    """AsyncSession для batch_analysis: scalars() отдаёт заданные строки, execute() запоминает запросы."""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.executed = []
+        self.commits = 0
+
+    async def scalars(self, stmt):
+        return SimpleNamespace(all=lambda: self.rows)
+
+    async def execute(self, stmt):
+        self.executed.append(stmt.compile().params)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _ok(custom_id: str, content: str) -> dict:
+    body = {"model": "gpt-4o-mini", "usage": None, "choices": [{"message": {"content": content}}]}
+    return {"custom_id": custom_id, "response": {"status_code": 200, "body": body}}
+
+
+def _batch_call(call_id: int, **kwargs) -> Call:
+    fields = dict(
+        id=call_id, priority="batch", processing_status="processing", processing_stage="transcribe",
+        language="ru", transcript_text="текст", audio_url=f"http://x/{call_id}.mp3", analysis_batch_id="batch_1",
+    )
+    return Call(**{**fields, **kwargs})
+
+
+@pytest.fixture
+def side_effects(monkeypatch):
+    """Поставленные analyze_call и события — без Celery и Redis."""
+    from app import tasks
+
+    enqueued, events = [], []
+    monkeypatch.setattr(tasks.analyze_call, "delay", lambda *args: enqueued.append(args))
+    monkeypatch.setattr(batch_analysis, "publish_call_event", mock.AsyncMock(side_effect=events.append))
+    monkeypatch.setattr(batch_analysis.results_cache, "invalidate", mock.AsyncMock())
+    return SimpleNamespace(enqueued=enqueued, events=events)
+
+
+def test_batch_line_translates_first_then_scores():
+    translate = _batch_line(_batch_call(1, language="ka"))
+    score = _batch_line(_batch_call(2, language="ka", processing_stage="translate", translated_text="text"))
+    direct = _batch_line(_batch_call(3, language="ru"))
+
+    assert translate["custom_id"] == "translate:1"
+    assert score["custom_id"] == "analyze:2"
+    assert direct["custom_id"] == "analyze:3"
+    assert translate["url"] == score["url"] == batch_analysis.BATCH_ENDPOINT
+
+
+def test_result_content_raises_for_failed_item():
+    assert _result_content(_ok("analyze:1", "{}")) == "{}"
+    with pytest.raises(RuntimeError):
+        _result_content({"custom_id": "analyze:1", "error": {"message": "bad"}})
+    with pytest.raises(RuntimeError):
+        _result_content({"custom_id": "analyze:1", "response": {"status_code": 500, "body": {"error": "x"}}})
+
+
+def test_expired_batch_keeps_partial_output_and_requeues_the_rest(monkeypatch, side_effects):
+    translated = _batch_call(1, language="ka")
+    failed = _batch_call(2)
+    missing = _batch_call(3)
+    db = FakeSession([translated, failed, missing])
+    output = "\n".join(json.dumps(item) for item in (
+        _ok("translate:1", "translated"),
+        {"custom_id": "analyze:2", "error": {"message": "bad"}},
+    ))
+    monkeypatch.setattr(batch_analysis.client.batches, "retrieve", mock.AsyncMock(
+        return_value=SimpleNamespace(status="expired", output_file_id="file_out", error_file_id=None)
+    ))
+    monkeypatch.setattr(batch_analysis.client.files, "content", mock.AsyncMock(return_value=SimpleNamespace(text=output)))
+
+    assert asyncio.run(batch_analysis._poll_batch(db, "batch_1")) == 0
+
+    # Перевод применён — звонок ждёт следующего батча (оценка)
+    assert (translated.translated_text, translated.processing_stage) == ("translated", "translate")
+    assert translated.priority == "batch" and translated.analysis_batch_id is None
+    # Ошибка строки и отсутствие результата — обычный путь, не error
+    for call in (failed, missing):
+        assert (call.priority, call.processing_status, call.analysis_batch_id) == ("normal", "processing", None)
+    assert side_effects.enqueued == [(2, "http://x/2.mp3", "ru"), (3, "http://x/3.mp3", "ru")]
+    assert side_effects.events == []
+
+
+def test_pending_batch_is_left_alone(monkeypatch, side_effects):
+    call = _batch_call(1)
+    monkeypatch.setattr(batch_analysis.client.batches, "retrieve", mock.AsyncMock(
+        return_value=SimpleNamespace(status="in_progress")
+    ))
+
+    assert asyncio.run(batch_analysis._poll_batch(FakeSession([call]), "batch_1")) == 0
+    assert call.analysis_batch_id == "batch_1"
+
+
+def test_submit_claims_rows_before_upload_and_releases_on_failure(monkeypatch):
+    calls = [_batch_call(1, analysis_batch_id=None), _batch_call(2, analysis_batch_id=None)]
+    db = FakeSession(calls)
+    commits_at_upload = []
+
+    async def upload(**kwargs):
+        commits_at_upload.append(db.commits)
+        raise RuntimeError("openai down")
+
+    monkeypatch.setattr(batch_analysis, "AsyncSessionLocal", lambda: db)
+    monkeypatch.setattr(batch_analysis.client.files, "create", upload)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batch_analysis.submit_analysis_batch())
+
+    claim = calls[0].analysis_batch_id
+    assert claim.startswith(CLAIM_PREFIX) and calls[1].analysis_batch_id == claim
+    # Захват закоммичен до запроса в OpenAI, после сбоя — снят
+    assert commits_at_upload == [1]
+    assert db.executed == [{"analysis_batch_id": None, "analysis_batch_id_1": claim}]
+
+
+def test_only_stale_claims_are_released():
+    fresh = f"{CLAIM_PREFIX}{int(time.time())}:abc"
+    stale = f"{CLAIM_PREFIX}{int(time.time()) - batch_analysis.CLAIM_TIMEOUT_SECONDS - 1}:def"
+    db = FakeSession()
+
+    asyncio.run(batch_analysis._release_stale_claim(db, fresh))
+    asyncio.run(batch_analysis._release_stale_claim(db, stale))
+
+    assert db.executed == [{"analysis_batch_id": None, "analysis_batch_id_1": stale}]
@@ -0,0 +1,149 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import calls
+from app.core.config import settings
+from tests.fakes import FakeRequest
+
+
+class FakeSession:
+    """
+    Звонки в памяти: SELECT по (order_id, audio_url_md5) ищет среди existing,
+    INSERT ... ON CONFLICT DO NOTHING RETURNING пропускает уже существующие пары.
+    """
+
+    def __init__(self, existing=()):
+        self.rows = [SimpleNamespace(id=i + 100, order_id=o, audio_url=u) for i, (o, u) in enumerate(existing)]
+        self.commits = 0
+
+    def _key(self, order_id, url):
+        return order_id, calls._url_md5(url)
+
+    async def execute(self, stmt, params=None):
+        if params is None:
+            (keys,) = stmt.compile().params.values()
+            return [r for r in self.rows if self._key(r.order_id, r.audio_url) in set(keys)]
+        inserted = []
+        for p in params:
+            if any(self._key(r.order_id, r.audio_url) == (p["order_id"], p["audio_url_md5"]) for r in self.rows):
+                continue
+            row = SimpleNamespace(id=len(self.rows) + 100, order_id=p["order_id"], audio_url=p["audio_url"])
+            self.rows.append(row)
+            inserted.append(row)
+        return inserted
+
+    async def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def enqueued(monkeypatch):
+    """call_id задач process_call, поставленных через Celery group."""
+    ids = []
+
+    def group(signatures):
+        signatures = list(signatures)
+        return SimpleNamespace(apply_async=lambda: ids.extend(s.args[0] for s in signatures))
+
+    monkeypatch.setattr(calls, "group", group)
+    return ids
+
+
+def _call(order_id: str, url: str, **extra) -> dict:
+    return {"order_id": order_id, "call_date": "2026-03-10T12:00:00Z", "audio_url": url, **extra}
+
+
+def test_url_md5_matches_postgres_md5():
+    # SELECT md5('abc'), md5('звонок')
+    assert calls._url_md5("abc") == "900150983cd24fb0d6963f7d28e17f72"
+    assert calls._url_md5("звонок") == "002fbfe5340ab11cd6c22f5a9c5399f9"
+
+
+def test_ndjson_is_read_in_chunks_with_per_line_errors():
+    body = b'{"a": 1}\n\n{broken\n{"a": 2}'
+
+    items = asyncio.run(calls._read_bulk_items(FakeRequest(body, "application/x-ndjson")))
+
+    assert items[0] == {"a": 1} and items[2] == {"a": 2}
+    assert isinstance(items[1], ValueError)
+
+
+def test_json_body_must_be_an_array():
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(calls._read_bulk_items(FakeRequest(b'{"a": 1}')))
+    assert error.value.status_code == 400
+
+
+def test_bulk_dedups_within_request_and_against_db(enqueued):
+    db = FakeSession(existing=[("o2", "http://x/2.mp3")])
+    items = [
+        _call("o1", "http://x/1.mp3"),
+        _call("o1", "http://x/1.mp3"),
+        {"order_id": "o3"},
+        _call("o2", "http://x/2.mp3"),
+        _call("o1", "http://x/1b.mp3", language="ru"),
+    ]
+
+    response = asyncio.run(calls.create_calls_bulk(FakeRequest(json.dumps(items).encode()), db))
+
+    statuses = [r["status"] for r in response["results"]]
+    assert statuses == ["queued", "duplicate", "error", "duplicate", "queued"]
+    assert response["results"][1]["duplicate_of_index"] == 0
+    assert response["results"][3]["call_id"] == 100
+    assert (response["queued"], response["duplicates"], response["errors"]) == (2, 2, 1)
+    assert enqueued == [response["results"][0]["call_id"], response["results"][4]["call_id"]]
+
+
+def test_bulk_rejects_too_many_items(monkeypatch, enqueued):
+    monkeypatch.setattr(settings, "calls_bulk_max_items", 2)
+    body = json.dumps([_call("o", f"http://x/{i}") for i in range(3)]).encode()
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(calls.create_calls_bulk(FakeRequest(body), FakeSession()))
+    assert error.value.status_code == 413
+
+
+def test_single_create_requeues_a_resent_call(monkeypatch):
+    from app import tasks
+
+    inserts, delayed = [], []
+
+    class Session:
+        async def scalar(self, stmt, row):
+            inserts.append(row["audio_url_md5"])
+            # Первая попытка упирается в ux_calls_order_id_audio_url_md5
+            return None if len(inserts) == 1 else 42
+
+        async def commit(self):
+            pass
+
+    monkeypatch.setattr(tasks.process_call, "delay", lambda *args: delayed.append(args))
+    data = calls.CallCreate.model_validate(_call("o1", "http://x/1.mp3"))
+
+    response = asyncio.run(calls.create_call(data, Session()))
+
+    assert response == {"call_id": 42, "status": "queued", "language": "ka"}
+    assert inserts == [calls._url_md5("http://x/1.mp3"), None]
+    assert delayed == [(42, "http://x/1.mp3", "ka")]
+
+
+def test_cursor_round_trip():
+    call_date = datetime(2026, 3, 10, 12, 0, 5, 123456, tzinfo=timezone.utc)
+
+    cursor = calls._encode_cursor(call_date, 42)
+
+    assert "=" not in cursor
+    assert calls._decode_cursor(cursor) == (call_date, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "WzFd", "WyJ4IiwgMV0"])
+def test_broken_cursor_is_a_400(cursor):
+    # "WzFd" — [1], "WyJ4IiwgMV0" — ["x", 1]
+    with pytest.raises(HTTPException) as error:
+        calls._decode_cursor(cursor)
+    assert error.value.status_code == 400
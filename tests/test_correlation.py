@@ -0,0 +1,143 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.models.models import QUESTION_FIELDS
+from app.services import correlation
+from app.services.correlation import ScoreMatrix, compute_correlation
+
+Q = len(QUESTION_FIELDS)
+
+
+def _matrix(seed: int = 0, n: int = 400) -> ScoreMatrix:
+    rng = np.random.default_rng(seed)
+    answered = rng.random((n, Q)) < 0.9
+    yes = answered & (rng.random((n, Q)) < 0.6)
+    approved = (rng.random(n) < 0.5).astype(np.float64)
+    approved[rng.random(n) < 0.1] = np.nan
+    avg_check = np.round(rng.normal(50, 10, n), 2)
+    return ScoreMatrix(
+        yes=yes,
+        answered=answered,
+        operator_id=rng.choice([-1, 3, 7], n),
+        team=rng.choice(np.array(["sales", "retention", None], dtype=object), n),
+        outcomes={"approved": approved, "redeemed": approved.copy(), "avg_check": avg_check},
+    )
+
+
+def _reference(y: np.ndarray, mask: np.ndarray) -> tuple[int, float]:
+    """n и value «в лоб» — по звонкам с метрикой, попавшим в mask."""
+    picked = y[mask & ~np.isnan(y)]
+    return len(picked), picked.mean() if len(picked) else np.nan
+
+
+def test_unpack_bits_per_question():
+    bits = np.array([0b101, 1 << (Q - 1)], dtype=np.int64)
+
+    unpacked = correlation._unpack(bits)
+
+    assert unpacked.shape == (2, Q)
+    assert list(np.flatnonzero(unpacked[0])) == [0, 2]
+    assert list(np.flatnonzero(unpacked[1])) == [Q - 1]
+
+
+def test_wilson_interval():
+    lo, hi = correlation._wilson(np.array([5.0, 0.0]), np.array([10.0, 20.0]))
+
+    assert (lo[0], hi[0]) == (pytest.approx(0.2366, abs=1e-4), pytest.approx(0.7634, abs=1e-4))
+    # Ноль успехов — интервал не вырождается в точку
+    assert lo[1] == pytest.approx(0, abs=1e-12) and hi[1] == pytest.approx(0.1611, abs=1e-4)
+
+
+@pytest.mark.parametrize("metric", ["approved", "avg_check"])
+def test_overall_matches_per_call_reference(metric):
+    matrix = _matrix()
+    y = matrix.outcomes[metric]
+
+    (group,) = compute_correlation(matrix, metric, "overall")["groups"]
+
+    for i, q in enumerate(QUESTION_FIELDS):
+        stats = group["questions"][q]
+        for side, mask in (("yes", matrix.yes[:, i]), ("no", matrix.answered[:, i] & ~matrix.yes[:, i])):
+            n, value = _reference(y, mask)
+            assert stats[side]["n"] == n, (q, side)
+            assert stats[side]["value"] == pytest.approx(value, abs=1e-4), (q, side)
+        assert stats["diff"] == pytest.approx(stats["yes"]["value"] - stats["no"]["value"], abs=1e-3)
+    assert group["calls"] == int((~np.isnan(y)).sum())
+
+
+def test_avg_check_ci_is_normal_interval():
+    matrix = _matrix()
+    y = matrix.outcomes["avg_check"]
+    picked = y[matrix.yes[:, 0]]
+    half = 1.96 * picked.std(ddof=1) / np.sqrt(len(picked))
+
+    stats = compute_correlation(matrix, "avg_check", "overall")["groups"][0]["questions"][QUESTION_FIELDS[0]]
+
+    assert stats["yes"]["ci"] == [
+        pytest.approx(picked.mean() - half, abs=1e-4), pytest.approx(picked.mean() + half, abs=1e-4),
+    ]
+
+
+def test_groups_split_calls_and_keep_missing_keys():
+    matrix = _matrix()
+    y = matrix.outcomes["approved"]
+
+    by_operator = {g["key"]: g for g in compute_correlation(matrix, "approved", "operator")["groups"]}
+    by_team = {g["key"]: g for g in compute_correlation(matrix, "approved", "team")["groups"]}
+
+    assert set(by_operator) == {None, 3, 7}
+    assert set(by_team) == {None, "retention", "sales"}
+    for key, group in by_operator.items():
+        members = matrix.operator_id == (-1 if key is None else key)
+        assert group["calls"] == _reference(y, members)[0]
+        assert group["value"] == pytest.approx(_reference(y, members)[1], abs=1e-4)
+
+
+def test_min_calls_drops_small_groups():
+    matrix = _matrix()
+    sizes = {g["key"]: g["calls"] for g in compute_correlation(matrix, "approved", "operator")["groups"]}
+    threshold = sorted(sizes.values())[1]
+
+    kept = compute_correlation(matrix, "approved", "operator", min_calls=threshold)["groups"]
+
+    assert {g["key"] for g in kept} == {k for k, calls in sizes.items() if calls >= threshold}
+
+
+def test_chunked_matmul_gives_the_same_sums(monkeypatch):
+    matrix = _matrix(seed=1)
+    y = matrix.outcomes["avg_check"]
+    weights = np.column_stack([np.ones(len(y)), y, y ** 2])
+    groups = correlation._groups(matrix, "team")
+    whole = correlation._group_sums(groups, matrix.yes, weights)
+
+    monkeypatch.setattr(correlation, "MATMUL_CHUNK_ROWS", 7)
+
+    np.testing.assert_allclose(correlation._group_sums(groups, matrix.yes, weights), whole)
+
+
+def test_empty_matrix_has_no_groups():
+    empty = ScoreMatrix(
+        yes=np.zeros((0, Q), dtype=bool), answered=np.zeros((0, Q), dtype=bool),
+        operator_id=np.zeros(0, dtype=np.int64), team=np.zeros(0, dtype=object),
+        outcomes={m: np.zeros(0) for m in correlation.METRICS},
+    )
+
+    assert compute_correlation(empty, "approved", "overall") == {
+        "metric": "approved", "group_by": "overall", "calls": 0, "groups": [],
+    }
+
+
+def test_cache_is_keyed_by_outcomes_version(fake_redis):
+    async def scenario():
+        version, _ = await correlation.cached("q")
+        await correlation.store(version, "q", {"v": 1})
+        hit = await correlation.cached("q")
+        await correlation.bump_outcomes_version()
+        return hit, await correlation.cached("q")
+
+    hit, after_bump = asyncio.run(scenario())
+
+    assert hit == ("0", {"v": 1})
+    assert after_bump == ("1", None)
@@ -0,0 +1,91 @@
+import asyncio
+import csv
+import io
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.models.models import QUESTION_FIELDS
+from app.services import export
+from app.services.export import EXPORT_COLUMNS
+
+
+def _row(call_id: int, **values) -> tuple:
+    row = dict.fromkeys(EXPORT_COLUMNS)
+    row.update(
+        call_id=call_id, order_id=f"A{call_id}", operator_id=7, operator_name="Нино",
+        call_date=datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc), duration_sec=95,
+        language="ka", total_score=30, s1_score=3, avg_check=Decimal("12.50"),
+        **{q: True for q in QUESTION_FIELDS},
+    )
+    row.update(values)
+    return tuple(row.values())
+
+
+@pytest.fixture
+def partitions(monkeypatch):
+    """Пачки строк вместо server-side курсора; список пачек заполняет тест."""
+    batches = []
+
+    async def fake_partitions(stmt):
+        for batch in batches:
+            yield batch
+
+    monkeypatch.setattr(export, "_partitions", fake_partitions)
+    return batches
+
+
+def _collect(chunks) -> list[bytes]:
+    async def collect():
+        return [chunk async for chunk in chunks]
+    return asyncio.run(collect())
+
+
+def test_csv_streams_a_chunk_per_batch(partitions):
+    partitions.extend([[_row(1), _row(2)], [_row(3, q1_1=None, approved=False)]])
+
+    chunks = _collect(export.csv_chunks(export.export_query()))
+
+    assert len(chunks) == 3 and chunks[-1] == b""
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert list(rows[0]) == list(EXPORT_COLUMNS)
+    assert [r["call_id"] for r in rows] == ["1", "2", "3"]
+    assert (rows[0]["operator_name"], rows[0]["avg_check"]) == ("Нино", "12.50")
+    assert rows[0]["call_date"] == "2026-03-10 12:00:00+00:00"
+    assert (rows[2]["q1_1"], rows[2]["approved"], rows[2]["redeemed"]) == ("", "False", "")
+
+
+def test_csv_without_rows_is_just_the_header(partitions):
+    chunks = _collect(export.csv_chunks(export.export_query()))
+
+    assert b"".join(chunks).decode() == ",".join(EXPORT_COLUMNS) + "\r\n"
+
+
+def test_parquet_round_trips_with_typed_columns(partitions):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    partitions.extend([[_row(1)], [_row(2, total_score=None)]])
+
+    table = pq.read_table(io.BytesIO(b"".join(_collect(export.parquet_chunks(export.export_query())))))
+
+    assert table.column_names == list(EXPORT_COLUMNS)
+    assert table.schema.field("avg_check").type == pa.decimal128(10, 2)
+    assert table.schema.field("s1_score").type == pa.int16()
+    assert table.column("call_id").to_pylist() == [1, 2]
+    assert table.column("total_score").to_pylist() == [30, None]
+
+
+def test_query_filters_by_period_and_operator():
+    stmt = export.export_query(
+        date_from=datetime(2026, 3, 1, tzinfo=timezone.utc),
+        date_to=datetime(2026, 4, 1, tzinfo=timezone.utc),
+        operator_id=7,
+    )
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+
+    assert "calls.call_date >= %(call_date_1)s" in sql
+    assert "calls.call_date < %(call_date_2)s" in sql
+    assert "calls.operator_id = %(operator_id_1)s" in sql
+    assert sql.endswith("ORDER BY calls.call_date, calls.id")
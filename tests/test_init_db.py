@@ -0,0 +1,134 @@
+import hashlib
+
+import pytest
+
+from scripts import init_db
+
+
+class FakeConnection:
+    """psycopg2-соединение: ledger schema_migrations в dict, выполненные миграции — в executed."""
+
+    def __init__(self, ledger=None):
+        self.ledger = dict(ledger or {})
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, conn: FakeConnection):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        if sql.startswith("SELECT version, checksum"):
+            self.rows = list(self.conn.ledger.items())
+        elif sql.startswith("INSERT INTO schema_migrations"):
+            self.conn.ledger[params[0]] = params[1]
+        elif sql.startswith("UPDATE schema_migrations"):
+            self.conn.ledger[params[1]] = params[0]
+        elif "pg_advisory" not in sql and "CREATE TABLE IF NOT EXISTS schema_migrations" not in sql:
+            self.conn.executed.append(sql)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def migrations(tmp_path, monkeypatch):
+    (tmp_path / "002_second.sql").write_text("SELECT 2;")
+    (tmp_path / "001_init.sql").write_text("SELECT 1;")
+    (tmp_path / "notes.txt").write_text("не миграция")
+    monkeypatch.setattr(init_db, "MIGRATIONS_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """Фабрика FakeConnection, которую получит run()."""
+    def make(ledger=None):
+        conn = FakeConnection(ledger)
+        monkeypatch.setattr(init_db.psycopg2, "connect", lambda url: conn)
+        return conn
+    return make
+
+
+def _sha(sql: str) -> str:
+    return hashlib.sha256(sql.encode()).hexdigest()
+
+
+def test_migrations_are_ordered_with_checksums(migrations):
+    assert init_db._migrations() == [
+        ("001_init.sql", _sha("SELECT 1;"), "SELECT 1;"),
+        ("002_second.sql", _sha("SELECT 2;"), "SELECT 2;"),
+    ]
+
+
+def test_plan_skips_applied_and_keeps_new_pending(migrations):
+    pending, repaired = init_db._plan(init_db._migrations(), {"001_init.sql": _sha("SELECT 1;")})
+
+    assert [version for version, _, _ in pending] == ["002_second.sql"]
+    assert repaired == []
+
+
+def test_plan_rejects_edited_applied_migration(migrations):
+    with pytest.raises(RuntimeError, match="001_init.sql changed"):
+        init_db._plan(init_db._migrations(), {"001_init.sql": "old"})
+
+
+def test_plan_repair_accepts_new_checksum(migrations):
+    pending, repaired = init_db._plan(init_db._migrations(), {"001_init.sql": "old"}, repair=True)
+
+    assert repaired == [("001_init.sql", _sha("SELECT 1;"))]
+    assert [version for version, _, _ in pending] == ["002_second.sql"]
+
+
+def test_run_applies_pending_once(migrations, connect):
+    conn = connect()
+
+    init_db.run()
+    init_db.run()
+
+    assert conn.executed == ["SELECT 1;", "SELECT 2;"]
+    assert conn.ledger == {"001_init.sql": _sha("SELECT 1;"), "002_second.sql": _sha("SELECT 2;")}
+
+
+def test_run_baseline_records_without_executing(migrations, connect):
+    conn = connect()
+
+    init_db.run(baseline=True)
+
+    assert conn.executed == []
+    assert set(conn.ledger) == {"001_init.sql", "002_second.sql"}
+
+
+def test_run_repair_updates_ledger(migrations, connect):
+    conn = connect({"001_init.sql": "old", "002_second.sql": _sha("SELECT 2;")})
+
+    init_db.run(repair=True)
+
+    assert conn.executed == []
+    assert conn.ledger["001_init.sql"] == _sha("SELECT 1;")
+
+
+def test_run_status_changes_nothing(migrations, connect, capsys):
+    conn = connect({"001_init.sql": _sha("SELECT 1;")})
+
+    init_db.run(status=True)
+
+    assert conn.executed == [] and list(conn.ledger) == ["001_init.sql"]
+    assert "pending: 002_second.sql" in capsys.readouterr().out
@@ -0,0 +1,47 @@
+import re
+from pathlib import Path
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models.models import QUESTION_FIELDS, SECTIONS, QuestionnaireResponse
+
+MIGRATIONS = Path(__file__).resolve().parents[1] / "migrations"
+
+
+def _normalized(sql: str) -> str:
+    return re.sub(r"\s+", "", sql)
+
+
+def _generated(migration: str, column: str) -> str:
+    """Выражение GENERATED ALWAYS AS (...) колонки из файла миграции."""
+    sql = (MIGRATIONS / migration).read_text()
+    match = re.search(rf"\b{column}\s+SMALLINT\s+GENERATED ALWAYS AS\s*\((.*?)\)\s*STORED", sql, re.S)
+    assert match, f"{column} not found in {migration}"
+    return _normalized(match.group(1))
+
+
+def _computed(column: str) -> str:
+    return _normalized(str(QuestionnaireResponse.__table__.c[column].computed.sqltext))
+
+
+def test_sections_cover_all_34_questions_once():
+    assert len(QUESTION_FIELDS) == len(set(QUESTION_FIELDS)) == 34
+    assert all(q.startswith(f"q{n}_") for n, fields in SECTIONS.items() for q in fields)
+
+
+def test_orm_total_score_matches_migration():
+    assert _computed("total_score") == _generated("002_fix_total_score.sql", "total_score")
+
+
+def test_orm_section_scores_match_migration():
+    for n in SECTIONS:
+        assert _computed(f"s{n}_score") == _generated("008_section_scores.sql", f"s{n}_score"), n
+
+
+def test_generated_scores_are_not_written_on_insert():
+    stmt = insert(QuestionnaireResponse).values(call_id=1, q1_1=True)
+    columns = str(stmt.compile(dialect=postgresql.dialect())).split("VALUES")[0]
+
+    assert "q1_1" in columns
+    assert "total_score" not in columns and "s1_score" not in columns
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import tasks
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.models import Call
+from app.services import notifications
+from app.services.notifications import CALL_EVENTS_CHANNEL
+
+
+class RecordingClient:
+    def __init__(self):
+        self.requests = []
+
+    async def post(self, url, content, headers):
+        self.requests.append((url, content, headers))
+        return SimpleNamespace(raise_for_status=lambda: None)
+
+
+@pytest.fixture
+def http(monkeypatch):
+    client = RecordingClient()
+    monkeypatch.setattr(notifications, "_get_http_client", lambda: client)
+    return client
+
+
+def _call(**extra) -> Call:
+    return Call(id=7, order_id="A1", processing_status="done", processing_error=None, **extra)
+
+
+def test_call_event_fields():
+    event = notifications.call_event(_call(), total_score=30)
+
+    assert event["event"] == "call.done"
+    assert (event["call_id"], event["order_id"], event["status"]) == (7, "A1", "done")
+    assert (event["total_score"], event["error"]) == (30, None)
+    assert event["timestamp"].endswith("+00:00")
+
+
+def test_sign_payload_is_hmac_of_timestamp_and_body(monkeypatch):
+    monkeypatch.setattr(settings, "webhook_secret", "secret")
+
+    signature = notifications.sign_payload(b'{"a": 1}', 1700000000)
+
+    assert signature == "sha256=942c6f7e34ef5c448cbbbf79276da392036d59f0bd9fb74ba14eb8e83e2bb6cd"
+
+
+def test_webhook_is_signed_over_the_sent_body(monkeypatch, http):
+    monkeypatch.setattr(settings, "webhook_secret", "secret")
+    event = notifications.call_event(_call())
+
+    asyncio.run(notifications.deliver_webhook("http://hook", event))
+
+    ((url, body, headers),) = http.requests
+    assert json.loads(body) == event
+    assert headers["X-Vladtrans-Event"] == "call.done"
+    assert headers["X-Vladtrans-Signature"] == notifications.sign_payload(body, int(headers["X-Vladtrans-Timestamp"]))
+
+
+def test_webhook_without_secret_is_unsigned(monkeypatch, http):
+    monkeypatch.setattr(settings, "webhook_secret", None)
+
+    asyncio.run(notifications.deliver_webhook("http://hook", notifications.call_event(_call())))
+
+    ((_, _, headers),) = http.requests
+    assert "X-Vladtrans-Signature" not in headers
+
+
+def test_publish_goes_to_channel_and_webhook(fake_redis, monkeypatch):
+    delayed = []
+    monkeypatch.setattr(tasks.deliver_webhook, "delay", lambda *args: delayed.append(args))
+
+    async def scenario():
+        pubsub = get_redis().pubsub()
+        await pubsub.subscribe(CALL_EVENTS_CHANNEL)
+        await pubsub.get_message(timeout=1)
+        await notifications.publish_call_event(_call(callback_url="http://hook"), total_score=12)
+        return await pubsub.get_message(timeout=1)
+
+    message = asyncio.run(scenario())
+
+    assert json.loads(message["data"])["total_score"] == 12
+    ((url, event),) = delayed
+    assert (url, event["call_id"]) == ("http://hook", 7)
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from app.models.models import QUESTION_FIELDS
+from app.services import operator_stats
+from app.services.operator_stats import UPSERT_CHUNK_ROWS, apply_questionnaire_changes
+
+CALL_DATE = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeSession:
+    def __init__(self):
+        self.statements = 0
+
+    async def execute(self, stmt):
+        self.statements += 1
+
+
+@pytest.fixture
+def upserted(monkeypatch):
+    """Строки, переданные в INSERT ... ON CONFLICT, по пачкам."""
+    batches = []
+    real_insert = operator_stats.insert
+
+    class RecordingInsert:
+        def __init__(self, model):
+            self.model = model
+
+        def values(self, rows):
+            batches.append(rows)
+            return real_insert(self.model).values(rows)
+
+    monkeypatch.setattr(operator_stats, "insert", RecordingInsert)
+    return batches
+
+
+def _answers(yes: int, unanswered: int = 0) -> dict:
+    """Первые yes вопросов — True, последние unanswered — None, остальные False."""
+    answers = {}
+    for i, q in enumerate(QUESTION_FIELDS):
+        if i < yes:
+            answers[q] = True
+        elif i >= len(QUESTION_FIELDS) - unanswered:
+            answers[q] = None
+        else:
+            answers[q] = False
+    return answers
+
+
+def _apply(changes):
+    db = FakeSession()
+    asyncio.run(apply_questionnaire_changes(db, changes))
+    return db
+
+
+def test_new_questionnaire_adds_a_call(upserted):
+    _apply([(7, CALL_DATE, None, _answers(yes=5, unanswered=2))])
+
+    (row,) = upserted[0]
+    first, last = QUESTION_FIELDS[0], QUESTION_FIELDS[-1]
+    assert (row["operator_id"], row["day"]) == (7, date(2026, 3, 10))
+    assert (row["calls_count"], row["score_sum"]) == (1, 5)
+    assert (row[f"{first}_yes"], row[f"{first}_total"]) == (1, 1)
+    assert (row[f"{last}_yes"], row[f"{last}_total"]) == (0, 0)
+
+
+def test_rewrite_applies_only_the_difference(upserted):
+    _apply([(7, CALL_DATE, _answers(yes=5, unanswered=2), _answers(yes=3))])
+
+    (row,) = upserted[0]
+    third, last = QUESTION_FIELDS[3], QUESTION_FIELDS[-1]
+    assert (row["calls_count"], row["score_sum"]) == (0, -2)
+    assert row[f"{third}_yes"] == -1
+    # Раньше без ответа, теперь False — вопрос начинает учитываться
+    assert (row[f"{last}_yes"], row[f"{last}_total"]) == (0, 1)
+
+
+def test_same_operator_and_utc_day_are_summed(upserted):
+    tz = timezone(timedelta(hours=4))
+    _apply([
+        (7, datetime(2026, 3, 10, 23, 30, tzinfo=tz), None, _answers(yes=2)),
+        (7, CALL_DATE, None, _answers(yes=4)),
+        # 01:00 по Тбилиси — ещё 9 марта по UTC
+        (7, datetime(2026, 3, 10, 1, 0, tzinfo=tz), None, _answers(yes=1)),
+        (None, CALL_DATE, None, _answers(yes=9)),
+    ])
+
+    rows = {row["day"]: row for row in upserted[0]}
+    assert set(rows) == {date(2026, 3, 9), date(2026, 3, 10)}
+    assert (rows[date(2026, 3, 10)]["calls_count"], rows[date(2026, 3, 10)]["score_sum"]) == (2, 6)
+
+
+def test_calls_without_operator_write_nothing(upserted):
+    db = _apply([(None, CALL_DATE, None, _answers(yes=3))])
+
+    assert db.statements == 0 and upserted == []
+
+
+def test_rows_are_chunked_in_lock_order(upserted):
+    changes = [(op, CALL_DATE, None, _answers(yes=1)) for op in reversed(range(UPSERT_CHUNK_ROWS + 5))]
+
+    db = _apply(changes)
+
+    assert db.statements == 2
+    assert [len(batch) for batch in upserted] == [UPSERT_CHUNK_ROWS, 5]
+    operators = [row["operator_id"] for batch in upserted for row in batch]
+    assert operators == sorted(operators)
@@ -0,0 +1,100 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from app.api import outcomes
+from app.core.config import settings
+from tests.fakes import FakeRequest
+
+
+class FakeSession:
+    """execute(upsert) отвечает «вставлено» для новых order_id и «обновлено» для уже виденных."""
+
+    def __init__(self, existing=()):
+        self.seen = set(existing)
+        self.commits = 0
+
+    async def execute(self, batch):
+        inserted = [row["order_id"] not in self.seen for row in batch]
+        self.seen.update(row["order_id"] for row in batch)
+        return SimpleNamespace(scalars=lambda: inserted)
+
+    async def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def upserts(monkeypatch):
+    """Пачки строк upsert'а (вместо SQL-выражения в FakeSession уходят сами строки)."""
+    batches = []
+
+    def statement(rows):
+        batches.append(rows)
+        return rows
+
+    monkeypatch.setattr(outcomes, "_upsert_statement", statement)
+    monkeypatch.setattr(outcomes, "bump_outcomes_version", mock.AsyncMock())
+    return batches
+
+
+def _items(body: bytes, content_type: str, step: int = 5):
+    async def collect():
+        return [item async for item in outcomes._iter_items(FakeRequest(body, content_type, step))]
+    return asyncio.run(collect())
+
+
+def test_csv_quoted_newlines_stay_in_one_record():
+    body = (
+        '﻿order_id, approved ,redeemed,avg_check\r\n'
+        '\r\n'
+        'A1,true,,10.5\r\n'
+        '"A\n2",false,"say ""hi""\n\nthen",3\n'
+        'A3,1,0\n'
+    ).encode()
+
+    items = _items(body, "text/csv")
+
+    assert items == [
+        (0, {"order_id": "A1", "approved": "true", "redeemed": None, "avg_check": "10.5"}),
+        (1, {"order_id": "A\n2", "approved": "false", "redeemed": 'say "hi"\n\nthen', "avg_check": "3"}),
+        (2, {"order_id": "A3", "approved": "1", "redeemed": "0"}),
+    ]
+
+
+def test_csv_unterminated_quote_is_an_item_error():
+    items = _items(b'order_id,approved\nA1,true\n"A2,false\n', "text/csv")
+
+    assert items[0] == (0, {"order_id": "A1", "approved": "true"})
+    assert items[1][0] == 1 and isinstance(items[1][1], ValueError)
+
+
+def test_ndjson_bad_line_is_an_item_error():
+    items = _items(b'{"order_id": "A1"}\nnot json\n{"order_id": "A2"}', "application/x-ndjson")
+
+    assert [i for i, _ in items] == [0, 1, 2]
+    assert isinstance(items[1][1], ValueError)
+
+
+def test_bulk_upsert_batches_and_counts(monkeypatch, upserts):
+    monkeypatch.setattr(settings, "outcomes_bulk_batch_size", 2)
+    body = "\n".join(json.dumps(item) for item in (
+        {"order_id": "A1", "approved": True},
+        {"order_id": "A1", "approved": False},
+        {"order_id": "A2", "avg_check": "12.50"},
+        {"order_id": "A3", "avg_check": "not a number"},
+        {"order_id": "A4"},
+    )).encode()
+    db = FakeSession(existing={"A4"})
+
+    response = asyncio.run(outcomes.upsert_outcomes_bulk(FakeRequest(body, "application/x-ndjson"), db))
+
+    assert (response["inserted"], response["updated"], response["errors"]) == (2, 1, 1)
+    assert response["error_details"][0]["index"] == 3
+    # Повтор order_id в пачке — побеждает последняя строка
+    assert [[row["order_id"] for row in batch] for batch in upserts] == [["A1", "A2"], ["A4"]]
+    assert upserts[0][0]["approved"] is False
+    assert db.commits == 1
+    outcomes.bump_outcomes_version.assert_awaited_once()
@@ -0,0 +1,155 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.services import analyzer, batch_analysis, ratelimit
+from app.services.ratelimit import TOKEN_BUCKET_SCRIPT, AdaptiveConcurrency, TokenBucket, call_limited
+
+
+class RateLimited(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0"})
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """asyncio.sleep в ratelimit не ждёт, а записывает задержку."""
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", sleep)
+    return delays
+
+
+def _take(keys, args):
+    async def run():
+        return int(await TOKEN_BUCKET_SCRIPT(keys=keys, args=args, client=get_redis()))
+    return run()
+
+
+def test_bucket_allows_capacity_then_asks_to_wait(fake_redis):
+    async def scenario():
+        return [await _take(["rpm"], [2, 1]) for _ in range(3)]
+
+    first, second, third = asyncio.run(scenario())
+
+    assert first == second == 0
+    # 2 запроса в минуту — следующий токен через ~30 с
+    assert 29_000 < third <= 30_000
+
+
+def test_bucket_debits_all_buckets_or_none(fake_redis):
+    async def scenario():
+        assert await _take(["rpm", "tpm"], [100, 1, 10, 10]) == 0
+        wait = await _take(["rpm", "tpm"], [100, 1, 10, 10])
+        return wait, float(await get_redis().hget("rpm", "tokens"))
+
+    wait, rpm_tokens = asyncio.run(scenario())
+
+    assert wait > 0
+    assert rpm_tokens == pytest.approx(99, abs=0.1)
+
+
+def test_acquire_sleeps_for_the_reported_wait(monkeypatch, no_sleep):
+    replies = iter([500, 0])
+
+    async def script(keys, args, client):
+        return next(replies)
+
+    monkeypatch.setattr(ratelimit, "TOKEN_BUCKET_SCRIPT", script)
+    monkeypatch.setattr(ratelimit, "get_redis", lambda: None)
+
+    asyncio.run(TokenBucket("groq", rpm=10, tpm=0).acquire())
+
+    assert len(no_sleep) == 1 and 0.5 <= no_sleep[0] <= 0.55
+
+
+def test_acquire_fails_open_without_redis(monkeypatch, no_sleep):
+    async def script(keys, args, client):
+        raise RedisConnectionError("down")
+
+    monkeypatch.setattr(ratelimit, "TOKEN_BUCKET_SCRIPT", script)
+    monkeypatch.setattr(ratelimit, "get_redis", lambda: None)
+
+    asyncio.run(TokenBucket("groq", rpm=10, tpm=0).acquire())
+
+    assert no_sleep == []
+
+
+def test_aimd_halves_on_429_and_grows_after_successes():
+    limiter = AdaptiveConcurrency("groq", maximum=8, minimum=1)
+
+    limiter.on_rate_limited()
+    assert limiter.limit == 4
+    for _ in range(3):
+        limiter.on_rate_limited()
+    assert limiter.limit == 1
+
+    for expected in (2, 3):
+        for _ in range(limiter.limit):
+            limiter.on_success()
+        assert limiter.limit == expected
+
+
+def test_slot_bounds_concurrency():
+    limiter = AdaptiveConcurrency("groq", maximum=2)
+    peak = 0
+
+    async def work():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(work() for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert peak == 2 and limiter.in_flight == 0
+
+
+def test_call_limited_retries_429_and_backs_off(fake_redis, monkeypatch, no_sleep):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return "ok"
+
+    assert asyncio.run(call_limited("groq", request)) == "ok"
+    assert len(attempts) == 3
+    assert ratelimit.get_limiter("groq").concurrency.limit == settings.groq_max_concurrency // 4
+
+
+def test_call_limited_gives_up_after_rate_limit_retries(fake_redis, monkeypatch, no_sleep):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(settings, "rate_limit_retries", 2)
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+
+    async def request():
+        raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        asyncio.run(call_limited("openai", request))
+    assert len(no_sleep) == 2
+
+
+def test_sdk_retries_are_off_under_the_limiter(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    assert ratelimit.sdk_max_retries() == 0
+    monkeypatch.setattr(settings, "rate_limit_enabled", False)
+    assert ratelimit.sdk_max_retries() == 2
+
+    # Клиенты создаются при импорте, лимитер по умолчанию включён
+    assert analyzer.client.max_retries == 0
+    # Files/Batches API идут мимо call_limited — повторы SDK остаются
+    assert batch_analysis.client.max_retries == 2
@@ -0,0 +1,67 @@
+import asyncio
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.services import results_cache
+
+ENTRY = {"body": {"call_id": 1, "total_score": 30}, "headers": {"ETag": '"v1"'}}
+
+
+def test_miss_then_hit(fake_redis):
+    async def scenario():
+        version, entry = await results_cache.get(1)
+        await results_cache.put(version, 1, ENTRY)
+        return (version, entry), await results_cache.get(1)
+
+    miss, hit = asyncio.run(scenario())
+
+    assert miss == ("0", None)
+    assert hit == ("0", ENTRY)
+
+
+def test_put_after_invalidate_does_not_store_stale_entry(fake_redis):
+    async def scenario():
+        version, _ = await results_cache.get(1)
+        # Правка анкеты закоммичена, пока GET читал БД
+        await results_cache.invalidate(1)
+        await results_cache.put(version, 1, ENTRY)
+        return await results_cache.get(1)
+
+    assert asyncio.run(scenario()) == ("1", None)
+
+
+def test_invalidate_drops_entry_and_ttl_guards_version(fake_redis):
+    async def scenario():
+        version, _ = await results_cache.get(1)
+        await results_cache.put(version, 1, ENTRY)
+        await results_cache.invalidate(1, 2)
+        return await results_cache.get(1), await get_redis().ttl(f"{results_cache.VERSION_PREFIX}2")
+
+    (version, entry), ttl = asyncio.run(scenario())
+
+    assert (version, entry) == ("1", None)
+    assert 0 < ttl <= settings.results_cache_ttl
+
+
+def test_stats_count_hits_and_misses(fake_redis):
+    async def scenario():
+        version, _ = await results_cache.get(1)
+        await results_cache.put(version, 1, ENTRY)
+        for _ in range(3):
+            await results_cache.get(1)
+        return await results_cache.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (3, 1, 0.75)
+
+
+def test_disabled_cache_is_bypassed(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "results_cache_enabled", False)
+
+    async def scenario():
+        version, entry = await results_cache.get(1)
+        await results_cache.put(version, 1, ENTRY)
+        return (version, entry), await get_redis().keys("*")
+
+    assert asyncio.run(scenario()) == ((None, None), [])
@@ -0,0 +1,292 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import tasks
+from app.core import metrics
+from app.core.config import settings
+from app.models.models import Call
+
+
+class FakeSession:
+    """Вместо AsyncSession там, где стадии нужен только commit."""
+
+    def __init__(self):
+        self.commits = 0
+
+    async def commit(self):
+        self.commits += 1
+
+
+class Retry(Exception):
+    pass
+
+
+class FakeTask:
+    """bind=True-задача Celery: номер попытки и retry, который возвращает исключение."""
+
+    max_retries = 3
+
+    def __init__(self, retries: int = 0):
+        self.request = SimpleNamespace(retries=retries)
+        self.retried = []
+
+    def retry(self, exc, countdown):
+        self.retried.append(countdown)
+        return Retry(exc)
+
+
+@pytest.fixture
+def stored_call(monkeypatch):
+    """Звонок «в БД» для AsyncSessionLocal из tasks; опубликованные события — в published."""
+    call = Call(id=1, order_id="A1", processing_status="processing", processing_error=None)
+    published = []
+
+    class Session(FakeSession):
+        async def get(self, model, call_id):
+            return call if call_id == call.id else None
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            pass
+
+    async def publish_call_event(call, total_score=None):
+        published.append(call.processing_status)
+
+    monkeypatch.setattr(tasks, "AsyncSessionLocal", Session)
+    monkeypatch.setattr(tasks.notifications, "publish_call_event", publish_call_event)
+    return SimpleNamespace(call=call, published=published)
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """download/hash/normalize без сети и ffmpeg; список вызванных шагов — в calls."""
+    monkeypatch.setattr(settings, "pipeline_work_dir", str(tmp_path / "work"))
+    calls = []
+
+    async def download_audio(url, work_dir):
+        calls.append("download")
+        work_dir.mkdir(parents=True, exist_ok=True)
+        path = work_dir / "source.mp3"
+        path.write_bytes(b"audio")
+        return path
+
+    async def hash_audio(path):
+        return "ab" * 32
+
+    async def cached_transcript(audio_hash, language):
+        return None
+
+    async def normalize_audio(source, work_dir, audio_hash):
+        calls.append("normalize")
+        segments = work_dir / "segments"
+        segments.mkdir(parents=True, exist_ok=True)
+        return segments
+
+    for name, fake in (
+        ("download_audio", download_audio), ("hash_audio", hash_audio),
+        ("cached_transcript", cached_transcript), ("normalize_audio", normalize_audio),
+    ):
+        monkeypatch.setattr(tasks, name, fake)
+    return calls
+
+
+def test_stage_done_follows_stage_order():
+    call = Call(processing_stage="transcribe")
+
+    assert tasks._stage_done(call, "download")
+    assert tasks._stage_done(call, "transcribe")
+    assert not tasks._stage_done(call, "translate")
+    assert not tasks._stage_done(Call(processing_stage=None), "download")
+
+
+def test_prepare_audio_checkpoints_each_stage(pipeline):
+    call, db = Call(id=1), FakeSession()
+
+    assert asyncio.run(tasks._prepare_audio(db, call, "http://x/a.mp3", "ka")) is None
+
+    assert pipeline == ["download", "normalize"]
+    assert call.processing_stage == "normalize"
+    assert call.audio_sha256 == "ab" * 32
+    assert db.commits == 2
+
+
+def test_retry_resumes_after_last_checkpoint(pipeline):
+    call, db = Call(id=1), FakeSession()
+    asyncio.run(tasks._prepare_audio(db, call, "http://x/a.mp3", "ka"))
+    pipeline.clear()
+
+    asyncio.run(tasks._prepare_audio(db, call, "http://x/a.mp3", "ka"))
+
+    assert pipeline == []
+
+
+def test_checkpoint_files_missing_on_this_worker_are_redone(pipeline, tmp_path):
+    call, db = Call(id=1), FakeSession()
+    asyncio.run(tasks._prepare_audio(db, call, "http://x/a.mp3", "ka"))
+    pipeline.clear()
+    (tmp_path / "work" / "1" / "segments").rmdir()
+
+    asyncio.run(tasks._prepare_audio(db, call, "http://x/a.mp3", "ka"))
+
+    assert pipeline == ["normalize"]
+
+
+def test_cached_transcript_skips_normalize(pipeline, monkeypatch):
+    async def cached_transcript(audio_hash, language):
+        return "cached text"
+
+    monkeypatch.setattr(tasks, "cached_transcript", cached_transcript)
+    call = Call(id=1)
+
+    assert asyncio.run(tasks._prepare_audio(FakeSession(), call, "http://x/a.mp3", "ka")) == "cached text"
+    assert pipeline == ["download"]
+    assert call.processing_stage == "download"
+
+
+def _failing_stage(monkeypatch, stage: str = "asr"):
+    async def runner(call_id, audio_path, language):
+        raise RuntimeError("groq down")
+
+    monkeypatch.setitem(tasks._STAGE_RUNNERS, stage, runner)
+
+
+def _errors_finished() -> float:
+    return metrics.CALLS_FINISHED.labels("error")._value.get()
+
+
+def test_intermediate_failure_only_retries(monkeypatch, stored_call):
+    _failing_stage(monkeypatch)
+    task, before = FakeTask(retries=1), _errors_finished()
+
+    with pytest.raises(Retry):
+        tasks._run_stage(task, "asr", 1, "http://x/a.mp3", "ka")
+
+    assert 120 <= task.retried[0] <= 144
+    assert stored_call.call.processing_status == "processing"
+    assert stored_call.published == [] and _errors_finished() == before
+
+
+def test_last_retry_marks_error_once(monkeypatch, stored_call):
+    _failing_stage(monkeypatch)
+    stored_call.call.processing_error = "Transcription failed: groq down"
+    before = _errors_finished()
+
+    for _ in range(2):
+        with pytest.raises(Retry):
+            tasks._run_stage(FakeTask(retries=3), "asr", 1, "http://x/a.mp3", "ka")
+
+    assert stored_call.call.processing_status == "error"
+    # Текст ошибки стадии сохраняется, повторный _give_up ничего не шлёт
+    assert stored_call.call.processing_error == "Transcription failed: groq down"
+    assert stored_call.published == ["error"]
+    assert _errors_finished() == before + 1
+
+
+def test_give_up_without_stage_error_describes_the_failure(stored_call):
+    asyncio.run(tasks._give_up(1, "llm", RuntimeError("boom")))
+
+    assert stored_call.call.processing_error == "Stage 'llm' failed: boom"
+
+
+def test_give_up_leaves_done_calls_alone(stored_call):
+    stored_call.call.processing_status = "done"
+
+    asyncio.run(tasks._give_up(1, "llm", RuntimeError("late")))
+
+    assert stored_call.call.processing_status == "done"
+    assert stored_call.published == []
+
+
+class FakeStageTask:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.delayed = []
+
+    def delay(self, *args):
+        if self.fail:
+            raise ConnectionError("broker down")
+        self.delayed.append(args)
+
+
+def test_every_checkpoint_resumes_somewhere():
+    assert set(tasks._RESUME_FROM) == {None, *tasks.STAGES}
+    assert set(tasks._RESUME_FROM.values()) <= set(tasks._STAGE_TASKS)
+
+
+def test_batch_calls_stop_after_transcription():
+    assert tasks._after_transcribe(Call(id=1, priority="batch", processing_stage="transcribe")) is None
+    # Batch API уже заполнил анкету — сохранить можно обычным путём
+    assert tasks._after_transcribe(Call(id=1, priority="batch", processing_stage="analyze")) == "llm"
+    assert tasks._after_transcribe(Call(id=1, priority="normal", processing_stage="transcribe")) == "llm"
+
+
+def test_stage_enqueues_the_next_one(monkeypatch):
+    async def runner(call_id, audio_path, language):
+        return "llm"
+
+    llm = FakeStageTask()
+    monkeypatch.setitem(tasks._STAGE_RUNNERS, "asr", runner)
+    monkeypatch.setitem(tasks._STAGE_TASKS, "llm", llm)
+
+    tasks._run_stage(FakeTask(), "asr", 1, "http://x/a.mp3", "ka")
+
+    assert llm.delayed == [(1, "http://x/a.mp3", "ka")]
+
+
+def test_failed_enqueue_retries_without_failing_the_call(monkeypatch, stored_call):
+    runs = []
+
+    async def runner(call_id, audio_path, language):
+        runs.append(call_id)
+        return "llm"
+
+    monkeypatch.setitem(tasks._STAGE_RUNNERS, "asr", runner)
+    monkeypatch.setitem(tasks._STAGE_TASKS, "llm", FakeStageTask(fail=True))
+    task = FakeTask(retries=3)
+
+    with pytest.raises(Retry):
+        tasks._run_stage(task, "asr", 1, "http://x/a.mp3", "ka")
+
+    assert runs == [1] and len(task.retried) == 1
+    assert stored_call.call.processing_status == "processing" and stored_call.published == []
+
+
+def test_stalled_calls_are_requeued_from_their_checkpoint(monkeypatch):
+    stalled_at = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+    calls = [
+        Call(id=1, audio_url="http://x/1.mp3", language="ka", processing_stage=None, stage_updated_at=stalled_at),
+        Call(id=2, audio_url="http://x/2.mp3", language="ka", processing_stage="normalize", stage_updated_at=stalled_at),
+        Call(id=3, audio_url="http://x/3.mp3", language="ru", processing_stage="translate", stage_updated_at=stalled_at),
+    ]
+    statements = []
+
+    class Session(FakeSession):
+        async def scalars(self, stmt):
+            statements.append(stmt)
+            return SimpleNamespace(all=lambda: calls)
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            pass
+
+    stage_tasks = {"audio": FakeStageTask(), "asr": FakeStageTask(), "llm": FakeStageTask(fail=True)}
+    monkeypatch.setattr(tasks, "AsyncSessionLocal", Session)
+    monkeypatch.setattr(tasks, "_STAGE_TASKS", stage_tasks)
+
+    assert asyncio.run(tasks._requeue_stalled_calls()) == 2
+
+    assert stage_tasks["audio"].delayed == [(1, "http://x/1.mp3", "ka")]
+    assert stage_tasks["asr"].delayed == [(2, "http://x/2.mp3", "ka")]
+    # Не удалось поставить — останется застрявшим и попадёт в следующую проверку
+    assert calls[2].stage_updated_at == stalled_at
+    assert calls[0].stage_updated_at != stalled_at
+    sql = str(statements[0].compile(dialect=postgresql.dialect()))
+    assert "FOR UPDATE SKIP LOCKED" in sql and "calls.stage_updated_at <" in sql
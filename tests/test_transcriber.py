@@ -0,0 +1,165 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+from app.core.config import Settings, settings
+from app.services import audio_cache, transcriber
+from app.services.transcriber import GROQ_CONTEXT_PROMPT, _transcribe_groq_chunks
+
+
+class FakeGroq:
+    """
+    Вместо AsyncGroq: текст чанка — по его содержимому (b"chunk-N"), с пометкой,
+    если в prompt был контекст предыдущего чанка. Ранние чанки отвечают дольше,
+    чтобы параллельные запросы завершались не по порядку.
+    """
+
+    def __init__(self, chunks: int):
+        self.chunks = chunks
+        self.prompts: list[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self.create))
+
+    async def create(self, *, model, file, language, response_format, prompt):
+        index = int(file[1].decode().split("-")[1])
+        self.prompts.append(prompt)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.005 * (self.chunks - index))
+        self.in_flight -= 1
+        return f"text-{index}" + ("+ctx" if prompt != GROQ_CONTEXT_PROMPT else "")
+
+
+def _chunks(tmp_path, count: int):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"chunk_{i:03d}.mp3"
+        path.write_bytes(f"chunk-{i}".encode())
+        paths.append(path)
+    return paths
+
+
+def _mode(monkeypatch, context: str, concurrency: int):
+    monkeypatch.setattr(settings, "groq_chunk_context", context)
+    monkeypatch.setattr(settings, "groq_chunk_concurrency", concurrency)
+
+
+def test_chain_is_sequential_with_previous_tail(tmp_path, monkeypatch):
+    _mode(monkeypatch, "chain", 4)
+    client = FakeGroq(3)
+
+    result = asyncio.run(_transcribe_groq_chunks(client, _chunks(tmp_path, 3), "ka"))
+
+    assert result == ["text-0", "text-1+ctx", "text-2+ctx"]
+    assert client.max_in_flight == 1
+    assert client.prompts[0] == GROQ_CONTEXT_PROMPT
+    assert client.prompts[2].endswith("text-1+ctx")
+
+
+def test_single_worker_falls_back_to_chain(tmp_path, monkeypatch):
+    _mode(monkeypatch, "none", 1)
+    client = FakeGroq(3)
+
+    result = asyncio.run(_transcribe_groq_chunks(client, _chunks(tmp_path, 3), "ka"))
+
+    assert result == ["text-0", "text-1+ctx", "text-2+ctx"]
+    assert client.max_in_flight == 1
+
+
+def test_parallel_keeps_chunk_order_and_bound(tmp_path, monkeypatch):
+    _mode(monkeypatch, "none", 3)
+    client = FakeGroq(6)
+
+    result = asyncio.run(_transcribe_groq_chunks(client, _chunks(tmp_path, 6), "ka"))
+
+    assert result == [f"text-{i}" for i in range(6)]
+    assert 1 < client.max_in_flight <= 3
+    assert set(client.prompts) == {GROQ_CONTEXT_PROMPT}
+
+
+def test_two_pass_reruns_chunks_with_first_pass_context(tmp_path, monkeypatch):
+    _mode(monkeypatch, "two_pass", 4)
+    client = FakeGroq(4)
+
+    result = asyncio.run(_transcribe_groq_chunks(client, _chunks(tmp_path, 4), "ka"))
+
+    assert result == ["text-0", "text-1+ctx", "text-2+ctx", "text-3+ctx"]
+    assert len(client.prompts) == 4 + 3
+    # Контекст второго прохода — текст первого прохода предыдущего чанка
+    assert sorted(p.removeprefix(GROQ_CONTEXT_PROMPT).strip() for p in client.prompts[4:]) == [
+        "text-0", "text-1", "text-2",
+    ]
+
+
+def test_unknown_chunk_context_is_rejected():
+    with pytest.raises(ValidationError):
+        Settings(groq_chunk_context="parallel")
+
+
+def test_transcribe_segments_joins_chunks_in_order(tmp_path, monkeypatch):
+    _mode(monkeypatch, "none", 4)
+    client = FakeGroq(3)
+    _chunks(tmp_path, 3)
+    monkeypatch.setattr(transcriber, "_get_groq_client", lambda: client)
+
+    assert asyncio.run(transcriber.transcribe_segments(tmp_path, "ka")) == "text-0 text-1 text-2"
+
+
+def test_sdk_clients_are_reused_per_event_loop():
+    async def clients():
+        return transcriber._get_groq_client(), transcriber._get_openai_client()
+
+    async def twice():
+        return await clients(), await clients()
+
+    first, again = asyncio.run(twice())
+    other = asyncio.run(clients())
+
+    assert first[0] is again[0] and first[1] is again[1]
+    assert other[0] is not first[0] and other[1] is not first[1]
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    """_run_ffmpeg без ffmpeg: пишет три чанка по шаблону выхода и запоминает аргументы."""
+    runs = []
+
+    async def run_ffmpeg(*args):
+        runs.append(args)
+        pattern = args[-1]
+        for i in range(3):
+            Path(pattern % i).write_bytes(b"x" * 100)
+
+    monkeypatch.setattr(transcriber, "_run_ffmpeg", run_ffmpeg)
+    return runs
+
+
+def test_normalize_is_one_ffmpeg_pass_into_segments(tmp_path, monkeypatch, ffmpeg):
+    monkeypatch.setattr(settings, "audio_cache_enabled", False)
+    source = tmp_path / "source.mp3"
+
+    out_dir = asyncio.run(transcriber.normalize_audio(source, tmp_path))
+
+    assert out_dir == tmp_path / "segments"
+    assert sorted(p.name for p in out_dir.iterdir()) == ["chunk_000.mp3", "chunk_001.mp3", "chunk_002.mp3"]
+    (args,) = ffmpeg
+    assert args[args.index("-i") + 1] == str(source)
+    assert args[args.index("-f") + 1] == "segment"
+    assert args[args.index("-segment_time") + 1] == str(transcriber.SEGMENT_SECONDS)
+    assert "silenceremove" in args[args.index("-af") + 1]
+
+
+def test_normalize_reuses_cached_segments(tmp_path, monkeypatch, ffmpeg):
+    monkeypatch.setattr(settings, "audio_cache_enabled", True)
+    monkeypatch.setattr(settings, "audio_cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(audio_cache, "_cache", None)
+
+    first = asyncio.run(transcriber.normalize_audio(tmp_path / "a.mp3", tmp_path / "call1", "ab" * 32))
+    second = asyncio.run(transcriber.normalize_audio(tmp_path / "a.mp3", tmp_path / "call2", "ab" * 32))
+
+    assert len(ffmpeg) == 1
+    assert sorted(p.name for p in second.iterdir()) == sorted(p.name for p in first.iterdir())
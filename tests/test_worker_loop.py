@@ -0,0 +1,38 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.celery_app import get_worker_loop, run_in_worker_loop
+
+
+async def _current_loop():
+    return asyncio.get_running_loop()
+
+
+def test_one_loop_for_all_task_threads():
+    with ThreadPoolExecutor(4) as pool:
+        loops = set(pool.map(lambda _: run_in_worker_loop(_current_loop()), range(8)))
+
+    assert loops == {get_worker_loop()}
+
+
+def test_task_threads_share_the_loop_concurrently():
+    async def wait():
+        await asyncio.sleep(0.2)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(5) as pool:
+        list(pool.map(lambda _: run_in_worker_loop(wait()), range(5)))
+
+    # Пять задач ждут в одном loop одновременно, а не по очереди
+    assert time.perf_counter() - started < 0.6
+
+
+def test_exception_reaches_the_task_thread():
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        run_in_worker_loop(fail())